@@ -0,0 +1,318 @@
+import json
+import os
+import selectors
+import socket
+import struct
+import time
+
+import numpy as np
+
+# requests, each a type byte and a fixed-size body
+HELLO = b"H"  # -> action names as a length-prefixed JSON list
+ACT = b"A"  # state -> action index, one byte
+LEARN = b"T"  # transition, no reply
+SAVE = b"S"  # save the Q-table -> one byte
+STATE = struct.Struct("<4i")
+TRANSITION = struct.Struct("<4iBd4i?")  # state, action index, reward, next state, done
+BODY = {HELLO: 0, ACT: STATE.size, LEARN: TRANSITION.size, SAVE: 0}
+LENGTH = struct.Struct("<I")
+
+
+class AgentServer(object):
+    """
+    Serves one QLearningAgent to many game processes over a Unix socket.
+    The server is a single thread around a selector: every pass it reads
+    what all clients sent, learns the transitions in one remember_batch()
+    call, answers all waiting action requests in one batch and writes the
+    replies. The more games are connected, the more requests share a pass.
+
+    Epsilon decays once per received transition, as in AsyncAgent.
+    :param agent: QLearningAgent to serve.
+    :param path: Path of the Unix socket.
+    :param learn: Learn from the transitions clients send, False to only answer.
+    :param min_batch: Smaller batches go through the agent one by one, which costs less than NumPy's setup.
+    """
+    def __init__(self, agent, path="agent.sock", learn=True, min_batch=16):
+        self.agent = agent
+        self.path = path
+        self.learn = learn
+        self.min_batch = min_batch
+        self.selector = selectors.DefaultSelector()
+        self.buffers = {}  # socket -> bytes received but not parsed yet
+        self.listener = None
+        self.running = False
+        self.requests = 0  # action requests answered
+        self.passes = 0  # passes that answered at least one request
+        self.transitions = 0
+        self.clients = 0
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)  # left by a server that did not stop cleanly
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen(64)
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.running = True
+
+    def stop(self):
+        self.running = False
+        for key in list(self.selector.get_map().values()):
+            self.selector.unregister(key.fileobj)
+            key.fileobj.close()
+        self.buffers = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def serve(self, seconds=None, report_seconds=None):
+        """
+        Serve until stop() or until `seconds` have passed.
+        :param report_seconds: Print stats() this often, None never.
+        """
+        if not self.running:
+            self.start()
+        end = None if seconds is None else time.monotonic() + seconds
+        next_report = None if report_seconds is None else time.monotonic() + report_seconds
+        while self.running and (end is None or time.monotonic() < end):
+            self.poll(0.1)
+            if next_report is not None and time.monotonic() >= next_report:
+                print(self.stats())
+                next_report = time.monotonic() + report_seconds
+
+    def poll(self, timeout=0):
+        """
+        One pass: read from every ready client, learn, answer.
+        :return: Number of action requests answered.
+        """
+        acts, transitions, saves, hellos = [], [], [], []
+        for key, _ in self.selector.select(timeout):
+            if key.fileobj is self.listener:
+                self._accept()
+                continue
+            sock = key.fileobj
+            try:
+                data = sock.recv(1 << 16)
+            except OSError:
+                data = b""
+            if not data:
+                self._drop(sock)
+                continue
+            buffer = self.buffers[sock] + data
+            offset = 0
+            while offset < len(buffer):
+                kind = buffer[offset:offset + 1]
+                if kind not in BODY:
+                    print(f"Dropping a client that sent an unknown request {kind!r}.")
+                    self._drop(sock)
+                    break
+                end = offset + 1 + BODY[kind]
+                if end > len(buffer):
+                    break
+                body = buffer[offset + 1:end]
+                if kind == ACT:
+                    acts.append((sock, STATE.unpack(body)))
+                elif kind == LEARN:
+                    transitions.append(TRANSITION.unpack(body))
+                elif kind == SAVE:
+                    saves.append(sock)
+                else:
+                    hellos.append(sock)
+                offset = end
+            if sock in self.buffers:
+                self.buffers[sock] = buffer[offset:]
+
+        replies = {}  # socket -> reply bytes, in request order
+        for sock in hellos:
+            names = json.dumps(self.agent.actions).encode()
+            replies[sock] = replies.get(sock, b"") + LENGTH.pack(len(names)) + names
+        if transitions and self.learn:
+            self._learn(transitions)
+        if len(acts) >= self.min_batch:
+            actions = self.choose_actions(np.array([state for _, state in acts], np.int64)).tolist()
+        else:
+            actions = [self.agent.action_index[self.agent.choose_action(state)] for _, state in acts]
+        if acts:
+            for (sock, _), action in zip(acts, actions):
+                replies[sock] = replies.get(sock, b"") + bytes((action,))
+            self.requests += len(acts)
+            self.passes += 1
+        if saves:
+            if self.learn:
+                self.agent.save_q_table()
+            for sock in saves:
+                replies[sock] = replies.get(sock, b"") + b"\x01"
+
+        for sock, reply in replies.items():
+            if sock not in self.buffers:
+                continue  # dropped in this pass, after some of its requests were read
+            try:
+                sock.sendall(reply)
+            except OSError:
+                self._drop(sock)
+        return len(acts)
+
+    def _accept(self):
+        sock, _ = self.listener.accept()
+        sock.setblocking(True)  # replies are a few bytes, sendall does not wait in practice
+        self.selector.register(sock, selectors.EVENT_READ)
+        self.buffers[sock] = b""
+        self.clients += 1
+
+    def _drop(self, sock):
+        if sock in self.buffers:
+            self.selector.unregister(sock)
+            del self.buffers[sock]
+            sock.close()
+
+    def _learn(self, transitions):
+        if len(transitions) < self.min_batch:
+            for t in transitions:
+                self.agent.remember(t[:4], self.agent.actions[t[4]], t[5], t[6:10], t[10])
+                self.agent.update_epsilon()
+            self.transitions += len(transitions)
+            return
+        items = np.array([t[:5] + t[6:10] for t in transitions], np.int64)  # without reward and done
+        rewards = np.array([t[5] for t in transitions])
+        dones = np.array([t[10] for t in transitions], bool)
+        self.agent.remember_batch(items[:, :4], items[:, 4], rewards, items[:, 5:], dones)
+        for _ in transitions:
+            self.agent.update_epsilon()
+        self.transitions += len(transitions)
+
+    def choose_actions(self, states):
+        """
+        choose_action() for an (n, 4) array of states.
+        :return: Array of action indices.
+        """
+        agent = self.agent
+        n = len(states)
+        if agent.backend == "array":
+            rows = agent.q_table.find_rows(states)
+            if agent.tracker is not None:
+                for state in map(tuple, states.tolist()):
+                    agent.tracker.lookup(state)
+            best = np.argmax(agent.q_table.values[np.maximum(rows, 0)], axis=1)
+            explore = (np.random.rand(n) < agent.epsilon) | (rows < 0)
+            return np.where(explore, np.random.randint(0, len(agent.actions), n), best)
+
+        q_table = agent.q_table
+        actions = np.empty(n, np.int64)
+        for i, state in enumerate(map(tuple, states.tolist())):
+            q = q_table.get(state)
+            if agent.tracker is not None:
+                agent.tracker.lookup(state)
+            if q is None or np.random.rand() < agent.epsilon:
+                actions[i] = np.random.randint(len(agent.actions))
+            else:
+                actions[i] = agent.action_index[max(q, key=q.get)]
+        return actions
+
+    def stats(self):
+        return {
+            "clients": len(self.buffers),
+            "connected": self.clients,
+            "requests": self.requests,
+            "batch": self.requests / self.passes if self.passes else 0.0,  # mean requests per pass
+            "transitions": self.transitions,
+            "epsilon": self.agent.epsilon,
+            "states": len(self.agent.q_table),
+        }
+
+
+class AgentClient(object):
+    """
+    Client side of AgentServer, with the agent methods Player and Manager
+    call. Transitions are buffered and go out with the next action request,
+    so a tick costs one send and one receive.
+    :param path: Path of the server's Unix socket.
+    """
+    def __init__(self, path="agent.sock"):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.pending = bytearray()  # transitions not sent yet
+        self.requests = 0
+        self.wait_seconds = 0.0  # time spent waiting for actions
+        self.sock.sendall(HELLO)
+        size = LENGTH.unpack(self._read(LENGTH.size))[0]
+        self.actions = json.loads(self._read(size))
+        self.action_index = {a: i for i, a in enumerate(self.actions)}
+
+    def _read(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError(f"agent server at {self.path} closed the connection")
+            data += chunk
+        return data
+
+    def choose_action(self, state):
+        start = time.perf_counter()
+        self.pending += ACT + STATE.pack(*state)
+        self.sock.sendall(self.pending)
+        self.pending = bytearray()
+        action = self._read(1)[0]
+        self.wait_seconds += time.perf_counter() - start
+        self.requests += 1
+        return self.actions[action]
+
+    def remember(self, state, action, reward, next_state, done=False):
+        self.pending += LEARN + TRANSITION.pack(*state, self.action_index[action], reward, *next_state, done)
+
+    def flush(self):
+        if self.pending:
+            self.sock.sendall(self.pending)
+            self.pending = bytearray()
+
+    def update_epsilon(self):
+        # decayed by the server, once per transition
+        pass
+
+    def load_q_table(self):
+        # the server loaded it
+        pass
+
+    def save_q_table(self):
+        self.pending += SAVE
+        self.flush()
+        self._read(1)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "wait_us": 1e6 * self.wait_seconds / self.requests if self.requests else 0.0,
+        }
+
+    def close(self):
+        self.flush()
+        self.sock.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the Q-table to games started with Manager(agent_server=...).")
+    parser.add_argument("--socket", default="agent.sock")
+    parser.add_argument("--q-table", default="q_table.pkl")
+    parser.add_argument("--backend", default="array", choices=["dict", "array"])
+    parser.add_argument("--epsilon", type=float, default=0.1)
+    parser.add_argument("--frozen", action="store_true", help="greedy and without learning")
+    parser.add_argument("--report-seconds", type=float, default=10.0, help="print stats this often")
+    args = parser.parse_args()
+
+    from play import QLearningAgent
+    agent = QLearningAgent(["UP", "DOWN", "LEFT", "RIGHT", "AVOID"], epsilon=0 if args.frozen else args.epsilon,
+                           q_table_file=args.q_table, backend=args.backend)
+    server = AgentServer(agent, args.socket, learn=not args.frozen)
+    print(f"Serving {args.q_table} on {args.socket}.")
+    try:
+        server.serve(report_seconds=args.report_seconds)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        if server.learn:
+            agent.save_q_table()
+        print(server.stats())
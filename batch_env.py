@@ -0,0 +1,370 @@
+import numpy as np
+
+
+class BatchEnv(object):
+    """
+    N independent copies of the training game stepped together. Every
+    entity kind lives in struct-of-arrays NumPy buffers with a fixed number
+    of slots per game and an alive flag, so one call to step() advances all
+    games and resolves their collisions without touching a sprite.
+
+    The rules follow Manager.train in headless mode: enemies spawn every
+    1000 ms at random.randrange(1, 480, 50), players and enemies fire on the
+    same cooldowns, and rewards use the same terms and weights. States use
+    the QLearningAgent.get_state encoding. Hits are pixel-accurate like the
+    sprite game's: pairs whose rects overlap are looked up in a table of
+    mask overlaps by offset, built once per pair of images.
+    :param n: Number of parallel games.
+    :param actions: Action names, step() takes indices into this list.
+    :param seed: Seed for spawn positions.
+    :param max_steps: Steps after which a game is ended and reset, None for no limit.
+    :param tick_ms: Simulated milliseconds per step.
+    :param rewards: Reward weights with the keys of Manager.default_rewards, None for those defaults.
+    """
+    width, height = 480, 700
+    player_w, player_h = 102, 126
+    enemy_w, enemy_h = 57, 43  # enemy1.png
+    bullet_w, bullet_h = 5, 11  # bullet1.png and bullet2.png
+
+    player_speed = 5
+    player_bullet_speed = 5
+    enemy_speed_x, enemy_speed_y = 3, 2
+    enemy_bullet_speed = 3  # EnemyBullet moves 2.5, which pygame.Rect rounds up to 3
+    shoot_cooldown = 100
+    enemy_shoot_cooldown = 500
+    spawn_interval = 1000
+    overlaps = {}  # (image, image) -> mask overlap by offset, shared by every BatchEnv
+
+    def __init__(self, n, actions=("UP", "DOWN", "LEFT", "RIGHT", "AVOID"), seed=None, max_steps=None,
+                 tick_ms=10, max_enemies=16, max_bullets=32, max_enemy_bullets=128, rewards=None):
+        if rewards is None:
+            from play import Manager
+            rewards = Manager.default_rewards
+        self.n = n
+        self.actions = list(actions)
+        self.rewards = dict(rewards)
+        self.player_shot = self._overlaps("./images/me1.png", "./images/bullet2.png")
+        self.enemy_shot = self._overlaps("./images/bullet1.png", "./images/enemy1.png")
+        self.max_steps = max_steps
+        self.tick_ms = tick_ms
+        self.rng = np.random.default_rng(seed)
+
+        # players, one per game
+        self.px = np.zeros(n, np.int32)
+        self.py = np.zeros(n, np.int32)
+        self.p_last_shot = np.zeros(n, np.int64)
+
+        # enemies
+        self.ex = np.zeros((n, max_enemies), np.int32)
+        self.ey = np.zeros((n, max_enemies), np.int32)
+        self.evx = np.zeros((n, max_enemies), np.int32)
+        self.e_last_shot = np.zeros((n, max_enemies), np.int64)
+        self.e_alive = np.zeros((n, max_enemies), bool)
+
+        # player bullets
+        self.bx = np.zeros((n, max_bullets), np.int32)
+        self.by = np.zeros((n, max_bullets), np.int32)
+        self.b_alive = np.zeros((n, max_bullets), bool)
+
+        # enemy bullets
+        self.ebx = np.zeros((n, max_enemy_bullets), np.int32)
+        self.eby = np.zeros((n, max_enemy_bullets), np.int32)
+        self.eb_alive = np.zeros((n, max_enemy_bullets), bool)
+
+        # per game bookkeeping
+        self.time = np.zeros(n, np.int64)  # simulated ms
+        self.next_spawn = np.zeros(n, np.int64)
+        self.steps = np.zeros(n, np.int64)
+        self.score = np.zeros(n, np.int64)
+        self.final_score = np.zeros(n, np.int64)  # score of the last finished episode
+        self.final_states = np.zeros((n, 4), np.int32)  # state each game ended in on the last step() that ended it
+        self.episodes = 0  # finished episodes over all games
+
+        self.reset()
+
+    def reset(self, rows=None):
+        if rows is None:
+            rows = np.arange(self.n)
+        self.px[rows] = 240 - 51
+        self.py[rows] = 550
+        self.p_last_shot[rows] = 0
+        self.e_alive[rows] = False
+        self.b_alive[rows] = False
+        self.eb_alive[rows] = False
+        self.time[rows] = 0
+        self.next_spawn[rows] = self.spawn_interval
+        self.steps[rows] = 0
+        self.score[rows] = 0
+        return self.states()
+
+    @classmethod
+    def _overlaps(cls, path, other_path):
+        """
+        Whether the masks of two images overlap, for every offset of the
+        second from the first at which their rects overlap.
+        :return: Bool array indexed by (dx + other width - 1, dy + other height - 1).
+        """
+        table = cls.overlaps.get((path, other_path))
+        if table is None:
+            from play import Assets
+            mask, other = Assets.mask(path), Assets.mask(other_path)
+            (w, h), (ow, oh) = mask.get_size(), other.get_size()
+            table = np.array([[mask.overlap(other, (dx, dy)) is not None for dy in range(1 - oh, h)]
+                              for dx in range(1 - ow, w)])
+            cls.overlaps[(path, other_path)] = table
+        return table
+
+    @staticmethod
+    def _pixels(table, dx, dy, other_w, other_h):
+        # mask overlap at offsets (dx, dy) at which the rects overlap
+        return table[dx + other_w - 1, dy + other_h - 1]
+
+    @staticmethod
+    def _free_slots(alive, rows):
+        # first free slot of each row, rows without one are dropped
+        slots = np.argmin(alive[rows], axis=1)
+        free = ~alive[rows, slots]
+        return rows[free], slots[free]
+
+    def _closest(self, key, alive):
+        # index of the alive entity with the smallest key per game
+        key = np.where(alive, key, np.iinfo(np.int32).max)
+        return np.argmin(key, axis=1), alive.any(axis=1)
+
+    def _closest_bullet(self):
+        return self._closest(np.abs(self.eby - self.py[:, None]), self.eb_alive)
+
+    def _closest_enemy(self, key):
+        return self._closest(np.abs(key - self.py[:, None]), self.e_alive)
+
+    def states(self):
+        """
+        Current state of every game as an (n, 4) int array of
+        (distance_bullet_x, distance_bullet_y, distance_enemy_x, distance_enemy_y).
+        """
+        rows = np.arange(self.n)
+        states = np.zeros((self.n, 4), np.int32)
+
+        b, has_b = self._closest_bullet()
+        states[:, 0] = np.abs(self.px - self.ebx[rows, b]) // 10
+        states[:, 1] = np.abs(self.py - self.eby[rows, b]) // 10
+        states[~has_b, :2] = 0
+
+        e, has_e = self._closest_enemy(self.ey)
+        states[:, 2] = np.abs(self.px - self.ex[rows, e]) // 10
+        states[:, 3] = np.abs(self.py - self.ey[rows, e]) // 10
+        states[~has_e, 2:] = 0
+        return states
+
+    def state_tuples(self, states=None):
+        # the hashable form QLearningAgent uses as Q-table key
+        if states is None:
+            states = self.states()
+        return [tuple(s) for s in states.tolist()]
+
+    def _rewards(self):
+        rows = np.arange(self.n)
+        reward = np.zeros(self.n)
+        done = np.zeros(self.n, bool)
+        weights = self.rewards
+        safe_distance = weights["safe_distance"]
+
+        # keep away from the closest enemy bullet
+        b, has_b = self._closest_bullet()
+        near = (np.abs(self.px - self.ebx[rows, b]) < safe_distance) & \
+               (np.abs(self.py - self.eby[rows, b]) < safe_distance)
+        reward += np.where(has_b, np.where(near, weights["bullet_close"], weights["bullet_safe"]), 0)
+
+        # player bullets against enemies, every pair scores like groupcollide
+        hit = self.b_alive[:, :, None] & self.e_alive[:, None, :] & \
+              (self.bx[:, :, None] < self.ex[:, None, :] + self.enemy_w) & \
+              (self.ex[:, None, :] < self.bx[:, :, None] + self.bullet_w) & \
+              (self.by[:, :, None] < self.ey[:, None, :] + self.enemy_h) & \
+              (self.ey[:, None, :] < self.by[:, :, None] + self.bullet_h)
+        # few pairs pass the rect test, only those are looked up
+        games, bullets, enemies = np.unravel_index(np.flatnonzero(hit), hit.shape)
+        if games.size:
+            miss = ~self._pixels(self.enemy_shot, self.ex[games, enemies] - self.bx[games, bullets],
+                                 self.ey[games, enemies] - self.by[games, bullets], self.enemy_w, self.enemy_h)
+            hit[games[miss], bullets[miss], enemies[miss]] = False
+        pairs = hit.sum(axis=(1, 2))
+        reward += np.where(pairs > 0, weights["hit"], 0) + weights["kill"] * pairs
+        self.score += 10 * pairs
+        self.b_alive &= ~hit.any(axis=2)
+        self.e_alive &= ~hit.any(axis=1)
+
+        # stay level with the closest enemy
+        e, has_e = self._closest_enemy(self.ey)
+        level = np.abs(self.py - self.ey[rows, e]) < safe_distance
+        reward += np.where(has_e, np.where(level, weights["enemy_close"], weights["enemy_far"]), 0)
+
+        # enemy bullets against the player
+        exposed = (self.py > 5) & (self.py + self.player_h < 695)
+        shot = self.eb_alive & exposed[:, None] & \
+               (self.ebx < self.px[:, None] + self.player_w) & \
+               (self.px[:, None] < self.ebx + self.bullet_w) & \
+               (self.eby < self.py[:, None] + self.player_h) & \
+               (self.py[:, None] < self.eby + self.bullet_h)
+        games, bullets = np.unravel_index(np.flatnonzero(shot), shot.shape)
+        if games.size:
+            miss = ~self._pixels(self.player_shot, self.ebx[games, bullets] - self.px[games],
+                                 self.eby[games, bullets] - self.py[games], self.bullet_w, self.bullet_h)
+            shot[games[miss], bullets[miss]] = False
+        self.eb_alive &= ~shot
+        dead = shot.any(axis=1)
+        reward += np.where(dead, weights["crash"], 0)
+        done |= dead
+        return reward, done
+
+    def _move_players(self, actions):
+        rows = np.arange(self.n)
+        speed = self.player_speed
+        names = np.asarray(self.actions)[actions]
+
+        self.py -= np.where(names == "UP", speed, 0).astype(np.int32)
+        self.py += np.where(names == "DOWN", speed, 0).astype(np.int32)
+        self.px -= np.where(names == "LEFT", speed, 0).astype(np.int32)
+        self.px += np.where(names == "RIGHT", speed, 0).astype(np.int32)
+
+        # step away from the closest bullet on both axes
+        b, has_b = self._closest_bullet()
+        avoid = (names == "AVOID") & has_b
+        bx, by = self.ebx[rows, b], self.eby[rows, b]
+        self.px += np.where(avoid, np.where(self.px < bx, -speed, speed), 0).astype(np.int32)
+        self.py += np.where(avoid, np.where(self.py < by, -speed, speed), 0).astype(np.int32)
+
+        # line up with the enemy whose bottom is closest to the player top
+        e, has_e = self._closest_enemy(self.ey + self.enemy_h)
+        chase = (names == "CHASE") & has_e
+        dx = self.ex[rows, e] - self.px
+        step = np.where(np.abs(dx) <= speed, dx, np.sign(dx) * speed)
+        self.px += np.where(chase, step, 0).astype(np.int32)
+
+        np.clip(self.px, 0, self.width - self.player_w, out=self.px)
+        np.clip(self.py, 0, self.height - self.player_h, out=self.py)
+
+    def _spawn_enemies(self):
+        due = np.flatnonzero(self.time >= self.next_spawn)
+        if due.size == 0:
+            return
+        self.next_spawn[due] += self.spawn_interval
+        x = self.rng.integers(0, len(range(1, self.width, 50)), size=due.size) * 50 + 1
+        rows, slots = self._free_slots(self.e_alive, due)
+        self.ex[rows, slots] = x[np.isin(due, rows)]
+        self.ey[rows, slots] = 0
+        self.evx[rows, slots] = self.enemy_speed_x
+        self.e_last_shot[rows, slots] = 0
+        self.e_alive[rows, slots] = True
+
+    def _advance(self):
+        # player fire and bullets
+        fire = np.flatnonzero(self.time - self.p_last_shot > self.shoot_cooldown)
+        self.p_last_shot[fire] = self.time[fire]
+        rows, slots = self._free_slots(self.b_alive, fire)
+        self.bx[rows, slots] = self.px[rows] + 51 - 2
+        self.by[rows, slots] = self.py[rows] - 11
+        self.b_alive[rows, slots] = True
+
+        self.by -= self.player_bullet_speed
+        self.b_alive &= self.by >= -22
+
+        # enemies sweep sideways, bounce off the walls and sink
+        self.ex += self.evx
+        left = self.ex < 0
+        right = self.ex > self.width - self.enemy_w
+        self.ex[left] = 0
+        self.evx[left] = self.enemy_speed_x
+        self.ex[right] = self.width - self.enemy_w
+        self.evx[right] = -self.enemy_speed_x
+        self.ey += self.enemy_speed_y
+        # enemies below the playfield can no longer matter, free their slots
+        self.e_alive &= self.ey <= self.height
+
+        # enemy fire, one column of enemy slots at a time
+        for slot in range(self.e_alive.shape[1]):
+            fire = np.flatnonzero(self.e_alive[:, slot] &
+                                  (self.time - self.e_last_shot[:, slot] > self.enemy_shoot_cooldown))
+            if fire.size == 0:
+                continue
+            self.e_last_shot[fire, slot] = self.time[fire]
+            rows, slots = self._free_slots(self.eb_alive, fire)
+            self.ebx[rows, slots] = self.ex[rows, slot] + 56 // 2 - 6 // 2
+            self.eby[rows, slots] = self.ey[rows, slot] + 43
+            self.eb_alive[rows, slots] = True
+
+        self.eby += self.enemy_bullet_speed
+        self.eb_alive &= self.eby <= self.height
+
+    def step(self, actions):
+        """
+        Advance every game by one tick. Games that end are reset before
+        returning, so the returned state of such a game is its first state;
+        the state it ended in is kept in `final_states`.
+        :param actions: Int array of action indices, one per game.
+        :return: (states, rewards, terminated, truncated): terminated games
+            were hit, truncated ones reached max_steps and could have gone on.
+        """
+        actions = np.asarray(actions)
+        self._spawn_enemies()
+        rewards, terminated = self._rewards()
+        self._move_players(actions)
+        self._advance()
+
+        self.time += self.tick_ms
+        self.steps += 1
+        if self.max_steps is not None:
+            truncated = (self.steps >= self.max_steps) & ~terminated
+        else:
+            truncated = np.zeros(self.n, bool)
+
+        finished = np.flatnonzero(terminated | truncated)
+        if finished.size:
+            self.final_states[finished] = self.states()[finished]
+            self.final_score[finished] = self.score[finished]
+            self.episodes += finished.size
+            self.reset(finished)
+        return self.states(), rewards, terminated, truncated
+
+    def counts(self):
+        # live entities over all games
+        return {
+            "enemies": int(self.e_alive.sum()),
+            "bullets": int(self.b_alive.sum()),
+            "enemy_bullets": int(self.eb_alive.sum()),
+        }
+
+
+def train_batch(agent, envs=256, steps=1000, max_steps=1000, seed=None, rewards=None):
+    """
+    Train a QLearningAgent against a BatchEnv, one remember_batch() over
+    all games per batched step.
+    :param agent: QLearningAgent to train.
+    :param envs: Number of parallel games.
+    :param steps: Number of batched steps.
+    :param max_steps: Maximum steps per episode.
+    :param seed: Seed for spawns and exploration.
+    :param rewards: Reward weights, None for Manager.default_rewards.
+    :return: The BatchEnv, for its scores and episode count.
+    """
+    if seed is not None:
+        np.random.seed(seed)
+    env = BatchEnv(envs, actions=agent.actions, seed=seed, max_steps=max_steps, rewards=rewards)
+    state_array = env.states()
+    states = env.state_tuples(state_array)
+
+    for _ in range(steps):
+        actions = np.array([agent.action_index[agent.choose_action(s)] for s in states])
+        next_array, rewards, terminated, truncated = env.step(actions)
+        # a game that ended was reset, its action led to its final state instead; only a hit is
+        # terminal, a game cut at max_steps still bootstraps from where it stopped
+        learned_next = next_array
+        ended = terminated | truncated
+        if ended.any():
+            learned_next = next_array.copy()
+            learned_next[ended] = env.final_states[ended]
+        agent.remember_batch(state_array, actions, rewards, learned_next, terminated)
+        state_array = next_array
+        states = env.state_tuples(next_array)
+        agent.update_epsilon()
+
+    return env
@@ -0,0 +1,306 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+ACTIONS = ["UP", "DOWN", "LEFT", "RIGHT", "AVOID"]
+SCENARIOS = ["sim", "render", "learn", "memory", "startup", "convergence", "stress"]
+
+
+def _agent(backend="dict", **kwargs):
+    from play import QLearningAgent
+    # a file that does not exist, so no saved table is loaded or overwritten
+    return QLearningAgent(ACTIONS, backend=backend, q_table_file=os.devnull + ".benchmark", **kwargs)
+
+
+def _seed(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def bench_sim(seed, episodes=20, max_steps=1000):
+    """
+    Steps per second of headless Manager.run_episode training episodes.
+    """
+    from play import Manager
+    _seed(seed)
+    manager = Manager(headless=True)
+    manager.agent = _agent()
+
+    steps = 0
+    start = time.perf_counter()
+    for _ in range(episodes):
+        steps += manager.run_episode(max_steps)[1]
+    seconds = time.perf_counter() - start
+    return {
+        "episodes": episodes,
+        "steps": steps,
+        "seconds": seconds,
+        "steps_per_sec": steps / seconds,
+        "q_table_size": len(manager.agent.q_table),
+    }
+
+
+def bench_render(seed, frames=1000):
+    """
+    Frames per second of the Manager.main render loop, uncapped at one tick per frame.
+    """
+    from play import Manager
+    _seed(seed)
+    manager = Manager()
+    manager.agent = _agent()
+
+    start = time.perf_counter()
+    frames = manager.main(max_frames=frames, fps=0, auto_restart=True)
+    seconds = time.perf_counter() - start
+    return {
+        "frames": frames,
+        "seconds": seconds,
+        "frames_per_sec": frames / seconds,
+        "video_driver": os.environ.get("SDL_VIDEODRIVER", "default"),
+    }
+
+
+def bench_learn(seed, sizes=(1000, 10000, 100000), calls=20000):
+    """
+    Microseconds per QLearningAgent.learn and choose_action call at
+    increasing Q-table sizes, for both Q-table backends.
+    """
+    from qtable import ArrayQTable
+    rng = np.random.default_rng(seed)
+    results = []
+    for size in sizes:
+        states = set()
+        while len(states) < size:
+            states.add(tuple(int(v) for v in rng.integers(0, (49, 71, 49, 71))))
+        states = list(states)
+        table = {s: dict(zip(ACTIONS, rng.random(len(ACTIONS)).tolist())) for s in states}
+        picks = [states[i] for i in rng.integers(0, size, calls)]
+        actions = [ACTIONS[i] for i in rng.integers(0, len(ACTIONS), calls)]
+        rewards = rng.normal(size=calls).tolist()
+
+        for backend in ("dict", "array"):
+            _seed(seed)
+            agent = _agent(backend)
+            agent.epsilon = 0.0
+            agent.q_table = ArrayQTable.from_dict(table, ACTIONS) if backend == "array" else \
+                {s: dict(q) for s, q in table.items()}
+
+            start = time.perf_counter()
+            for state in picks:
+                agent.choose_action(state)
+            choose_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for i in range(calls - 1):
+                agent.learn(picks[i], actions[i], rewards[i], picks[i + 1])
+            learn_seconds = time.perf_counter() - start
+
+            results.append({
+                "backend": backend,
+                "q_table_size": size,
+                "choose_action_us": choose_seconds / calls * 1e6,
+                "learn_us": learn_seconds / (calls - 1) * 1e6,
+            })
+    return results
+
+
+def bench_memory(seed, steps=50000, sample_every=5000, max_steps=1000):
+    """
+    Traced Python memory and live entity counts sampled over a long headless session.
+    """
+    from play import Manager
+    _seed(seed)
+    manager = Manager(headless=True)
+    manager.agent = _agent()
+
+    tracemalloc.start()
+    samples = []
+    played = 0
+    next_sample = 0
+    while played < steps:
+        played += manager.run_episode(min(max_steps, steps - played))[1]
+        if played >= next_sample:
+            current, peak = tracemalloc.get_traced_memory()
+            counts = manager.entity_counts()
+            samples.append({
+                "steps": played,
+                "traced_bytes": current,
+                "peak_bytes": peak,
+                "q_table_size": len(manager.agent.q_table),
+                "enemies": counts["enemies"],
+                "bullets": counts["bullets"],
+                "enemy_bullets": counts["enemy_bullets"],
+            })
+            next_sample += sample_every
+    tracemalloc.stop()
+    return {
+        "steps": played,
+        "samples": samples,
+        "growth_bytes": samples[-1]["traced_bytes"] - samples[0]["traced_bytes"],
+    }
+
+
+def bench_convergence(seed, target=25.0, window=20, max_episodes=500, max_steps=1000,
+                      modes=("one-step", "n-step", "lambda")):
+    """
+    Episodes and seconds each learning mode needs from an empty Q-table
+    until the mean score of the last `window` episodes reaches `target`.
+    A mode that never gets there reports None after `max_episodes`.
+    """
+    from play import Manager
+    results = []
+    for mode in modes:
+        _seed(seed)
+        manager = Manager(headless=True, load_q_table=False)
+        manager.agent = _agent(mode=mode)
+
+        scores = []
+        steps = 0
+        reached = None
+        start = time.perf_counter()
+        while len(scores) < max_episodes:
+            steps += manager.run_episode(max_steps)[1]
+            scores.append(Manager.score)
+            if len(scores) >= window and np.mean(scores[-window:]) >= target:
+                reached = len(scores)
+                break
+        seconds = time.perf_counter() - start
+        means = [np.mean(scores[i:i + window]) for i in range(max(1, len(scores) - window + 1))]
+        results.append({
+            "mode": mode,
+            "target_score": target,
+            "episodes": reached,
+            "seconds": seconds if reached else None,
+            "steps": steps,
+            "steps_per_sec": steps / seconds,
+            "best_mean_score": float(max(means)),
+        })
+    return results
+
+
+def bench_stress(seed, scenario="scenarios/stress.json", steps=20000):
+    """
+    Steps per second, peak live sprites and collision tests of the
+    Manager.step game loop, headless, under a dense scenario file. The
+    player is invulnerable, so one episode runs through the whole
+    schedule instead of restarting at the first hit.
+    """
+    from play import Manager
+    _seed(seed)
+    manager = Manager(headless=True, load_q_table=False, scenario=scenario, invulnerable=True)
+    manager.agent = _agent()
+
+    peak = {"enemies": 0, "bullets": 0, "enemy_bullets": 0, "sprites": 0}
+    manager.restart()
+    start = time.perf_counter()
+    for _ in range(steps):
+        manager.step()
+        counts = manager.entity_counts()
+        counts["sprites"] = counts["players"] + counts["enemies"] + counts["bullets"] + counts["enemy_bullets"]
+        for key in peak:
+            peak[key] = max(peak[key], counts[key])
+    seconds = time.perf_counter() - start
+    return {
+        "scenario": scenario,
+        "steps": steps,
+        "seconds": seconds,
+        "steps_per_sec": steps / seconds,
+        "spawned": sum(len(manager.timeline.at(tick)) for tick in range(manager.spawn_tick)),
+        "peak_sprites": peak["sprites"],
+        "peak_enemies": peak["enemies"],
+        "peak_bullets": peak["bullets"],
+        "peak_enemy_bullets": peak["enemy_bullets"],
+        "broad_checks": manager.enemy_grid.broad_total + manager.bullet_grid.broad_total,
+        "narrow_checks": manager.enemy_grid.narrow_total + manager.bullet_grid.narrow_total,
+    }
+
+
+STARTUP_SCRIPT = """
+import json, sys
+import play
+manager = play.Manager(headless=sys.argv[1] == "headless", audio=False, load_q_table=False)
+if manager.headless:
+    manager.run_episode(1)
+else:
+    manager.main(max_frames=1, fps=0)
+print(json.dumps(manager.startup()))
+"""
+
+
+def bench_startup(repeat=5):
+    """
+    Import-to-first-step time of a fresh interpreter, headless and with a window.
+    """
+    results = {}
+    for mode in ("headless", "window"):
+        runs = []
+        for _ in range(repeat):
+            out = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, mode], capture_output=True, text=True,
+                                 check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        results[mode] = {key: float(np.median([r[key] for r in runs])) for key in runs[0]}
+    return results
+
+
+def run(scenarios, seed=0, quick=False):
+    """
+    Run the given scenarios and collect their results in one JSON-ready dict.
+    """
+    results = {
+        "seed": seed,
+        "quick": quick,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": {},
+    }
+    for name in scenarios:
+        if name == "sim":
+            result = bench_sim(seed, episodes=3 if quick else 20)
+        elif name == "render":
+            result = bench_render(seed, frames=200 if quick else 1000)
+        elif name == "learn":
+            result = bench_learn(seed, sizes=(1000, 10000) if quick else (1000, 10000, 100000),
+                                 calls=2000 if quick else 20000)
+        elif name == "memory":
+            result = bench_memory(seed, steps=5000 if quick else 50000, sample_every=1000 if quick else 5000)
+        elif name == "startup":
+            result = bench_startup(repeat=2 if quick else 5)
+        elif name == "convergence":
+            result = bench_convergence(seed, max_episodes=50 if quick else 500)
+        elif name == "stress":
+            result = bench_stress(seed, steps=2000 if quick else 20000)
+        else:
+            raise ValueError(f"Unknown scenario {name!r}, expected one of {SCENARIOS}.")
+        results["results"][name] = result
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure simulation, learning and rendering throughput.")
+    parser.add_argument("scenarios", nargs="*", default=SCENARIOS, help=f"scenarios to run (default: all of {SCENARIOS})")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true", help="smaller runs, for a fast sanity check")
+    parser.add_argument("--output", default=None, help="write the JSON results to this file")
+    parser.add_argument("--dummy-video", action="store_true", help="render offscreen with SDL's dummy drivers")
+    args = parser.parse_args()
+
+    if args.dummy_video:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+    results = run(args.scenarios, args.seed, args.quick)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
@@ -0,0 +1,160 @@
+import os
+import pickle
+import queue
+import threading
+import time
+
+
+def write_q_table(path, q_table):
+    """
+    Write a full Q-table to a temporary file and rename it over `path`, so a
+    crash never leaves a half-written table. The delta log, now folded into
+    the file, is removed.
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(q_table, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    try:
+        os.remove(path + ".delta")
+    except FileNotFoundError:
+        pass
+
+
+def read_deltas(path, q_table):
+    """
+    Apply the delta log of a checkpoint to a loaded Q-table in place. A
+    state saved as None was evicted and is removed. A record cut short by
+    a crash ends the log.
+    :return: Number of records applied.
+    """
+    records = 0
+    try:
+        with open(path + ".delta", "rb") as f:
+            while True:
+                try:
+                    delta = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError, ValueError):
+                    break
+                for state, q in delta.items():
+                    if q is None:
+                        q_table.pop(state, None)
+                    else:
+                        q_table[state] = q
+                records += 1
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def read_checkpoint(path):
+    """
+    Load a Q-table written by Checkpointer: the base pickle plus its delta log.
+    """
+    try:
+        with open(path, "rb") as f:
+            q_table = pickle.load(f)
+    except FileNotFoundError:
+        q_table = {}
+    read_deltas(path, q_table)
+    return q_table
+
+
+class Checkpointer(object):
+    """
+    Saves a QLearningAgent's Q-table from a background thread. Each
+    checkpoint copies only the states changed since the last one and
+    appends them to `<q_table_file>.delta`, with None for states evicted
+    since; every `compact_every` checkpoints the writer folds the log into
+    the base file, which is always replaced atomically. The agent's visit
+    counts, if it tracks them, are saved on close().
+    :param agent: QLearningAgent to save.
+    :param every_episodes: Save after this many episodes, None to disable.
+    :param every_seconds: Save when this many seconds have passed, None to disable.
+    :param compact_every: Number of delta checkpoints between two compactions.
+    """
+    def __init__(self, agent, every_episodes=1, every_seconds=None, compact_every=20):
+        self.agent = agent
+        self.path = agent.q_table_file
+        self.every_episodes = every_episodes
+        self.every_seconds = every_seconds
+        self.compact_every = compact_every
+
+        self.episodes = 0
+        self.last_time = time.monotonic()
+        self.deltas = 0  # delta records since the last compaction
+        self.saves = 0
+        self.compactions = 0
+        self.last_snapshot_seconds = 0.0  # time the training loop spent copying
+        self.last_write_seconds = 0.0  # time the writer spent on the last job
+
+        # changed states are collected by the agent from now on, so the
+        # table in memory has to match the file when the checkpointer starts
+        agent.dirty = set()
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            job, data = self.queue.get()
+            start = time.perf_counter()
+            try:
+                if job == "delta":
+                    with open(self.path + ".delta", "ab") as f:
+                        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+                        f.flush()
+                        os.fsync(f.fileno())
+                elif job == "compact":
+                    write_q_table(self.path, read_checkpoint(self.path))
+                elif job == "stop":
+                    return
+            except OSError as e:
+                print(f"Checkpoint failed: {e}")
+            finally:
+                self.last_write_seconds = time.perf_counter() - start
+                self.queue.task_done()
+
+    def episode_done(self):
+        """
+        Call at the end of every episode, saves when the interval is due.
+        :return: True if a checkpoint was queued.
+        """
+        self.episodes += 1
+        due = self.every_episodes is not None and self.episodes % self.every_episodes == 0
+        if self.every_seconds is not None and time.monotonic() - self.last_time >= self.every_seconds:
+            due = True
+        if due:
+            self.save()
+        return due
+
+    def save(self):
+        start = time.perf_counter()
+        dirty, self.agent.dirty = self.agent.dirty, set()
+        delta = self.agent.snapshot(dirty)
+        self.last_snapshot_seconds = time.perf_counter() - start
+        self.last_time = time.monotonic()
+        self.saves += 1
+
+        if delta:
+            self.queue.put(("delta", delta))
+            self.deltas += 1
+        if self.deltas >= self.compact_every:
+            self.queue.put(("compact", None))
+            self.deltas = 0
+            self.compactions += 1
+
+    def close(self):
+        """
+        Save what is left, compact and wait for the writer to finish.
+        """
+        self.save()
+        self.queue.put(("compact", None))
+        self.queue.put(("stop", None))
+        self.thread.join()
+        self.agent.dirty = None
+        tracker = getattr(self.agent, "tracker", None)
+        if tracker is not None:
+            tracker.save(self.path + ".visits")
@@ -0,0 +1,197 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class AsyncAgent(object):
+    """
+    Wraps a QLearningAgent so that the game loop never learns. The game
+    thread picks actions from a greedy policy snapshot, {state: action},
+    and hands each transition to a bounded queue; a learner thread drains
+    the queue into the wrapped agent, decays epsilon and every
+    `publish_seconds` swaps in a refreshed snapshot. When the queue is
+    full, transitions are dropped and counted rather than stalling a frame,
+    and an episode end waits for room ahead of the next transition.
+
+    The learner is a thread, so it still shares the GIL with the game, but
+    it learns in batches and yields between them; the game only pays a
+    dict lookup and a queue put per tick. If the learner fails, the next
+    choose_action(), remember() or stop() raises its error.
+    :param agent: QLearningAgent to train.
+    :param queue_size: Maximum number of transitions waiting to be learned.
+    :param publish_seconds: Seconds between policy snapshots.
+    :param batch: Maximum transitions learned before yielding.
+    """
+    def __init__(self, agent, queue_size=10000, publish_seconds=0.5, batch=256):
+        if not hasattr(agent, "q_table"):
+            raise ValueError(f"AsyncAgent learns into a local Q-table, {type(agent).__name__} has none.")
+        self.agent = agent
+        self.backend = getattr(agent, "backend", "dict")
+        self.transitions = queue.Queue(queue_size)
+        self.publish_seconds = publish_seconds
+        self.batch = batch
+        self.policy = self._full_policy()
+        # states the agent changed since the last snapshot, n-step and lambda updates reach earlier states too
+        self.touched = agent.changed = set()
+        self.dropped = 0
+        self.learned = 0
+        self.published = 0
+        self.error = None  # exception that stopped the learner
+        # an episode end that did not fit in the queue, queued or applied as soon as there is room
+        self.episode_ended = False
+        self._ending = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __getattr__(self, name):
+        # actions, action_index, epsilon, q_table... come from the wrapped agent
+        return getattr(self.agent, name)
+
+    def _best(self, state):
+        if self.backend == "array":
+            return self.agent.q_table.best_action(state)
+        q = self.agent.q_table.get(state)
+        return max(q, key=q.get) if q else None
+
+    def _full_policy(self):
+        q_table = self.agent.q_table
+        if self.backend == "array":
+            states = list(q_table.states())
+            best = np.argmax(q_table.values[[row for _, row in states]], axis=1) if states else []
+            return {state: self.agent.actions[i] for (state, _), i in zip(states, best)}
+        return {state: max(q, key=q.get) for state, q in q_table.items()}
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="learner", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Learn what is still queued, publish a last snapshot and stop the thread.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self._check()
+
+    def _check(self):
+        # the game must not go on as if it were still learning
+        if self.error is not None:
+            raise RuntimeError("The learner thread failed.") from self.error
+
+    def _run(self):
+        next_publish = time.monotonic() + self.publish_seconds
+        try:
+            while not self._stop.is_set() or not self.transitions.empty():
+                try:
+                    items = [self.transitions.get(timeout=0.05)]
+                except queue.Empty:
+                    items = []
+                while items and len(items) < self.batch:
+                    try:
+                        items.append(self.transitions.get_nowait())
+                    except queue.Empty:
+                        break
+                for item in items:
+                    if item is None:
+                        self.agent.end_episode()
+                        continue
+                    self.agent.remember(*item)
+                    self.agent.update_epsilon()
+                    self.learned += 1
+                if self.episode_ended and self.transitions.empty():
+                    self._end_pending_episode()
+
+                if time.monotonic() >= next_publish:
+                    self.publish()
+                    next_publish = time.monotonic() + self.publish_seconds
+                # let the game thread run
+                time.sleep(0)
+            self.publish()
+        except Exception as e:
+            self.error = e
+
+    def _end_pending_episode(self):
+        # learner side: nothing of the next episode is queued yet, so it can end now
+        with self._ending:
+            if not self.episode_ended or not self.transitions.empty():
+                return
+            self.episode_ended = False
+        self.agent.end_episode()
+
+    def publish(self):
+        # copy, update and swap, so the game thread always reads a whole snapshot
+        if not self.touched:
+            return
+        policy = dict(self.policy)
+        for state in self.touched:
+            action = self._best(state)
+            if action is None:
+                policy.pop(state, None)  # evicted
+            else:
+                policy[state] = action
+        self.touched.clear()
+        self.policy = policy
+        self.published += 1
+
+    def choose_action(self, state):
+        self._check()
+        action = None if np.random.rand() < self.agent.epsilon else self.policy.get(state)
+        return np.random.choice(self.agent.actions) if action is None else action
+
+    def remember(self, state, action, reward, next_state, done=False):
+        self._check()
+        if self.episode_ended and not self._queue_episode_end():
+            self.dropped += 1
+            return
+        try:
+            self.transitions.put_nowait((state, action, reward, next_state, done))
+        except queue.Full:
+            self.dropped += 1
+
+    def end_episode(self):
+        # in order with the transitions, so the learner ends the episode after its last step
+        self._check()
+        self._queue_episode_end()
+
+    def _queue_episode_end(self):
+        # game side: never waits for the learner, a full queue leaves the end pending
+        with self._ending:
+            try:
+                self.transitions.put_nowait(None)
+            except queue.Full:
+                self.episode_ended = True
+                return False
+            self.episode_ended = False
+            return True
+
+    def update_epsilon(self):
+        # decayed by the learner, once per learned transition
+        pass
+
+    def load_q_table(self):
+        running = self._thread is not None
+        self.stop()
+        self.agent.load_q_table()
+        self.policy = self._full_policy()
+        if running:
+            self.start()
+
+    def save_q_table(self):
+        # the learner must not change the table while it is written
+        self.stop()
+        self.agent.save_q_table()
+
+    def stats(self):
+        return {
+            "queued": self.transitions.qsize(),
+            "learned": self.learned,
+            "dropped": self.dropped,
+            "published": self.published,
+            "policy_states": len(self.policy),
+        }
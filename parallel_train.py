@@ -0,0 +1,172 @@
+import argparse
+import multiprocessing
+import random
+import time
+
+import numpy as np
+
+from play import Manager, QLearningAgent
+
+ACTIONS = ["UP", "DOWN", "LEFT", "RIGHT", "AVOID"]
+
+
+def _worker(conn, index, max_steps, seed):
+    """
+    Worker process loop. Keeps its own headless game and local Q-table
+    copy, plays the requested number of episodes and sends back the rows
+    it updated together with their visit counts.
+    """
+    if seed is not None:
+        random.seed(seed + index)
+        np.random.seed(seed + index)
+
+    # the master sends the whole table with the first run
+    manager = Manager(headless=True, load_q_table=False)
+    agent = manager.agent
+    agent.visits = {}
+
+    while True:
+        message = conn.recv()
+        if message[0] == "stop":
+            break
+
+        _, episodes, updates, epsilon = message
+        if epsilon is not None:
+            agent.epsilon = epsilon
+        for state, q in updates.items():
+            agent.q_table[state] = dict(q)
+        agent.visits = {}
+
+        start = time.perf_counter()
+        steps = 0
+        rewards, scores = [], []
+        for _ in range(episodes):
+            total_reward, played = manager.run_episode(max_steps)
+            steps += played
+            rewards.append(total_reward)
+            scores.append(Manager.score)
+
+        conn.send({
+            "worker": index,
+            "changed": {state: agent.q_table[state] for state in agent.visits},
+            "visits": agent.visits,
+            "episodes": episodes,
+            "steps": steps,
+            "seconds": time.perf_counter() - start,
+            "rewards": rewards,
+            "scores": scores,
+            "startup": manager.startup(),
+        })
+    conn.close()
+
+
+def merge(q_table, results):
+    """
+    Merge worker updates into the master table. A state updated by several
+    workers gets the average of their Q-values weighted by how often each
+    worker visited it.
+    :return: The merged rows, to be sent back to the workers.
+    """
+    totals = {}  # state -> [visit sum, {action: weighted Q sum}]
+    for result in results:
+        changed = result["changed"]
+        for state, count in result["visits"].items():
+            entry = totals.get(state)
+            if entry is None:
+                entry = totals[state] = [0, {a: 0.0 for a in changed[state]}]
+            entry[0] += count
+            for action, value in changed[state].items():
+                entry[1][action] += count * value
+
+    merged = {}
+    for state, (weight, sums) in totals.items():
+        merged[state] = {action: value / weight for action, value in sums.items()}
+    q_table.update(merged)
+    return merged
+
+
+def train_parallel(workers=None, episodes=1000, max_steps=500, merge_every=10, q_table_file="q_table.pkl",
+                   seed=None):
+    """
+    Train one Q-table with a pool of worker processes.
+    :param workers: Number of worker processes, defaults to the CPU count.
+    :param episodes: Total number of training episodes over all workers.
+    :param max_steps: Maximum steps per episode.
+    :param merge_every: Episodes each worker plays between two merges.
+    :param q_table_file: Q-table file to start from and save to.
+    :param seed: Base seed, worker i uses seed + i.
+    :return: Per-round stats with per-worker throughput and merge time.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    master = QLearningAgent(actions=ACTIONS, q_table_file=q_table_file)
+
+    pipes, processes = [], []
+    for index in range(workers):
+        parent, child = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_worker, args=(child, index, max_steps, seed), daemon=True)
+        process.start()
+        pipes.append(parent)
+        processes.append(process)
+
+    history = []
+    updates = master.q_table  # workers start from the full master table
+    epsilon = master.epsilon
+    done = 0
+    try:
+        while done < episodes:
+            # spread this round's episodes over the workers
+            round_episodes = min(merge_every * workers, episodes - done)
+            shares = [round_episodes // workers + (1 if i < round_episodes % workers else 0) for i in range(workers)]
+            for pipe, share in zip(pipes, shares):
+                pipe.send(("run", share, updates, epsilon))
+            epsilon = None  # workers decay their own epsilon from here on
+            results = [pipe.recv() for pipe in pipes]
+
+            start = time.perf_counter()
+            updates = merge(master.q_table, results)
+            merge_seconds = time.perf_counter() - start
+            master.save_q_table()
+
+            done += round_episodes
+            stats = {
+                "episodes": done,
+                "merged_states": len(updates),
+                "merge_ms": merge_seconds * 1000,
+                "q_table_size": len(master.q_table),
+                "workers": [{
+                    "worker": r["worker"],
+                    "episodes": r["episodes"],
+                    "steps_per_sec": r["steps"] / r["seconds"] if r["seconds"] else 0.0,
+                    "mean_reward": float(np.mean(r["rewards"])) if r["rewards"] else 0.0,
+                    "mean_score": float(np.mean(r["scores"])) if r["scores"] else 0.0,
+                    "startup": r["startup"],
+                } for r in results],
+            }
+            history.append(stats)
+
+            print(f'Episodes {done}/{episodes}: merged {stats["merged_states"]} states in {stats["merge_ms"]:.1f} ms, '
+                  f'Q-table size {stats["q_table_size"]}')
+            for w in stats["workers"]:
+                print(f'  worker {w["worker"]}: {w["steps_per_sec"]:.0f} steps/sec, '
+                      f'mean reward {w["mean_reward"]:.1f}, mean score {w["mean_score"]:.1f}')
+    finally:
+        for pipe in pipes:
+            pipe.send(("stop",))
+        for process in processes:
+            process.join()
+
+    print("Parallel training completed and Q-table saved!")
+    return history
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the Q-learning agent with several processes.")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--episodes", type=int, default=100)
+    parser.add_argument("--max-steps", type=int, default=1000)
+    parser.add_argument("--merge-every", type=int, default=5, help="episodes per worker between merges")
+    parser.add_argument("--q-table", default="q_table.pkl")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    train_parallel(args.workers, args.episodes, args.max_steps, args.merge_every, args.q_table, args.seed)
@@ -1,3 +1,6 @@
+from time import perf_counter
+IMPORT_STARTED = perf_counter()  # start of the import, for the startup report
+import collections
 import random
 import pygame
 from pygame import *
@@ -5,45 +8,123 @@ import time
 import numpy as np
 import pickle
 import warnings
+from qtable import ArrayQTable
+from checkpoint import Checkpointer, read_deltas, write_q_table
+import spatial
+from profiler import FrameProfiler
+from render import DirtyScreen
+from replay import ReplayBuffer
+from recording import Recorder, Recording, ReplayAgent
+from learner import AsyncAgent
+from policy import FrozenPolicy, PolicyStore
+from visits import VisitTracker
+from traces import EligibilityTraces, NStepBuffer
+from agent_server import AgentClient
+from telemetry import MetricsLog
+from scenario import DEFAULT_ENEMY, Scenario
 
 warnings.filterwarnings("ignore")
 
 class QLearningAgent:
-    def __init__(self, actions, learning_rate=0.1, discount_factor=0.9, epsilon=0.1, q_table_file="q_table.pkl"):
+    def __init__(self, actions, learning_rate=0.1, discount_factor=0.9, epsilon=0.1, q_table_file="q_table.pkl",
+                 track_visits=False, backend="dict", replay_capacity=0, batch_size=32, replay_every=4, load=True,
+                 min_epsilon=0.01, epsilon_decay=0.995, max_states=None, track_states=False, mode="one-step",
+                 n_steps=3, trace_decay=0.8, trace_cutoff=0.01):
+        """
+        :param mode: "one-step" Q-learning, "n-step" returns or Watkins Q(lambda) with "lambda".
+        :param n_steps: Rewards per return in n-step mode.
+        :param trace_decay: Lambda in lambda mode.
+        :param trace_cutoff: Smallest eligibility trace kept in lambda mode.
+        """
+        if mode not in ("one-step", "n-step", "lambda"):
+            raise ValueError(f"Unknown learning mode {mode!r}.")
+        if mode != "one-step" and replay_capacity:
+            raise ValueError(f"{mode} learning needs whole episodes in order, it cannot learn from a replay buffer.")
         self.actions = actions  # Action space
+        self.action_index = {a: i for i, a in enumerate(actions)}
         self.lr = learning_rate  # Learning rate
         self.gamma = discount_factor  # Discount factor
         self.epsilon = epsilon  # Exploration rate
-        self.q_table = {}  # Q-table, stored as a dictionary
+        self.min_epsilon = min_epsilon  # Floor of the exploration rate
+        self.epsilon_decay = epsilon_decay  # Exploration rate factor per step
+        self.backend = backend  # "dict" or "array" (ArrayQTable)
+        self.q_table = ArrayQTable(actions) if backend == "array" else {}  # Q-table
         self.q_table_file = q_table_file  # File to save the Q-table
-        self.load_q_table()
+        self.visits = {} if track_visits else None  # state -> number of updates
+        self.dirty = None  # states changed since the last checkpoint, set by Checkpointer
+        self.changed = None  # states changed since the last policy snapshot, set by AsyncAgent
+        # visit counts, hit rate and eviction down to max_states, None when off
+        self.tracker = VisitTracker(max_states) if max_states is not None or track_states else None
+        # experience replay, 0 learns each step as it happens
+        self.replay = ReplayBuffer(replay_capacity) if replay_capacity else None
+        self.batch_size = batch_size  # transitions per replayed update
+        self.replay_every = replay_every  # steps between replayed updates
+        self.steps = 0  # steps remembered
+        self.loaded_file = None  # file the Q-table was last loaded from
+        self.mode = mode
+        self.n_step = NStepBuffer(n_steps, discount_factor) if mode == "n-step" else None
+        self.traces = EligibilityTraces(discount_factor, trace_decay, trace_cutoff) if mode == "lambda" else None
+        if load:
+            self.load_q_table()
 
     def save_q_table(self):
-        with open(self.q_table_file, "wb") as f:
-            pickle.dump(self.q_table, f)
+        write_q_table(self.q_table_file, self.q_table_dict())
+        if self.tracker is not None:
+            self.tracker.save(self.q_table_file + ".visits")
         print("Q-table saved to file.")
 
-    def load_q_table(self):
+    def load_q_table(self, force=False):
+        """
+        Load the Q-table file, unless it was already loaded.
+        :param force: Load it again, dropping what was learned since.
+        """
+        if self.loaded_file == self.q_table_file and not force:
+            return
+        self.loaded_file = self.q_table_file
         try:
             with open(self.q_table_file, "rb") as f:
                 self.q_table = pickle.load(f)
+            # states saved by incremental checkpoints since the last compaction
+            read_deltas(self.q_table_file, self.q_table)
+            if self.backend == "array":
+                self.q_table = ArrayQTable.from_dict(self.q_table, self.actions)
+            if self.tracker is not None:
+                self.tracker.load(self.q_table_file + ".visits")
             print("Q-table loaded from file.")
         except FileNotFoundError:
             print("No Q-table file found, starting with an empty Q-table.")
 
+    def q_table_dict(self):
+        # the Q-table in the dict-of-dicts pickle format, whatever the backend
+        if self.backend == "array":
+            return self.q_table.to_dict()
+        return self.q_table
+
+    def snapshot(self, states=None):
+        # copy of the given states, None for the ones no longer in the table, or of the whole table,
+        # in the pickle format
+        if states is None:
+            return {state: dict(q) for state, q in self.q_table_dict().items()}
+        if self.backend == "array":
+            values = self.q_table.values
+            rows = {state: self.q_table.find(state) for state in states}
+            return {state: dict(zip(self.actions, values[row].tolist())) if row >= 0 else None
+                    for state, row in rows.items()}
+        return {state: dict(self.q_table[state]) if state in self.q_table else None for state in states}
+
     def get_state(self, player, enemy_bullets, enemies):
         def discretize(value, step=10):
             return value // step  
 
         if enemy_bullets:
-            closest_bullet = min(enemy_bullets, key=lambda b: abs(b.rect.top - player.rect.top))
+            closest_bullet = spatial.closest(enemy_bullets, player.rect.top)
             distance_bullet_x = discretize(abs(player.rect.left - closest_bullet.rect.left))
             distance_bullet_y = discretize(abs(player.rect.top - closest_bullet.rect.top))
         else:
             distance_bullet_x, distance_bullet_y = 0, 0
 
         if enemies:
-            closest_enemy = min(enemies, key=lambda e: abs(e.rect.top - player.rect.top))
+            closest_enemy = spatial.closest(enemies, player.rect.top)
             distance_enemy_x = discretize(abs(player.rect.left - closest_enemy.rect.left))
             distance_enemy_y = discretize(abs(player.rect.top - closest_enemy.rect.top))
         else:
@@ -52,23 +133,471 @@ class QLearningAgent:
         return (distance_bullet_x, distance_bullet_y, distance_enemy_x, distance_enemy_y)
 
     def choose_action(self, state):
+        if self.tracker is not None:
+            self.tracker.lookup(state)
+        if self.backend == "array":
+            # one lookup gives both "known state" and the best action
+            action = None if np.random.rand() < self.epsilon else self.q_table.best_action(state)
+            return np.random.choice(self.actions) if action is None else action
+
         if np.random.rand() < self.epsilon or state not in self.q_table:
             return np.random.choice(self.actions)  # choose action randomly
         return max(self.q_table[state], key=self.q_table[state].get)  # choose the best action
 
-    def learn(self, state, action, reward, next_state):
-        if state not in self.q_table:
-            self.q_table[state] = {a: 0 for a in self.actions}
-        if next_state not in self.q_table:
-            self.q_table[next_state] = {a: 0 for a in self.actions}
+    def remember(self, state, action, reward, next_state, done=False):
+        """
+        Record one environment step. Without a replay buffer it is learned
+        right away; with one it is stored, and every `replay_every` steps a
+        batch sampled from the buffer is learned.
+        """
+        if self.replay is None:
+            self.learn(state, action, reward, next_state, done)
+            return
+
+        self.replay.push(state, self.action_index[action], reward, next_state, done)
+        self.steps += 1
+        if self.steps % self.replay_every == 0 and len(self.replay) >= self.batch_size:
+            self.learn_batch(*self.replay.sample(self.batch_size))
+
+    def remember_batch(self, states, actions, rewards, next_states, dones):
+        """
+        remember() for n steps of parallel games given as arrays, learned in
+        one learn_batch() call.
+        :param actions: Int array of action indices.
+        """
+        if self.replay is None:
+            self.learn_batch(states, actions, rewards, next_states, dones)
+            return
+
+        self.replay.push_batch(states, actions, rewards, next_states, dones)
+        batches = (self.steps + len(states)) // self.replay_every - self.steps // self.replay_every
+        self.steps += len(states)
+        if batches and len(self.replay) >= self.batch_size:
+            self.learn_batch(*self.replay.sample(self.batch_size * batches))
+
+    def _touch(self, state, next_state):
+        if self.tracker is not None:
+            self.tracker.visit(state)
+        if self.visits is not None:
+            self.visits[state] = self.visits.get(state, 0) + 1
+        if self.dirty is not None:
+            self.dirty.add(state)
+            self.dirty.add(next_state)
+        if self.changed is not None:
+            self.changed.add(state)
+            self.changed.add(next_state)
+
+    def learn(self, state, action, reward, next_state, done=False):
+        self._touch(state, next_state)
+
+        if self.n_step is not None:
+            self._learn_n_step(state, action, reward, next_state, done)
+        elif self.traces is not None:
+            self._learn_lambda(state, action, reward, next_state, done)
+        elif self.backend == "array":
+            self.q_table.update(state, action, reward, next_state, self.lr, self.gamma, done)
+        else:
+            if state not in self.q_table:
+                self.q_table[state] = {a: 0 for a in self.actions}
+            if next_state not in self.q_table:
+                self.q_table[next_state] = {a: 0 for a in self.actions}
+
+            q_predict = self.q_table[state][action]
+            q_target = reward if done else reward + self.gamma * max(self.q_table[next_state].values())
+            self.q_table[state][action] += self.lr * (q_target - q_predict)
+
+        if self.tracker is not None and self.tracker.over(len(self.q_table)):
+            self.evict()
+
+    def _value(self, state, action):
+        if self.backend == "array":
+            row = self.q_table.row(state)  # before reading values, adding a row may replace the array
+            return self.q_table.values[row, self.action_index[action]]
+        return self._values(state)[action]
+
+    def _values(self, state):
+        # the dict backend's Q-values of a state, added as zeros if unseen
+        q = self.q_table.get(state)
+        if q is None:
+            q = self.q_table[state] = {a: 0 for a in self.actions}
+        return q
+
+    def _max_value(self, state):
+        if self.backend == "array":
+            row = self.q_table.row(state)
+            return self.q_table.values[row].max()
+        return max(self._values(state).values())
+
+    def _add(self, state, action, amount):
+        # n-step and lambda updates reach states other than the one just visited
+        if self.dirty is not None:
+            self.dirty.add(state)
+        if self.changed is not None:
+            self.changed.add(state)
+        if self.backend == "array":
+            row = self.q_table.row(state)
+            self.q_table.values[row, self.action_index[action]] += amount
+        else:
+            self._values(state)[action] += amount
 
-        q_predict = self.q_table[state][action]
-        q_target = reward + self.gamma * max(self.q_table[next_state].values())
-        self.q_table[state][action] += self.lr * (q_target - q_predict)
+    def end_episode(self):
+        """
+        Call when an episode ends, also when it is cut short without a
+        terminal transition: the n-step returns still owed bootstrap from
+        where it stopped, and no trace carries over into the next episode.
+        """
+        if self.n_step:
+            self._flush_n_step(self._max_value(self.n_step.next_state))
+        if self.traces is not None:
+            self.traces.clear()
+
+    def _flush_n_step(self, bootstrap):
+        buffer = self.n_step
+        while buffer:
+            self._update_target(*buffer.pop(bootstrap))
+        buffer.clear()
+
+    def _learn_n_step(self, state, action, reward, next_state, done):
+        buffer = self.n_step
+        if buffer and state != buffer.next_state:
+            # does not follow on from the last step without an end_episode() in between, e.g. interleaved games
+            self._flush_n_step(self._max_value(buffer.next_state))
+        buffer.push(state, action, reward, next_state)
+        if done:
+            self._flush_n_step(0)
+        elif len(buffer) == buffer.n:
+            self._update_target(*buffer.pop(self._max_value(next_state)))
+
+    def _update_target(self, state, action, target):
+        self._add(state, action, self.lr * (target - self._value(state, action)))
+
+    def _learn_lambda(self, state, action, reward, next_state, done):
+        traces = self.traces
+        if state != traces.next_state:
+            # a new episode, or a step that does not follow on from the last one
+            traces.clear()
+        elif self._value(state, action) >= self._max_value(state):
+            traces.decay()
+        else:
+            # Watkins: credit stops flowing back past an exploratory action
+            traces.clear()
+
+        q_target = reward if done else reward + self.gamma * self._max_value(next_state)
+        delta = q_target - self._value(state, action)
+        traces.visit(state, action)
+        step = self.lr * delta
+        for (s, a), trace in traces.items():
+            self._add(s, a, step * trace)
+        if done:
+            traces.clear()
+        else:
+            traces.next_state = next_state
 
-    def update_epsilon(self, min_epsilon=0.01, decay_rate=0.995):
+    def learn_batch(self, states, actions, rewards, next_states, dones=None):
+        """
+        Learn a batch of transitions given as arrays, vectorized with the
+        array backend and one learn() each with the dict backend.
+        :param states: (n, 4) int array.
+        :param actions: Int array of action indices.
+        """
+        if dones is None:
+            dones = np.zeros(len(states), bool)
+        if self.backend != "array" or self.mode != "one-step":
+            for s, a, r, s2, d in zip(map(tuple, states.tolist()), actions.tolist(), rewards.tolist(),
+                                      map(tuple, next_states.tolist()), dones.tolist()):
+                self.learn(s, self.actions[a], r, s2, d)
+            return
+
+        if self.visits is not None or self.dirty is not None or self.changed is not None or self.tracker is not None:
+            for s, s2 in zip(map(tuple, states.tolist()), map(tuple, next_states.tolist())):
+                self._touch(s, s2)
+        self.q_table.update_batch(states, actions, rewards, next_states, dones, self.lr, self.gamma)
+        if self.tracker is not None and self.tracker.over(len(self.q_table)):
+            self.evict()
+
+    def evict(self):
+        """
+        Drop states until the Q-table is back under the tracker's target
+        size, in the tracker's eviction order.
+        :return: The evicted states.
+        """
+        if self.backend == "array":
+            states, rows = zip(*self.q_table.states()) if len(self.q_table) else ((), ())
+            peaks = np.abs(self.q_table.values[list(rows)]).max(axis=1) if rows else np.zeros(0)
+        else:
+            states = list(self.q_table)
+            peaks = np.array([max(map(abs, q.values())) for q in self.q_table.values()])
+        victims = self.tracker.victims(list(states), peaks, len(states) - self.tracker.target())
+        if self.backend == "array":
+            self.q_table.remove(victims)
+        else:
+            for state in victims:
+                del self.q_table[state]
+        self.tracker.forget(victims)
+        if self.dirty is not None:
+            # the next checkpoint saves them as None, so they leave the file too
+            self.dirty.update(victims)
+        if self.changed is not None:
+            self.changed.update(victims)
+        return victims
+
+    def stats(self):
+        """
+        Q-table size, hit rate of action lookups and evictions, None
+        without a tracker.
+        """
+        if self.tracker is None:
+            return None
+        stats = self.tracker.stats(len(self.q_table))
+        if self.backend == "array":
+            stats["bytes"] = self.q_table.nbytes()
+        return stats
+
+    def update_epsilon(self, min_epsilon=None, decay_rate=None):
+        min_epsilon = self.min_epsilon if min_epsilon is None else min_epsilon
+        decay_rate = self.epsilon_decay if decay_rate is None else decay_rate
         self.epsilon = max(min_epsilon, self.epsilon * decay_rate) 
 
+class FrozenAgent(FrozenPolicy):
+    """
+    Plays a compiled FrozenPolicy with the state features of
+    QLearningAgent, without a Q-table, exploration or learning.
+    """
+    get_state = QLearningAgent.get_state
+    store = None  # PolicyStore followed by reload()
+    generation = 0  # generation of the store being played
+
+    @classmethod
+    def watch(cls, path, actions, fallback="AVOID"):
+        """
+        Play the newest policy of a PolicyStore, falling back on every
+        state until a trainer publishes the first one.
+        """
+        agent = cls.compile({}, actions, fallback)
+        agent.store = PolicyStore(path)
+        agent.reload()
+        return agent
+
+    def reload(self):
+        """
+        Swap in the store's newest policy if a newer one was published.
+        Cheap enough to call every frame: one read of the mapped counter.
+        :return: True if the policy changed.
+        """
+        generation = self.store.generation()
+        if generation == self.generation:
+            return False
+        policy = self.store.load(generation)
+        if policy is None:
+            # replaced again before it could be opened, the next call gets the newer one
+            return False
+        self.swap(policy)
+        self.generation = generation
+        return True
+
+    def remember(self, state, action, reward, next_state, done=False):
+        pass
+
+    def update_epsilon(self):
+        pass
+
+    def load_q_table(self):
+        pass
+
+    def save_q_table(self):
+        pass
+
+class RemoteAgent(AgentClient):
+    """
+    Plays and learns through an AgentServer in another process, with the
+    state features of QLearningAgent.
+    """
+    get_state = QLearningAgent.get_state
+
+class Assets(object):
+    """
+    Process-wide cache of images, sounds, fonts and rendered text. Each
+    file is read from disk once and, when a display exists, converted to
+    the display format so blits do not convert pixels every frame. All
+    sprites share the result. Rendered strings are kept in a small LRU, so
+    an unchanged score is not rendered again every frame.
+    """
+    images = {}  # path -> Surface
+    sounds = {}  # path -> Sound
+    fonts = {}  # size -> Font
+    masks = {}  # path -> Mask, for pixel-accurate collisions
+    texts = collections.OrderedDict()  # (text, size, color, background) -> Surface
+    max_texts = 256
+    hits = 0
+    misses = 0
+
+    # everything the game draws or plays, loaded up front by preload()
+    image_files = ["./images/me1.png", "./images/enemy1.png", "./images/bullet1.png",
+                   "./images/bullet2.png", "./images/background.png"] + \
+                  ["./images/enemy1_down" + str(v) + ".png" for v in range(1, 5)] + \
+                  ["./images/me_destroy_" + str(v) + ".png" for v in range(1, 5)]
+    sound_files = ["./sound/get_bomb.wav"]
+
+    @classmethod
+    def image(cls, path):
+        surface = cls.images.get(path)
+        if surface is not None:
+            cls.hits += 1
+            return surface
+
+        cls.misses += 1
+        surface = pygame.image.load(path)
+        # converting needs a display surface, headless runs keep the raw image
+        if pygame.display.get_init() and pygame.display.get_surface() is not None:
+            if surface.get_flags() & pygame.SRCALPHA:
+                surface = surface.convert_alpha()
+            else:
+                surface = surface.convert()
+        cls.images[path] = surface
+        return surface
+
+    @classmethod
+    def mask(cls, path):
+        mask = cls.masks.get(path)
+        if mask is None:
+            mask = cls.masks[path] = pygame.mask.from_surface(cls.image(path))
+        return mask
+
+    @classmethod
+    def sound(cls, path):
+        sound = cls.sounds.get(path)
+        if sound is not None:
+            cls.hits += 1
+            return sound
+
+        cls.misses += 1
+        sound = pygame.mixer.Sound(path)
+        cls.sounds[path] = sound
+        return sound
+
+    @classmethod
+    def font(cls, size):
+        font = cls.fonts.get(size)
+        if font is None:
+            font = cls.fonts[size] = pygame.font.Font(None, size)
+        return font
+
+    @classmethod
+    def text(cls, text, size, color, background=None):
+        key = (text, size, color, background)
+        surface = cls.texts.get(key)
+        if surface is not None:
+            cls.texts.move_to_end(key)
+            return surface
+
+        surface = cls.font(size).render(text, True, color, background)
+        cls.texts[key] = surface
+        if len(cls.texts) > cls.max_texts:
+            cls.texts.popitem(last=False)
+        return surface
+
+    @classmethod
+    def preload(cls, sounds=True):
+        for path in cls.image_files:
+            cls.image(path)
+        if sounds:
+            for path in cls.sound_files:
+                cls.sound(path)
+
+    @classmethod
+    def clear(cls):
+        cls.images.clear()
+        cls.sounds.clear()
+        cls.fonts.clear()
+        cls.masks.clear()
+        cls.texts.clear()
+        cls.hits = 0
+        cls.misses = 0
+
+    @classmethod
+    def stats(cls):
+        image_bytes = sum(s.get_pitch() * s.get_height() for s in cls.images.values())
+        sound_bytes = 0
+        mixer_init = pygame.mixer.get_init()
+        if mixer_init:
+            frequency, size, channels = mixer_init
+            for sound in cls.sounds.values():
+                sound_bytes += int(sound.get_length() * frequency) * channels * abs(size) // 8
+        return {
+            "hits": cls.hits,
+            "misses": cls.misses,
+            "images": len(cls.images),
+            "sounds": len(cls.sounds),
+            "texts": len(cls.texts),
+            "image_bytes": image_bytes,
+            "sound_bytes": sound_bytes,
+        }
+
+class SpritePool(object):
+    """
+    Preallocated sprites of one class. acquire() hands out a free sprite
+    reinitialized with reset(), and killing a sprite puts it back, so
+    bullets and enemies are recycled instead of built anew every shot.
+    The pool grows when it runs dry.
+    :param cls: PooledSprite subclass with create(screen) and reset(...).
+    :param screen: Screen passed to create().
+    :param size: Number of sprites to preallocate.
+    """
+    def __init__(self, cls, screen, size):
+        self.cls = cls
+        self.screen = screen
+        self.free = []
+        self.created = 0
+        self.reused = 0
+        self.live = 0
+        for _ in range(size):
+            self.free.append(self._create())
+
+    def _create(self):
+        # build the static part only, reset() fills in position and state
+        sprite = self.cls.__new__(self.cls)
+        sprite.create(self.screen)
+        sprite.pool_free = True
+        self.created += 1
+        return sprite
+
+    def acquire(self, *args):
+        if self.free:
+            sprite = self.free.pop()
+            self.reused += 1
+        else:
+            sprite = self._create()
+        sprite.pool_free = False
+        sprite.reset(*args)
+        self.live += 1
+        return sprite
+
+    def release(self, sprite):
+        # a sprite can be killed more than once, only return it the first time
+        if getattr(sprite, "pool_free", True):
+            return
+        sprite.pool_free = True
+        self.free.append(sprite)
+        self.live -= 1
+
+    def stats(self):
+        return {"live": self.live, "free": len(self.free), "created": self.created, "reused": self.reused}
+
+class PooledSprite(pygame.sprite.Sprite):
+    # sprite that goes back to its class pool when killed
+    pool = None
+
+    @classmethod
+    def spawn(cls, screen, *args):
+        if cls.pool is None:
+            return cls(screen, *args)
+        return cls.pool.acquire(*args)
+
+    def kill(self):
+        pygame.sprite.Sprite.kill(self)
+        if self.pool is not None:
+            self.pool.release(self)
+
 class Player(pygame.sprite.Sprite):
     bullets = pygame.sprite.Group()
 
@@ -76,7 +605,8 @@ class Player(pygame.sprite.Sprite):
         pygame.sprite.Sprite.__init__(self)
 
         # load player image
-        self.player = pygame.image.load("./images/me1.png")
+        self.player = Assets.image("./images/me1.png")
+        self.mask = Assets.mask("./images/me1.png")  # shared by every player
         self.rect = self.player.get_rect()
         self.rect.topleft = [240 - 51, 550]
 
@@ -87,9 +617,9 @@ class Player(pygame.sprite.Sprite):
         self.shoot_cooldown = 100
         self.agent = agent  # Q-learning
         self.current_action = None  # current action
+        self.last_state = None  # state the current action was chosen in
 
-    def auto_control(self, enemy_bullets, enemies):
-        state = self.agent.get_state(self, enemy_bullets, enemies)
+    def auto_control(self, state, enemy_bullets, enemies):
         self.current_action = self.agent.choose_action(state)
 
         if self.current_action == "UP":
@@ -102,7 +632,7 @@ class Player(pygame.sprite.Sprite):
             self.rect.right += self.speed
         elif self.current_action == "AVOID":  # avoid the bullets
             if enemy_bullets:
-                closest_bullet = min(enemy_bullets, key=lambda b: abs(b.rect.top - self.rect.top))
+                closest_bullet = spatial.closest(enemy_bullets, self.rect.top)
                 if self.rect.left < closest_bullet.rect.left:  
                     self.rect.left -= self.speed  
                 else:  
@@ -114,7 +644,7 @@ class Player(pygame.sprite.Sprite):
         elif self.current_action == "CHASE":  # chase enemy
             if enemies:
                 # Find the enemy aircraft closest to the y-coordinate of the fighter.
-                closest_enemy = min(enemies, key=lambda e: abs(e.rect.bottom - self.rect.top))
+                closest_enemy = spatial.closest(enemies, self.rect.top, edge="bottom")
                 
                 if abs(self.rect.left - closest_enemy.rect.left) <= self.speed:
                     self.rect.left = closest_enemy.rect.left
@@ -135,9 +665,9 @@ class Player(pygame.sprite.Sprite):
 
 
     def auto_fire(self):
-        current_time = pygame.time.get_ticks()
+        current_time = Manager.clock.get_ticks()
         if current_time - self.last_shot_time > self.shoot_cooldown:  
-            bullet = Bullet(self.screen, self.rect.left, self.rect.top)
+            bullet = Bullet.spawn(self.screen, self.rect.left, self.rect.top)
             self.bullets.add(bullet)
             Player.bullets.add(bullet)
             self.last_shot_time = current_time
@@ -146,61 +676,79 @@ class Player(pygame.sprite.Sprite):
         if not isinstance(reward, (int, float)):
             raise ValueError(f"Reward must be a number, got {type(reward)} instead.")
 
-        self.auto_control(enemy_bullets, enemies)  
+        # the reward was earned by the last action, which led to this state
+        state = self.agent.get_state(self, enemy_bullets, enemies)
+        if self.last_state is not None:
+            self.agent.remember(self.last_state, self.current_action, reward, state)
+
+        self.auto_control(state, enemy_bullets, enemies)  
         self.auto_fire()
-        self.display()
+        self.bullets.update()
+        self.last_state = state
 
-        # update q table
-        next_state = self.agent.get_state(self, enemy_bullets, enemies)
-        self.agent.learn(self.agent.get_state(self, enemy_bullets, enemies), self.current_action, reward, next_state)
+    def finish(self, reward):
+        # the last action ended the game
+        if self.last_state is not None:
+            self.agent.remember(self.last_state, self.current_action, reward, self.last_state, done=True)
+            self.last_state = None
 
     def display(self):
-        self.screen.blit(self.player, self.rect)
-        self.bullets.update()
-        self.bullets.draw(self.screen)
+        # headless runs have no screen, only the simulation advances
+        if self.screen is not None:
+            self.screen.blit(self.player, self.rect)
+            self.bullets.draw(self.screen)
 
     @classmethod
     def clear_bullets(cls):
-        cls.bullets.empty()
+        for bullet in cls.bullets.sprites():
+            bullet.kill()
 
-class Enemy(pygame.sprite.Sprite):
+class Enemy(PooledSprite):
     enemy_bullets = pygame.sprite.Group()
-    def __init__(self, screen):
-
-        pygame.sprite.Sprite.__init__(self)
-        # load player image
-        self.player = pygame.image.load("./images/enemy1.png") # 57 * 43
-
-        self.rect = self.player.get_rect()
-
-        x = random.randrange(1, Manager.bg_size[0], 50)
-        self.rect.topleft = [x, 0]
+    pool = None
 
-        self.speed = 2
+    def __init__(self, screen, kind=None, x=None):
+        self.create(screen)
+        self.reset(kind, x)
 
+    def create(self, screen):
+        pygame.sprite.Sprite.__init__(self)
+        self.kind = None  # EnemyType, set by reset()
         self.screen = screen
 
-        self.bullets = pygame.sprite.Group()
+    def reset(self, kind=None, x=None):
+        """
+        :param kind: EnemyType, None for the enemy of the original game.
+        :param x: Left edge, None for a random one.
+        """
+        kind = kind or DEFAULT_ENEMY
+        if kind is not self.kind:
+            # pooled enemies change type only when a different one is spawned
+            self.kind = kind
+            self.player = Assets.image(kind.image)
+            self.mask = Assets.mask(kind.image)
+            self.rect = self.player.get_rect()
+            self.speed = kind.speed
+            self.shoot_cooldown = kind.shoot_cooldown
+            self.muzzle = kind.muzzle or (self.rect.width / 2 - 6 / 2, self.rect.height)
+        if x is None:
+            x = random.randrange(1, Manager.bg_size[0], 50)
+        self.rect.topleft = [x, 0]
 
         self.direction = 'right'
 
         self.last_shot_time = 0  
-        self.shoot_cooldown = 500
-
 
     def display(self):
-         # draw player at the center of the screen
-        self.screen.blit(self.player, self.rect)    
-        
-        # display bullets
-        self.bullets.update()
-        self.bullets.draw(self.screen)
+        if self.screen is not None:
+            # draw player at the center of the screen
+            self.screen.blit(self.player, self.rect)
 
     def auto_move(self):
         if self.direction == 'right':
-            self.rect.left += 3
+            self.rect.left += self.kind.drift
         elif self.direction == 'left':
-            self.rect.left -= 3
+            self.rect.left -= self.kind.drift
 
         if self.rect.left < 0:  
             self.rect.left = 0
@@ -214,62 +762,81 @@ class Enemy(pygame.sprite.Sprite):
 
     def update(self):
         self.auto_move()
+        # gone below the screen
+        if self.rect.top > Manager.bg_size[1]:
+            self.kill()
+            return
         self.fire_bullet()
-        self.display()
     
     def fire_bullet(self):
-        current_time = pygame.time.get_ticks()
+        current_time = Manager.clock.get_ticks()
         if current_time - self.last_shot_time > self.shoot_cooldown:  
-            bullet = EnemyBullet(self.screen, self.rect.left, self.rect.top)
-            self.bullets.add(bullet)
+            bullet = EnemyBullet.spawn(self.screen, self.rect.left + self.muzzle[0], self.rect.top + self.muzzle[1],
+                                       self.kind.bullet_speed)
             Enemy.enemy_bullets.add(bullet)
             self.last_shot_time = current_time  
 
     @classmethod
     def clear_bullets(cls):
-        cls.enemy_bullets.empty()
+        for bullet in cls.enemy_bullets.sprites():
+            bullet.kill()
+
+class Bullet(PooledSprite):
+    pool = None
 
-class Bullet(pygame.sprite.Sprite):
     def __init__(self, screen, x, y):
+        self.create(screen)
+        self.reset(x, y)
 
+    def create(self, screen):
         pygame.sprite.Sprite.__init__(self)
 
         # load bullet image
-        self.image = pygame.image.load("./images/bullet1.png")
-
-        # location
+        self.image = Assets.image("./images/bullet1.png")
+        self.mask = Assets.mask("./images/bullet1.png")
         self.rect = self.image.get_rect()
-        self.rect.topleft = [x + 51 - 2, y - 11]
 
         self.screen = screen
 
         self.speed = 5
 
+    def reset(self, x, y):
+        # location
+        self.rect.topleft = [x + 51 - 2, y - 11]
+
     def update(self):
         # 
         self.rect.top -= self.speed
         if self.rect.top < -22:
             self.kill()
 
-class EnemyBullet(pygame.sprite.Sprite):
-    def __init__(self, screen, x, y):
+class EnemyBullet(PooledSprite):
+    pool = None
+
+    def __init__(self, screen, x, y, speed=2.5):
+        self.create(screen)
+        self.reset(x, y, speed)
 
+    def create(self, screen):
         pygame.sprite.Sprite.__init__(self)
 
         # load bullet image
-        self.image = pygame.image.load("./images/bullet2.png") # 5 * 11
-
-        # location
+        self.image = Assets.image("./images/bullet2.png") # 5 * 11
+        self.mask = Assets.mask("./images/bullet2.png")
         self.rect = self.image.get_rect()
-        self.rect.topleft = [x + 56/2 - 6/2, y + 43]
 
         self.screen = screen
 
         self.speed = 2.5
 
+    def reset(self, x, y, speed=2.5):
+        # location, the muzzle of the enemy that fired
+        self.rect.topleft = [x, y]
+        self.speed = speed
+
     def update(self):
         self.rect.top += self.speed
-        if self.rect.top > 852:
+        if self.rect.top > Manager.bg_size[1]:
             self.kill()
 
 class BGM(object):
@@ -278,7 +845,7 @@ class BGM(object):
         pygame.mixer.music.load("./sound/game_music.ogg")
         pygame.mixer.music.set_volume(0.5) # sound
 
-        self.__bomb = pygame.mixer.Sound("./sound/get_bomb.wav")
+        self.__bomb = Assets.sound("./sound/get_bomb.wav")
 
     def play(self):
         pygame.mixer.music.play(-1)
@@ -286,14 +853,23 @@ class BGM(object):
     def play_bomb(self):
         pygame.mixer.Sound.play(self.__bomb)
 
+class MuteBGM(object):
+    # stand-in for BGM when running without a mixer
+    def play(self):
+        pass
+
+    def play_bomb(self):
+        pass
+
 class Bomb(object):
     def __init__(self, screen, type):
         self.screen = screen
 
         if type == 'emeny':
-            self.mImages = [pygame.image.load("./images/enemy1_down" + str(v) + '.png') for v in range(1, 5)]
+            self.mFiles = ["./images/enemy1_down" + str(v) + '.png' for v in range(1, 5)]
         else:
-            self.mImages = [pygame.image.load("./images/me_destroy_" + str(v) + '.png') for v in range(1, 5)]
+            self.mFiles = ["./images/me_destroy_" + str(v) + '.png' for v in range(1, 5)]
+        self.mImages = None  # loaded on the first draw, headless runs never need them
 
         self.mIndex = 0
         self.mPos = [0,0]
@@ -306,8 +882,10 @@ class Bomb(object):
         self.mVisible = True
 
     def draw(self):
-        if not self.mVisible:
+        if not self.mVisible or self.screen is None:
             return
+        if self.mImages is None:
+            self.mImages = [Assets.image(path) for path in self.mFiles]
         self.screen.blit(self.mImages[self.mIndex], (self.mPos[0], self.mPos[1]))
         self.mIndex += 1
         if self.mIndex >= len(self.mImages):
@@ -315,18 +893,19 @@ class Bomb(object):
             self.mVisible = False
 
 class Map(object):
-    def __init__(self, screen):
-        self.mImage1 = pygame.image.load("./images/background.png")
-        self.mImage2 = pygame.image.load("./images/background.png")
+    def __init__(self, screen, speed=2):
+        self.mImage1 = Assets.image("./images/background.png")
+        self.mImage2 = self.mImage1  # the same image, drawn twice
 
         # window
         self.screen = screen
+        self.speed = speed  # pixels per frame, 0 keeps the background still
         self.y1 = 0
         self.y2 = -self.mImage1.get_height()
 
     def move(self):
-        self.y1 += 2
-        self.y2 += 2
+        self.y1 += self.speed
+        self.y2 += self.speed
 
         if self.y1 >= self.mImage1.get_height():
             self.y1 = -self.mImage1.get_height()
@@ -337,314 +916,779 @@ class Map(object):
         self.screen.blit(self.mImage1, (0, self.y1))
         self.screen.blit(self.mImage2, (0, self.y2))
 
+    def redraw(self):
+        """
+        Draw the background for a new frame. A scrolling one is drawn whole
+        and the frame pushed whole; a still one is only painted back where
+        the last frame drew.
+        """
+        if self.speed or self.screen.previous is None:
+            self.draw()
+            self.screen.mark_all()
+        else:
+            self.screen.clear(self.mImage1)
+
+class WallClock(object):
+    # real time clock backed by pygame, used by the windowed game
+    def get_ticks(self):
+        return pygame.time.get_ticks()
+
+    def set_timer(self, event_id, millis):
+        pygame.time.set_timer(event_id, millis)
+
+    def get_events(self):
+        return pygame.event.get()
+
+    def tick(self):
+        pass
+
+class SimClock(object):
+    """
+    Simulated clock for headless runs. Time only advances when tick() is
+    called, so spawns and cooldowns depend on the step count, not on how
+    fast the machine is.
+    :param tick_ms: Simulated milliseconds per step.
+    """
+    def __init__(self, tick_ms=10):
+        self.tick_ms = tick_ms
+        self.ticks = 0
+        self.timers = {}  # event id -> [interval, next due time]
+
+    def get_ticks(self):
+        return self.ticks
+
+    def set_timer(self, event_id, millis):
+        if millis <= 0:
+            self.timers.pop(event_id, None)
+        else:
+            self.timers[event_id] = [millis, self.ticks + millis]
+
+    def get_events(self):
+        events = []
+        for event_id, timer in self.timers.items():
+            while timer[1] <= self.ticks:
+                events.append(pygame.event.Event(event_id))
+                timer[1] += timer[0]
+        return events
+
+    def tick(self):
+        self.ticks += self.tick_ms
+
 class Manager:
     bg_size = (480, 700)
-    create_enemy_id = 10
     game_over_id = 11
     is_game_over = False
     score = 0  # score
-
-    def __init__(self):
-        pygame.init()
-        # create a window
-        self.screen = pygame.display.set_mode(Manager.bg_size, 0, 32)
-        # load background image
-        self.map = Map(self.screen)
+    clock = WallClock()  # time source for spawns and cooldowns
+    # reward weights of run_episode, copied to each Manager's rewards
+    default_rewards = {
+        "safe_distance": 40,  # pixels
+        "bullet_close": -10,  # nearest enemy bullet within safe_distance
+        "bullet_safe": 2,
+        "hit": 50,  # bullets hit an enemy
+        "kill": 5,  # per enemy destroyed
+        "enemy_close": 1,  # nearest enemy within safe_distance vertically
+        "enemy_far": -0.5,
+        "crash": -100,  # hit by an enemy bullet
+    }
+    # play mode (step) keeps its original shaping for the nearest enemy
+    default_play_rewards = dict(default_rewards, enemy_close=2, enemy_far=-1)
+
+    def __init__(self, headless=False, tick_ms=10, profile=False, profile_trace=None, scroll=True, record=None,
+                 policy=None, audio=True, load_q_table=True, agent_server=None, scenario=None, policy_store=None,
+                 invulnerable=False):
+        """
+        Only the pygame subsystems the mode needs are started: none when
+        headless, display and fonts for a window, and the mixer only with
+        audio. Images load when first used.
+        :param headless: Run the simulation without window, mixer or drawing.
+        :param tick_ms: Simulated milliseconds per step, in headless mode and in main().
+        :param profile: Time the phases of every frame in main(). F3 toggles the overlay either way.
+        :param profile_trace: CSV or .json file the per-frame timings are written to when main() ends.
+        :param scroll: Scroll the background. A still one lets each frame push only the regions that changed.
+        :param record: Directory to write a replay of every episode of main() to.
+        :param policy: Policy file compiled by policy.py to play with, instead of loading and learning the Q-table.
+        :param audio: Play music and sounds in a window.
+        :param load_q_table: Load the Q-table file now, False for an agent that is handed its table.
+        :param agent_server: Socket path of an agent_server.py to get actions from and send transitions to,
+            instead of a Q-table in this process.
+        :param scenario: Scenario file (see scenarios/) or Scenario for spawns and speeds, None for the original game.
+        :param policy_store: PolicyStore file to play from, like `policy` but swapping in every policy a
+            trainer publishes there while the game runs.
+        :param invulnerable: Hits still cost their reward but never end the episode, so stress runs reach
+            the dense end of a scenario.
+        """
+        self.created = time.perf_counter()
+        self.first_step = None  # time of the first simulated step
+        self.headless = headless
+        self.tick_ms = tick_ms
+        self.rewards = dict(Manager.default_rewards)
+        self.play_rewards = dict(Manager.default_play_rewards)
+        self.policy_store = policy_store
+        self.invulnerable = invulnerable
+        self.scenario = Scenario.load(scenario) if isinstance(scenario, str) else scenario or Scenario.default()
+        self.timelines = {}  # tick_ms -> compiled Timeline
+        self.timeline = None
+        self.spawn_origin = 0
+        self.spawn_tick = 0
+        self.recorder = Recorder(record) if record else None
+        self.profile_trace = profile_trace
+        self.profiler = FrameProfiler(enabled=profile or profile_trace is not None,
+                                      trace=profile_trace is not None)
+        if headless:
+            # no window and no mixer, time is simulated
+            Manager.clock = SimClock(tick_ms)
+            self.screen = None
+            self.map = None
+        else:
+            pygame.display.init()
+            pygame.font.init()
+            Manager.clock = WallClock()
+            # create a window, blits on it are tracked so only changed regions are pushed
+            self.screen = DirtyScreen(pygame.display.set_mode(Manager.bg_size, 0, 32))
+            # load background image
+            self.map = Map(self.screen, 2 if scroll else 0)
+        # recycled bullets and enemies
+        Bullet.pool = SpritePool(Bullet, self.screen, 32)
+        EnemyBullet.pool = SpritePool(EnemyBullet, self.screen, 64)
+        Enemy.pool = SpritePool(Enemy, self.screen, 8)
         # init a group for players
         self.players = pygame.sprite.Group()
         # init a group for enemies
         self.enemies = pygame.sprite.Group()
+        # spatial indexes of enemies and enemy bullets, rebuilt every tick
+        self.enemy_grid = spatial.SpatialGrid(*Manager.bg_size)
+        self.bullet_grid = spatial.SpatialGrid(*Manager.bg_size)
+        # collision tests of the last rendered frame, which may run several ticks, counted by main()
+        self.frame_tests = {"broad": 0, "narrow": 0}
         # bomb
         self.player_bomb = Bomb(self.screen, 'me')
         self.enemy_bomb = Bomb(self.screen, 'emeny')
         # load bgm
-        self.sound = BGM()
-        self.agent = QLearningAgent(actions=["UP", "DOWN", "LEFT", "RIGHT", "AVOID"])
+        self.sound = BGM() if audio and not headless else MuteBGM()
+        if policy:
+            self.agent = FrozenAgent.load(policy)
+        elif policy_store:
+            self.agent = FrozenAgent.watch(policy_store, ["UP", "DOWN", "LEFT", "RIGHT", "AVOID"])
+        elif agent_server:
+            self.agent = RemoteAgent(agent_server)
+        else:
+            self.agent = QLearningAgent(actions=["UP", "DOWN", "LEFT", "RIGHT", "AVOID"], load=load_q_table)
+        self.ready = time.perf_counter()
+
+    def startup(self):
+        """
+        Startup times in ms: importing this module, building the Manager,
+        and from the Manager and from the start of the import to the first
+        simulated step. A forked process inherits the import of its parent.
+        """
+        times = {
+            "import_ms": (IMPORT_FINISHED - IMPORT_STARTED) * 1000,
+            "manager_ms": (self.ready - self.created) * 1000,
+        }
+        if self.first_step is not None:
+            times["first_step_ms"] = (self.first_step - self.created) * 1000
+            times["import_to_first_step_ms"] = (self.first_step - IMPORT_STARTED) * 1000
+        return times
 
     def exit(self):
         print("quit")
+        self.dump_profile()
         pygame.quit()
         exit()
 
     def new_player(self):
         player = Player(self.screen, self.agent)
+        for name, value in self.scenario.player.items():
+            setattr(player, name, value)
         self.players.add(player)
 
-    def new_enemy(self):
-        enemy = Enemy(self.screen)
+    def new_enemy(self, kind=None, x=None):
+        enemy = Enemy.spawn(self.screen, kind, x)
         self.enemies.add(enemy)
+        if self.recorder is not None:
+            self.recorder.spawn(enemy.rect.left)
+
+    def start_spawns(self):
+        # the scenario timeline starts over at the current tick
+        self.timeline = self.timelines.get(self.tick_ms)
+        if self.timeline is None:
+            self.timeline = self.timelines[self.tick_ms] = self.scenario.compile(self.tick_ms)
+        self.spawn_origin = Manager.clock.get_ticks()
+        self.spawn_tick = 0  # next timeline tick to spawn
+
+    def spawn_enemies(self):
+        # every timeline tick up to now, one per step on the simulated clock
+        now = (Manager.clock.get_ticks() - self.spawn_origin) // self.tick_ms
+        while self.spawn_tick <= now:
+            for kind, x in self.timeline.at(self.spawn_tick):
+                self.new_enemy(kind, x)
+            self.spawn_tick += 1
+
+    def dump_profile(self):
+        if self.profile_trace and self.profiler.frames:
+            self.profiler.dump(self.profile_trace)
 
     def drawText(self, text,x ,y, textHeight=30, fontColor=(255,0,0), backgroundColor=None):
-        font = pygame.font.Font(None, textHeight)
-        textImage = font.render(text, True, fontColor, backgroundColor)
+        textImage = Assets.text(text, textHeight, fontColor, backgroundColor)
         text_rect = textImage.get_rect()
         text_rect.topleft = (x, y)
-        self.screen.blit(textImage, text_rect)
+        return self.screen.blit(textImage, text_rect)
 
     def reset_game(self):
         Manager.is_game_over = False  
         Manager.score = 0 
         self.players.empty() 
-        self.enemies.empty() 
+        for enemy in self.enemies.sprites():
+            enemy.kill()
         Player.clear_bullets()  
         Enemy.clear_bullets()  
+        self.rebuild_grids()
         self.new_player()  
 
-    def train(self, episodes=1000, max_steps=500):
+    def start_episode(self, seed=None):
         """
-        Train the agent using Q-learning.
-        :param episodes: Number of training episodes.
+        Start the clock of a new episode of main(). When recording, the
+        RNGs are reseeded so that the episode can be played back.
+        :param seed: Seed for random and np.random, None for a fresh one when recording.
+        """
+        Manager.clock = SimClock(self.tick_ms)
+        self.start_spawns()
+        if seed is None and self.recorder is not None:
+            seed = random.randrange(2 ** 32)
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+        if self.recorder is not None:
+            self.recorder.begin(seed, self.tick_ms)
+
+    def end_episode(self):
+        # tell the agent, so returns and traces of a cut short episode do not leak into the next one
+        end_episode = getattr(self.agent, "end_episode", None)
+        if end_episode is not None:
+            end_episode()
+
+    def restart(self):
+        self.end_episode()
+        self.reset_game()
+        self.start_episode()
+
+    def update_enemies(self):
+        self.enemies.update()
+        # enemy bullets move on their own, also after the enemy that fired them is gone
+        Enemy.enemy_bullets.update()
+
+    def entity_counts(self):
+        """
+        Live sprites and pool usage, to check that memory stays bounded.
+        """
+        return {
+            "players": len(self.players),
+            "enemies": len(self.enemies),
+            "bullets": len(Player.bullets),
+            "enemy_bullets": len(Enemy.enemy_bullets),
+            # collision tests this tick, rects and then masks of the pairs whose rects overlap
+            "broad": self.enemy_grid.broad + self.bullet_grid.broad,
+            "narrow": self.enemy_grid.narrow + self.bullet_grid.narrow,
+            "pools": {
+                "enemy": Enemy.pool.stats(),
+                "bullet": Bullet.pool.stats(),
+                "enemy_bullet": EnemyBullet.pool.stats(),
+            },
+        }
+
+    def collision_tests(self):
+        # rect and mask tests since the start, over both grids
+        return (self.enemy_grid.broad_total + self.bullet_grid.broad_total,
+                self.enemy_grid.narrow_total + self.bullet_grid.narrow_total)
+
+    def rebuild_grids(self):
+        self.enemy_grid.rebuild(self.enemies)
+        self.bullet_grid.rebuild(Enemy.enemy_bullets)
+
+    def run_episode(self, max_steps=500, episode=0, episodes=1):
+        """
+        Play one training episode, one remembered transition per step.
         :param max_steps: Maximum steps per episode.
+        :param episode: Index of this episode, for the on-screen counter.
+        :param episodes: Total number of episodes, for the on-screen counter.
+        :return: (total reward, steps played)
         """
-        # Initialize the Q table
-        self.agent.load_q_table()
-
-        for episode in range(episodes):
-            # Reset game environment
-            self.reset_game()
-            # self.new_player()
-            pygame.time.set_timer(Manager.create_enemy_id, 1000)
-
-            player = self.players.sprites()[0]
-            state = self.agent.get_state(player, self.enemies, Enemy.enemy_bullets)
-            total_reward = 0
-
-            for step in range(max_steps):
+        # Reset game environment
+        self.reset_game()
+        # self.new_player()
+        self.start_spawns()
+
+        player = self.players.sprites()[0]
+        total_reward = 0
+        steps = 0  # steps played, the one that ends the episode included
+
+        for _ in range(max_steps):
+            steps += 1
+            if not self.headless:
                 self.map.move()
-                self.map.draw()
+                self.map.redraw()
 
                 self.drawText(f'Episode: {episode + 1}/{episodes}', 0, 0)
                 self.drawText(f'Score: {Manager.score}', 0, 30)
 
-                reward = 0 
-                safe_distance = 40  
-
-                # generate enemy
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        # save the q table
-                        self.agent.save_q_table()
-                        self.exit()
-                    elif event.type == Manager.create_enemy_id:
-                        self.new_enemy()
-
-                action = self.agent.choose_action(state)
-
-                
-                if action == 0: 
-                    player.move_up()
-                elif action == 1:  
-                    player.move_down()
-                elif action == 2:  
-                    player.move_left()
-                elif action == 3: 
-                    player.move_right()
-                elif action == 4:  
-                    player.shoot()
-
-               
-                if Enemy.enemy_bullets:
-                    closest_bullet = min(Enemy.enemy_bullets, key=lambda b: abs(b.rect.top - player.rect.top))
-                    distance_x = abs(player.rect.left - closest_bullet.rect.left)
-                    distance_y = abs(player.rect.top - closest_bullet.rect.top)
-
-                    if distance_x < safe_distance and distance_y < safe_distance:  
-                        reward -= 10 
-                    else:
-                        reward += 2  
-
-                # Rewards for hitting enemy aircraft
-                is_enemy = pygame.sprite.groupcollide(Player.bullets, self.enemies, True, False)
-                if is_enemy:
-                    reward += 50  
-                    for bullet, enemies in is_enemy.items():
-                        for enemy in enemies:
-                            self.enemy_bomb.action(enemy.rect)
-                            self.sound.play_bomb()
-                            Manager.score += 10
-                            self.enemies.remove(enemy)
-                            reward += 5  # Extra incentives to encourage sustained attacks
-
-                # Check the distance between the player and the enemy aircraft
-                if self.enemies:
-                    closest_enemy = min(self.enemies, key=lambda e: abs(e.rect.top - player.rect.top))
-                    distance_to_enemy = abs(player.rect.top - closest_enemy.rect.top)
-                    if distance_to_enemy < safe_distance:  
-                        reward += 1  
-                    else:
-                        reward -= 0.5  
-
-                # Penalty for being hit by enemy aircraft bullets
-                if player.rect.top > 5 and player.rect.bottom < 695:
-                    isover = pygame.sprite.spritecollide(player, Enemy.enemy_bullets, True)
-                    if isover:
-                        reward -= 100
-                        Manager.is_game_over = True
-                        pygame.time.set_timer(Manager.game_over_id, 1000)
-                        self.player_bomb.action(player.rect)
-                        self.players.remove(player)
-                        self.sound.play_bomb()
-                        break  
-
-                # Calculate the next state
-                next_state = self.agent.get_state(player, self.enemies, Enemy.enemy_bullets)
-
-                # update the next state
-                self.agent.learn(state, action, reward, next_state)
-
-                # Update the current state 
-                state = next_state
-
-                # Cumulative rewards
-                total_reward += reward
-
-                # Updating players and enemy aircraft
-                self.players.update(Enemy.enemy_bullets, self.enemies, reward)
-                self.enemies.update()
-
-                # Dynamic adjustment of the exploration rate
-                self.agent.update_epsilon()
-
-                # pygame.display.update()
-                # time.sleep(0.01)
+            reward = 0 
+            weights = self.rewards
+            safe_distance = weights["safe_distance"]
 
-            print(f'Episode {episode + 1}/{episodes} ended with total reward: {total_reward}, score: {Manager.score}')
-
-            self.agent.save_q_table()
-
-        print("Training completed and Q-table saved!")
-
-
-
-
-    def main(self):
-        # play music
-        self.sound.play()
-        self.new_player()
-        pygame.time.set_timer(Manager.create_enemy_id, 1000)
-
-        # load q table
-        self.agent.load_q_table()
-
-        while True:
-            # auto move map
-            self.map.move()
-            self.map.draw()
-            # draw score
-            self.drawText(f'Score: {Manager.score}', 0, 0)
-
-            reward = 0  # init reward
-            safe_distance = 40  # init the safe distance
-
-            for event in pygame.event.get():
+            # generate enemy
+            self.spawn_enemies()
+            for event in Manager.clock.get_events():
                 if event.type == pygame.QUIT:
-                    # save q table
+                    # save the q table
                     self.agent.save_q_table()
                     self.exit()
-                elif event.type == Manager.create_enemy_id:
-                    self.new_enemy()
-
-            player = self.players.sprites()[0]
-
-            # bomb attack
-            self.player_bomb.draw()
-            self.enemy_bomb.draw()
-
-            # collision detection
-            iscollide = pygame.sprite.groupcollide(self.players, self.enemies, True, True)
-            if iscollide:
-                items = list(iscollide.items())[0]  
-                print(items)
-                x = items[0]  
-                y = items[1][0]  
-
-                # bomb attack
-                self.player_bomb.action(x.rect)
-                self.enemy_bomb.action(y.rect)
-                self.sound.play_bomb()
 
-                # game over
-                Manager.is_game_over = True
-                pygame.time.set_timer(Manager.game_over_id, 1000)
+            self.rebuild_grids()
 
-            if Enemy.enemy_bullets:
-                closest_bullet = min(Enemy.enemy_bullets, key=lambda b: abs(b.rect.top - player.rect.top))
+            if self.bullet_grid:
+                closest_bullet = self.bullet_grid.nearest_y(player.rect.top)
                 distance_x = abs(player.rect.left - closest_bullet.rect.left)
                 distance_y = abs(player.rect.top - closest_bullet.rect.top)
 
-                if distance_x < safe_distance and distance_y < safe_distance:
-                    reward -= 10
+                if distance_x < safe_distance and distance_y < safe_distance:  
+                    reward += weights["bullet_close"]
                 else:
-                    reward += 2 
-
+                    reward += weights["bullet_safe"]
 
-            is_enemy = pygame.sprite.groupcollide(Player.bullets, self.enemies, True, False)
+            # Rewards for hitting enemy aircraft
+            is_enemy = spatial.groupcollide(Player.bullets, self.enemy_grid, True, False)
             if is_enemy:
-                reward += 50  
+                reward += weights["hit"]
                 for bullet, enemies in is_enemy.items():
                     for enemy in enemies:
                         self.enemy_bomb.action(enemy.rect)
                         self.sound.play_bomb()
                         Manager.score += 10
-                        self.enemies.remove(enemy)
-                        reward += 5  
+                        enemy.kill()
+                        self.enemy_grid.remove(enemy)
+                        reward += weights["kill"]  # Extra incentives to encourage sustained attacks
 
-        
-            if self.enemies:
-                closest_enemy = min(self.enemies, key=lambda e: abs(e.rect.top - player.rect.top))
+            # Check the distance between the player and the enemy aircraft
+            if self.enemy_grid:
+                closest_enemy = self.enemy_grid.nearest_y(player.rect.top)
                 distance_to_enemy = abs(player.rect.top - closest_enemy.rect.top)
                 if distance_to_enemy < safe_distance:  
-                    reward += 2  
+                    reward += weights["enemy_close"]
                 else:
-                    reward -= 1
+                    reward += weights["enemy_far"]
 
-          
+            # Penalty for being hit by enemy aircraft bullets
             if player.rect.top > 5 and player.rect.bottom < 695:
-                isover = pygame.sprite.spritecollide(player, Enemy.enemy_bullets, True)
+                isover = self.bullet_grid.collide(player.rect, True, player.mask)
                 if isover:
-                    reward -= 100
+                    reward += weights["crash"]
                     Manager.is_game_over = True
-                    pygame.time.set_timer(Manager.game_over_id, 1000)
+                    Manager.clock.set_timer(Manager.game_over_id, 1000)
                     self.player_bomb.action(player.rect)
                     self.players.remove(player)
                     self.sound.play_bomb()
+                    player.finish(reward)
+                    break  
+
+            # Cumulative rewards
+            total_reward += reward
+
+            # Updating players and enemy aircraft, the player learns from the reward of its last action
+            self.players.update(self.bullet_grid, self.enemy_grid, reward)
+            self.update_enemies()
+            if not self.headless:
+                self.draw_sprites()
+
+            # Dynamic adjustment of the exploration rate
+            self.agent.update_epsilon()
+
+            # advance simulated time (no-op for the wall clock)
+            Manager.clock.tick()
+            if self.first_step is None:
+                self.first_step = time.perf_counter()
+
+            # pygame.display.update()
+            # time.sleep(0.01)
+
+        self.end_episode()
+        return total_reward, steps
+
+    def train(self, episodes=1000, max_steps=500, seed=None, checkpoint_episodes=1, checkpoint_seconds=None,
+              metrics=None, publish=None, publish_episodes=10):
+        """
+        Train the agent using Q-learning.
+        :param episodes: Number of training episodes.
+        :param max_steps: Maximum steps per episode.
+        :param seed: Seed for enemy spawns and exploration, for repeatable headless runs.
+        :param checkpoint_episodes: Checkpoint the Q-table every this many episodes, None to disable.
+        :param checkpoint_seconds: Checkpoint the Q-table every this many seconds, None to disable.
+        :param metrics: JSONL file to append a record of every episode to, see telemetry.py.
+        :param publish: PolicyStore file to publish the greedy policy to, for games playing with `policy_store`.
+        :param publish_episodes: Publish every this many episodes, and once more at the end.
+        """
+        if publish and not hasattr(self.agent, "q_table"):
+            raise ValueError("Only an agent with a local Q-table can publish a policy.")
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+
+        # Initialize the Q table
+        self.agent.load_q_table()
+        # saves changed states in the background, a remote agent's table is saved by its server
+        checkpointer = Checkpointer(self.agent, checkpoint_episodes, checkpoint_seconds) \
+            if hasattr(self.agent, "snapshot") else None
+        metrics_log = MetricsLog(metrics) if metrics else None
+        store = PolicyStore(publish, writable=True) if publish else None
+
+        try:
+            for episode in range(episodes):
+                start = time.perf_counter()
+                total_reward, steps = self.run_episode(max_steps, episode, episodes)
+                seconds = time.perf_counter() - start
+
+                print(f'Episode {episode + 1}/{episodes} ended with total reward: {total_reward}, score: {Manager.score}')
+                if episode == 0:
+                    times = self.startup()
+                    # an episode that ended before its first tick has no first step time
+                    first_step = times.get("import_to_first_step_ms")
+                    first_step = "none yet" if first_step is None else f"{first_step:.0f} ms after the import started"
+                    print(f'Startup: import {times["import_ms"]:.0f} ms, Manager {times["manager_ms"]:.0f} ms, '
+                          f'first step {first_step}')
+
+                saved = checkpointer is not None and checkpointer.episode_done()
+                published = store is not None and ((episode + 1) % publish_episodes == 0 or episode + 1 == episodes)
+                if published:
+                    publish_start = time.perf_counter()
+                    self.publish_policy(store)
+                    publish_seconds = time.perf_counter() - publish_start
+                if metrics_log is not None:
+                    metrics_log.log(
+                        episode=episode + 1, reward=total_reward, score=Manager.score, steps=steps,
+                        epsilon=getattr(self.agent, "epsilon", None),
+                        q_table_size=len(self.agent.q_table) if hasattr(self.agent, "q_table") else None,
+                        steps_per_sec=steps / seconds,
+                        # time the loop spent copying changed states, and the last write the writer finished
+                        checkpoint_ms=1000 * checkpointer.last_snapshot_seconds if saved else None,
+                        checkpoint_write_ms=1000 * checkpointer.last_write_seconds if saved else None,
+                        publish_ms=1000 * publish_seconds if published else None,
+                    )
+        finally:
+            if store is not None:
+                store.close()
+            if metrics_log is not None:
+                metrics_log.close()
+            if checkpointer is not None:
+                checkpointer.close()
+            else:
+                self.agent.save_q_table()
+
+        print("Training completed and Q-table saved!")
+        stats = self.agent.stats() if hasattr(self.agent, "stats") else None
+        if stats is not None:
+            print(f"Agent: {stats}")
+
+
+
+
+    def publish_policy(self, store):
+        """
+        Compile the agent's greedy policy and make it the newest generation of `store`.
+        """
+        policy = FrozenPolicy.compile(self.agent.q_table, self.agent.actions)
+        return store.publish(policy)
+
+    def step(self, auto_restart=False):
+        """
+        Advance the game by one fixed tick of simulated time: spawns,
+        collisions, rewards, learning and movement. Nothing is drawn.
+        :param auto_restart: Restart right away after game over, otherwise leave it to main().
+        """
+        profiler = self.profiler
+        reward = 0  # init reward
+        weights = self.play_rewards
+        safe_distance = weights["safe_distance"]
+
+        # generate enemy
+        self.spawn_enemies()
+        profiler.mark("events")
+
+        self.rebuild_grids()
+        player = self.players.sprites()[0]
+
+        # collision detection
+        iscollide = spatial.groupcollide(self.players, self.enemy_grid, not self.invulnerable, True)
+        if iscollide and self.invulnerable:
+            reward += weights["crash"]
+        elif iscollide:
+            items = list(iscollide.items())[0]  
+            x = items[0]  
+            y = items[1][0]  
+
+            # bomb attack
+            self.player_bomb.action(x.rect)
+            self.enemy_bomb.action(y.rect)
+            self.sound.play_bomb()
 
             # game over
-            if Manager.is_game_over:
-                while Manager.is_game_over:  
-                    self.map.draw()
-                    self.drawText(f'Score: {Manager.score}', 150, 300, 50, (255, 255, 255))
-                    
-                    
-                    button_rect = pygame.Rect(150, 400, 200, 50)  
-                    pygame.draw.rect(self.screen, (0, 255, 0), button_rect) 
-                    self.drawText("Restart", 180, 410, 40, (0, 0, 0)) 
-                    # check if player is dead
+            Manager.is_game_over = True
+            Manager.clock.set_timer(Manager.game_over_id, 1000)
+        profiler.mark("collisions")
+
+        if self.bullet_grid:
+            closest_bullet = self.bullet_grid.nearest_y(player.rect.top)
+            distance_x = abs(player.rect.left - closest_bullet.rect.left)
+            distance_y = abs(player.rect.top - closest_bullet.rect.top)
+
+            if distance_x < safe_distance and distance_y < safe_distance:
+                reward += weights["bullet_close"]
+            else:
+                reward += weights["bullet_safe"]
+
+
+        is_enemy = spatial.groupcollide(Player.bullets, self.enemy_grid, True, False)
+        if is_enemy:
+            reward += weights["hit"]
+            for bullet, enemies in is_enemy.items():
+                for enemy in enemies:
+                    self.enemy_bomb.action(enemy.rect)
+                    self.sound.play_bomb()
+                    Manager.score += 10
+                    enemy.kill()
+                    self.enemy_grid.remove(enemy)
+                    reward += weights["kill"]
+
+    
+        if self.enemy_grid:
+            closest_enemy = self.enemy_grid.nearest_y(player.rect.top)
+            distance_to_enemy = abs(player.rect.top - closest_enemy.rect.top)
+            if distance_to_enemy < safe_distance:  
+                reward += weights["enemy_close"]
+            else:
+                reward += weights["enemy_far"]
+
+      
+        if player.rect.top > 5 and player.rect.bottom < 695:
+            isover = self.bullet_grid.collide(player.rect, True, player.mask)
+            if isover and self.invulnerable:
+                reward += weights["crash"]
+            elif isover:
+                reward += weights["crash"]
+                Manager.is_game_over = True
+                Manager.clock.set_timer(Manager.game_over_id, 1000)
+                self.player_bomb.action(player.rect)
+                self.players.remove(player)
+                self.sound.play_bomb()
+        profiler.mark("rewards")
+
+        # game over
+        if Manager.is_game_over:
+            player.finish(reward)
+            if self.recorder is not None:
+                path = self.recorder.end(Manager.score)
+                if path:
+                    print(f"Replay saved to {path}")
+            if auto_restart:
+                self.restart()
+            return
+
+        self.players.update(self.bullet_grid, self.enemy_grid, reward) 
+        if self.recorder is not None:
+            self.recorder.act(self.agent.action_index.get(player.current_action, 255))
+        profiler.mark("players")
+        self.update_enemies()
+        self.agent.update_epsilon()
+        Manager.clock.tick()
+        if self.first_step is None:
+            self.first_step = time.perf_counter()
+        profiler.mark("enemies")
+
+    def draw_sprites(self):
+        for player in self.players:
+            player.display()
+        for enemy in self.enemies:
+            enemy.display()
+        Enemy.enemy_bullets.draw(self.screen)
+
+    def draw(self):
+        profiler = self.profiler
+        self.map.redraw()
+        profiler.mark("map")
+        # draw score
+        self.drawText(f'Score: {Manager.score}', 0, 0)
+        profiler.mark("text")
+        # bomb attack
+        self.player_bomb.draw()
+        self.enemy_bomb.draw()
+        self.draw_sprites()
+        profiler.mark("draw")
+        if profiler.show_overlay:
+            # per frame rather than per tick, so the numbers do not depend on how many ticks the frame ran
+            profiler.draw_overlay(self.screen, dict(self.entity_counts(), **self.frame_tests))
+            profiler.mark("overlay")
+
+    def wait_game_over(self):
+        """
+        Show the game over screen once and block on events until the
+        restart button is clicked.
+        """
+        self.map.draw()
+        self.screen.mark_all()
+        self.drawText(f'Score: {Manager.score}', 150, 300, 50, (255, 255, 255))
+        button_rect = pygame.Rect(150, 400, 200, 50)  
+        pygame.draw.rect(self.screen.surface, (0, 255, 0), button_rect) 
+        self.drawText("Restart", 180, 410, 40, (0, 0, 0)) 
+        self.screen.update()
+
+        while Manager.is_game_over:  
+            event = pygame.event.wait()
+            if event.type == pygame.QUIT:
+                self.exit()
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                if button_rect.collidepoint(event.pos):  
+                    self.restart() 
+            elif event.type == pygame.WINDOWEXPOSED:
+                pygame.display.update()
+
+    def play_back(self, path, render=False, fps=0):
+        """
+        Re-simulate a recorded episode from its seed and actions, at full
+        speed or, with `render`, on screen at `fps` (0 for uncapped). The
+        Q-table is neither used nor changed.
+        :param path: Replay file written by a recording Manager.
+        :return: Dict with the replayed and recorded ticks and score, and
+            whether the replay matched the recording.
+        """
+        recording = Recording.load(path)
+        agent, recorder, tick_ms = self.agent, self.recorder, self.tick_ms
+        self.agent = ReplayAgent(recording, agent.actions)
+        # recorded again in memory, to compare with the file
+        self.recorder = Recorder(None)
+        self.tick_ms = recording.tick_ms
+        try:
+            self.reset_game()
+            self.start_episode(recording.seed)
+            clock = pygame.time.Clock()
+            # the episode ends on the tick after the last recorded action
+            for _ in range(len(recording) + 1):
+                if render:
                     for event in pygame.event.get():
                         if event.type == pygame.QUIT:
                             self.exit()
-                        elif event.type == pygame.MOUSEBUTTONDOWN:
-                            mouse_pos = event.pos
-                            if button_rect.collidepoint(mouse_pos):  
-                                self.reset_game() 
-
-                    pygame.display.update()
-                    time.sleep(0.01)
-                    
-            self.players.update(Enemy.enemy_bullets, self.enemies, reward) 
-            self.enemies.update()
-            self.agent.update_epsilon()
-            pygame.display.update()
-            time.sleep(0.01)
+                    self.map.move()
+                self.step()
+                if render:
+                    self.draw()
+                    self.screen.update()
+                    clock.tick(fps)
+                if Manager.is_game_over:
+                    break
+            replayed = self.recorder.last or self.recorder.recording
+        finally:
+            self.agent, self.recorder, self.tick_ms = agent, recorder, tick_ms
+
+        return {
+            "ticks": len(replayed),
+            "score": Manager.score,
+            "recorded_ticks": len(recording),
+            "recorded_score": recording.score,
+            "matches": Manager.is_game_over and replayed.actions == recording.actions and
+                       replayed.spawns == recording.spawns and Manager.score == recording.score,
+        }
+
+    def main(self, max_frames=None, fps=60, speed=1, auto_restart=False, async_learn=False):
+        """
+        Run the game with the trained agent. The game advances in fixed
+        ticks of tick_ms simulated milliseconds, apart from rendering: each
+        frame runs the ticks owed for the real time since the last frame,
+        times `speed`, then draws once, so game speed does not depend on
+        how heavy a frame is.
+        :param max_frames: Return after this many rendered frames, None to run until the window is closed.
+        :param fps: Target rendered frames per second, 0 to run uncapped with `speed` ticks per frame.
+        :param speed: Fast-forward multiplier, simulated time per real time.
+        :param auto_restart: Restart right away after game over instead of waiting for the button.
+        :param async_learn: Learn on a separate thread; the game only looks actions up in a policy snapshot.
+        :return: Number of frames rendered.
+        """
+        if async_learn:
+            self.agent = AsyncAgent(self.agent)
+        # play music
+        self.sound.play()
+        # spawns and cooldowns follow game time, not the wall clock
+        self.restart()
+
+        # load q table
+        self.agent.load_q_table()
+        if async_learn:
+            self.agent.start()
+
+        profiler = self.profiler
+        clock = pygame.time.Clock()
+        lag = 0.0  # simulated ms owed to the game
+        max_lag = 250 * speed  # a stall is dropped instead of caught up in one burst
+        frame = 0
+        while max_frames is None or frame < max_frames:
+            frame += 1
+            profiler.begin_frame()
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    # save q table
+                    self.agent.save_q_table()
+                    self.exit()
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    profiler.toggle_overlay()
+            if self.policy_store:
+                # a trainer may have published a newer policy since the last frame
+                self.agent.reload()
+            profiler.mark("input")
+
+            if fps:
+                lag = min(lag + clock.get_time() * speed, max_lag)
+                ticks = int(lag // self.tick_ms)
+                lag -= ticks * self.tick_ms
+            else:
+                ticks = max(1, round(speed))
+            broad, narrow = self.collision_tests()
+            for _ in range(ticks):
+                # auto move map
+                self.map.move()
+                self.step(auto_restart)
+                if Manager.is_game_over:
+                    break
+            broad_total, narrow_total = self.collision_tests()
+            self.frame_tests = {"broad": broad_total - broad, "narrow": narrow_total - narrow}
+
+            self.draw()
+            self.screen.update()
+            profiler.mark("flip")
+
+            if Manager.is_game_over:
+                self.wait_game_over()
+                # the time spent waiting is not owed to the game
+                clock.tick()
+                lag = 0.0
+            clock.tick(fps)
+            profiler.mark("wait")
+            profiler.end_frame()
+
+        if async_learn:
+            self.agent.stop()
+            self.agent = self.agent.agent
+        self.dump_profile()
+        return frame
+
 
+IMPORT_FINISHED = time.perf_counter()
 
 if __name__ == "__main__":
-    manager = Manager()
     # Choose whether to train or run the game
     mode = input("Enter 'train' to train AI or 'play' to test AI: ").strip().lower()
     if mode == "train":
-        manager.train(episodes=100, max_steps=1000)  # train 1000 times
+        # training never shows a frame, so run it headless on simulated time
+        manager = Manager(headless=True)
+        manager.train(episodes=100, max_steps=1000, metrics="metrics.jsonl")  # train 1000 times
     elif mode == "play":
+        manager = Manager()
         manager.main() 
     else:
         print("Invalid mode. Please enter 'train' or 'play'.")
\ No newline at end of file
@@ -0,0 +1,215 @@
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from checkpoint import read_checkpoint
+from qtable import ArrayQTable
+
+MAGIC = b"SPOL"
+VERSION = 1
+# magic, version, metadata length
+HEADER = struct.Struct("<4sBI")
+ALIGN = 64
+
+STORE_MAGIC = b"SPST"
+STORE_VERSION = 1
+# magic, version, generation; the generation is 8-byte aligned so it is written in one store
+STORE_HEADER = struct.Struct("<4sB3xQ")
+GENERATION_OFFSET = 8
+GENERATION = struct.Struct("<Q")
+
+
+class FrozenPolicy(object):
+    """
+    Read-only greedy policy compiled from a Q-table: one action index per
+    encoded state, over the same mixed-radix encoding as ArrayQTable, with
+    a fallback action for states the table never saw and states outside
+    the bounds. The file is a small header followed by the uint8 array, so
+    load() memory-maps it and only the pages that are looked up are read.
+    :param table: uint8 array of action indices, one per encoded state.
+    :param actions: Action names.
+    :param fallback: Action for unknown states.
+    :param bounds: Size of each state component.
+    """
+    def __init__(self, table, actions, fallback, bounds=ArrayQTable.bounds, states=0):
+        self.table = table
+        self.view = memoryview(table)  # plain ints on indexing, cheaper than NumPy scalars
+        self.actions = list(actions)
+        self.action_index = {a: i for i, a in enumerate(self.actions)}
+        self.fallback = fallback
+        self.bounds = tuple(bounds)
+        self.states = states  # states compiled from the Q-table
+        # multiplier of each component in the encoding
+        self.strides = [int(np.prod(self.bounds[i + 1:])) for i in range(len(self.bounds))]
+
+    @classmethod
+    def compile(cls, q_table, actions, fallback="AVOID", bounds=ArrayQTable.bounds):
+        """
+        Build the policy from a Q-table in the dict-of-dicts pickle format,
+        or from an ArrayQTable over the same bounds.
+        """
+        actions = list(actions)
+        table = np.full(int(np.prod(bounds)), actions.index(fallback), np.uint8)
+        if isinstance(q_table, ArrayQTable) and tuple(bounds) == q_table.bounds:
+            # codes are already encoded over the bounds, states outside them are in the overflow dict
+            codes = q_table.codes[:q_table.size]
+            known = codes >= 0
+            columns = [actions.index(a) for a in q_table.actions]
+            best = np.argmax(q_table.values[:q_table.size][known], axis=1)  # first of equal values
+            table[codes[known]] = np.asarray(columns, np.uint8)[best]
+            return cls(table, actions, fallback, bounds, int(known.sum()))
+        states = 0
+        for state, q in q_table.items():
+            if all(0 <= v < size for v, size in zip(state, bounds)):
+                best = max(q, key=q.get)  # first of equal values, like choose_action
+                table[np.ravel_multi_index(state, bounds)] = actions.index(best)
+                states += 1
+        return cls(table, actions, fallback, bounds, states)
+
+    def save(self, path):
+        meta = json.dumps({"actions": self.actions, "fallback": self.fallback,
+                           "bounds": self.bounds, "states": self.states}).encode()
+        offset = HEADER.size + len(meta)
+        padding = -offset % ALIGN
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(meta) + padding))
+            f.write(meta + b" " * padding)
+            f.write(np.ascontiguousarray(self.table).data)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            magic, version, meta_size = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} policy file.")
+            meta = json.loads(f.read(meta_size))
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        table = np.frombuffer(data, np.uint8, int(np.prod(meta["bounds"])), HEADER.size + meta_size)
+        return cls(table, meta["actions"], meta["fallback"], meta["bounds"], meta["states"])
+
+    def swap(self, policy):
+        # take over another policy's table, e.g. a newer one from a PolicyStore
+        self.__init__(policy.table, policy.actions, policy.fallback, policy.bounds, policy.states)
+
+    def choose_action(self, state):
+        code = 0
+        for value, size, stride in zip(state, self.bounds, self.strides):
+            if not 0 <= value < size:
+                return self.fallback
+            code += value * stride
+        return self.actions[self.view[code]]
+
+
+class PolicyStore(object):
+    """
+    A versioned FrozenPolicy shared between one publishing trainer and
+    any number of players. `path` is a small memory-mapped header holding
+    a generation counter; generation g lives in the policy file `path.g`.
+    publish() writes the next policy file under a temporary name, renames
+    it into place and only then bumps the counter, so a reader that sees
+    generation g always finds a complete `path.g`. Readers check for a new
+    policy with a single read of the mapped counter, and load() maps the
+    new file instead of reading it, so a swap costs no unpickling or
+    copying. Files of older generations are removed; readers that still
+    map one keep their pages until they swap.
+    :param path: Header file, created with generation 0 if missing.
+    :param writable: Open for publishing. Only one process may publish.
+    :param keep: Policy files kept, so a reader that has just seen a generation can still open it.
+    """
+    def __init__(self, path, writable=False, keep=2):
+        self.path = path
+        self.keep = keep
+        self._create(path)
+        with open(path, "r+b" if writable else "rb") as f:
+            self.header = mmap.mmap(f.fileno(), STORE_HEADER.size,
+                                    access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        magic, version, _ = STORE_HEADER.unpack_from(self.header)
+        if magic != STORE_MAGIC or version != STORE_VERSION:
+            raise ValueError(f"{path} is not a version {STORE_VERSION} policy store.")
+
+    @staticmethod
+    def _create(path):
+        # linked into place whole, so no reader ever maps a half written header
+        if os.path.exists(path):
+            return
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(STORE_HEADER.pack(STORE_MAGIC, STORE_VERSION, 0))
+        try:
+            os.link(temp, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp)
+
+    def file(self, generation):
+        return f"{self.path}.{generation}"
+
+    def generation(self):
+        """
+        :return: Newest published generation, 0 before the first publish().
+        """
+        return GENERATION.unpack_from(self.header, GENERATION_OFFSET)[0]
+
+    def publish(self, policy):
+        """
+        Make `policy` the newest generation.
+        :return: The new generation.
+        """
+        generation = self.generation() + 1
+        temp = self.file(generation) + ".tmp"
+        policy.save(temp)
+        os.replace(temp, self.file(generation))
+        GENERATION.pack_into(self.header, GENERATION_OFFSET, generation)
+        stale = generation - self.keep
+        if stale > 0:
+            try:
+                os.remove(self.file(stale))
+            except OSError:
+                pass
+        return generation
+
+    def load(self, generation=None):
+        """
+        :param generation: Generation to load, None for the newest.
+        :return: The FrozenPolicy, or None if nothing is published yet or
+            the generation was already removed by newer ones.
+        """
+        if generation is None:
+            generation = self.generation()
+        if generation == 0:
+            return None
+        try:
+            return FrozenPolicy.load(self.file(generation))
+        except FileNotFoundError:
+            return None
+
+    def close(self):
+        self.header.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compile a Q-table into a read-only greedy policy file.")
+    parser.add_argument("q_table", nargs="?", default="q_table.pkl")
+    parser.add_argument("output", nargs="?", default="policy.bin")
+    parser.add_argument("--actions", default="UP,DOWN,LEFT,RIGHT,AVOID", help="comma separated action names")
+    parser.add_argument("--fallback", default="AVOID", help="action for states the Q-table does not know")
+    parser.add_argument("--publish", action="store_true",
+                        help="publish into the policy store at output instead of writing a policy file")
+    args = parser.parse_args()
+
+    q_table = read_checkpoint(args.q_table)
+    policy = FrozenPolicy.compile(q_table, args.actions.split(","), args.fallback)
+    if args.publish:
+        store = PolicyStore(args.output, writable=True)
+        generation = store.publish(policy)
+        store.close()
+        print(f"Published {policy.states} states to {args.output} as generation {generation}.")
+    else:
+        policy.save(args.output)
+        print(f"Compiled {policy.states} states into {args.output}.")
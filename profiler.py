@@ -0,0 +1,135 @@
+import collections
+import csv
+import json
+import time
+
+import numpy as np
+import pygame
+
+
+class FrameProfiler(object):
+    """
+    Times the phases of each frame. Call begin_frame() at the top of the
+    loop, mark(phase) after each phase and end_frame() at the bottom; the
+    time since the previous mark is charged to the named phase. Rolling
+    windows of the last `window` frames give percentiles and FPS, and with
+    `trace` every frame is kept for dump().
+
+    When disabled every call returns right away, so the hooks can stay in
+    the game loop.
+    :param enabled: Collect timings.
+    :param window: Number of frames in the rolling statistics.
+    :param trace: Keep per-frame rows for dump(), at most `trace_frames` of them.
+    """
+    def __init__(self, enabled=False, window=300, trace=False, trace_frames=100000):
+        self.enabled = enabled
+        self.window = window
+        self.trace = trace
+        self.phases = []  # phase names in the order they were first seen
+        self.samples = {}  # phase -> deque of ms
+        self.frame_ms = collections.deque(maxlen=window)
+        self.rows = collections.deque(maxlen=trace_frames)  # (frame, total ms, {phase: ms})
+        self.frames = 0
+        self.show_overlay = False
+        self._frame_start = 0.0
+        self._last = 0.0
+        self._current = {}
+        self._font = None
+        self._overlay = None  # cached overlay surface
+        self._overlay_frame = -1
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self._frame_start = self._last = time.perf_counter()
+        self._current = {}
+
+    def mark(self, phase):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self._current[phase] = self._current.get(phase, 0.0) + (now - self._last) * 1000
+        self._last = now
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        total = (time.perf_counter() - self._frame_start) * 1000
+        self.frames += 1
+        self.frame_ms.append(total)
+        for phase, ms in self._current.items():
+            samples = self.samples.get(phase)
+            if samples is None:
+                samples = self.samples[phase] = collections.deque(maxlen=self.window)
+                self.phases.append(phase)
+            samples.append(ms)
+        if self.trace:
+            self.rows.append((self.frames, total, self._current))
+
+    def toggle_overlay(self):
+        # showing the overlay needs timings, so it turns the profiler on
+        self.show_overlay = not self.show_overlay
+        if self.show_overlay:
+            self.enabled = True
+
+    def fps(self):
+        if not self.frame_ms:
+            return 0.0
+        return 1000 / (sum(self.frame_ms) / len(self.frame_ms))
+
+    def percentiles(self, q=(50, 95, 99)):
+        """
+        Rolling percentiles in ms, {phase: {"p50": ..., ...}} plus "frame" for the whole frame.
+        """
+        summary = {}
+        for phase in self.phases + ["frame"]:
+            samples = self.frame_ms if phase == "frame" else self.samples[phase]
+            if samples:
+                values = np.percentile(np.fromiter(samples, float), q)
+                summary[phase] = {f"p{p}": float(v) for p, v in zip(q, values)}
+        return summary
+
+    def draw_overlay(self, screen, counts=None, refresh=10):
+        """
+        Blit FPS, entity counts and per-phase p50/p95 ms in the top right
+        corner. The text is re-rendered every `refresh` frames.
+        :param counts: {name: number} of live entities.
+        """
+        if not self.show_overlay or screen is None:
+            return
+        if self._overlay is None or self.frames - self._overlay_frame >= refresh:
+            if self._font is None:
+                self._font = pygame.font.Font(None, 18)
+            lines = [f"FPS {self.fps():.0f}"]
+            if counts:
+                lines.append(" ".join(f"{name} {count}" for name, count in counts.items()))
+            for phase, p in self.percentiles((50, 95)).items():
+                lines.append(f"{phase:<10} {p['p50']:6.2f} {p['p95']:6.2f} ms")
+            images = [self._font.render(line, True, (255, 255, 0)) for line in lines]
+            width = max(image.get_width() for image in images) + 8
+            self._overlay = pygame.Surface((width, 14 * len(images) + 8), pygame.SRCALPHA)
+            self._overlay.fill((0, 0, 0, 160))
+            for i, image in enumerate(images):
+                self._overlay.blit(image, (4, 4 + 14 * i))
+            self._overlay_frame = self.frames
+        screen.blit(self._overlay, (screen.get_width() - self._overlay.get_width(), 0))
+
+    def dump(self, path):
+        """
+        Write the trace to `path`, as CSV (one row per frame, one column per
+        phase) or, for a .json path, with the rolling percentiles added.
+        """
+        if path.endswith(".json"):
+            with open(path, "w") as f:
+                json.dump({
+                    "phases": self.phases,
+                    "frames": [{"frame": frame, "total_ms": total, "phases": phases}
+                               for frame, total, phases in self.rows],
+                    "percentiles": self.percentiles(),
+                }, f)
+        else:
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["frame", "total_ms"] + self.phases)
+                for frame, total, phases in self.rows:
+                    writer.writerow([frame, f"{total:.4f}"] + [f"{phases.get(p, 0.0):.4f}" for p in self.phases])
@@ -0,0 +1,285 @@
+import pickle
+
+import numpy as np
+
+
+class ArrayQTable(object):
+    """
+    Q-table stored in NumPy arrays instead of a dict of dicts.
+
+    A state (distance_bullet_x, distance_bullet_y, distance_enemy_x,
+    distance_enemy_y) is encoded as a single integer in mixed radix over
+    `bounds`. An open-addressing hash over the codes maps each state to a
+    row of `values`, one float64 per action, so a state costs its 40 bytes
+    of Q-values, its 8 byte code and two to four 4 byte hash slots, which
+    hold rows and compare against the rows' codes. States outside the bounds, which the
+    encoding cannot represent, are kept in a small side dict so that
+    conversion to and from the pickle format stays lossless.
+
+    Single lookups (choose_action, learn) go through a small dict of the
+    rows of recently seen states first, so a state the game sees again
+    skips the encoding and the probe. When it holds `cache_size` states
+    it starts over.
+    :param actions: Action names, in column order.
+    :param capacity: Initial number of rows.
+    :param cache_size: Recently seen states whose rows are cached, 0 to disable.
+    """
+    bounds = (49, 86, 49, 86)  # 480 / 10 + 1 columns, 852 / 10 + 1 rows
+
+    def __init__(self, actions, capacity=1024, cache_size=4096):
+        self.actions = list(actions)
+        self.action_index = {a: i for i, a in enumerate(self.actions)}
+        self.size = 0
+        self.values = np.zeros((capacity, len(self.actions)))
+        self.codes = np.full(capacity, -1, np.int64)  # code of each row, -1 for overflow rows
+        self.overflow = {}  # state -> row, for states outside bounds
+        self._rows = np.full(self._hash_size(capacity), -1, np.int32)  # hash slot -> row
+        self.cache_size = cache_size
+        self._cache = {}  # state -> row, of recently seen states
+
+    @staticmethod
+    def _hash_size(capacity):
+        # a power of two at least twice the row capacity, so the hash stays at most half full
+        return 1 << (2 * capacity - 1).bit_length()
+
+    def encode(self, state):
+        code = 0
+        for value, size in zip(state, self.bounds):
+            if not 0 <= value < size:
+                return -1
+            code = code * size + value
+        return code
+
+    def decode(self, codes):
+        # (n, 4) int array of the states behind the given codes
+        return np.stack(np.unravel_index(codes, self.bounds), axis=1)
+
+    def _slot(self, code):
+        # Fibonacci hashing, the high bits of the product pick the slot
+        rows, codes = self._rows, self.codes
+        mask = len(rows) - 1
+        slot = ((code * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> (64 - mask.bit_length())
+        while True:
+            row = rows.item(slot)
+            if row == -1 or codes.item(row) == code:
+                return slot
+            slot = (slot + 1) & mask
+
+    def _slots(self, codes):
+        # _slot for an array of codes, all probed together
+        mask = len(self._rows) - 1
+        shift = np.uint64(64 - mask.bit_length())
+        slots = ((codes.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)) >> shift).astype(np.int64)
+        pending = np.arange(len(codes))
+        while pending.size:
+            rows = self._rows[slots[pending]]
+            keys = np.where(rows >= 0, self.codes[rows], -1)
+            pending = pending[(keys != codes[pending]) & (rows != -1)]
+            slots[pending] = (slots[pending] + 1) & mask
+        return slots
+
+    def find(self, state):
+        """
+        Row of a state, or -1 if it has never been stored.
+        """
+        row = self._cache.get(state)
+        if row is not None:
+            return row
+        code = self.encode(state)
+        if code < 0:
+            row = self.overflow.get(state, -1)
+        else:
+            row = self._rows.item(self._slot(code))
+        if row >= 0:
+            self._remember(state, row)
+        return row
+
+    def _remember(self, state, row):
+        if len(self._cache) >= self.cache_size:
+            if not self.cache_size:
+                return
+            self._cache.clear()
+        self._cache[state] = row
+
+    def row(self, state):
+        """
+        Row of a state, adding a zero row for an unseen state.
+        """
+        row = self._cache.get(state)
+        if row is not None:
+            return row
+        code = self.encode(state)
+        if code < 0:
+            row = self.overflow.get(state)
+            if row is None:
+                row = self.overflow[state] = self._add(-1)
+            self._remember(state, row)
+            return row
+
+        slot = self._slot(code)
+        row = self._rows.item(slot)
+        if row < 0:
+            row = self._add(code)
+            # the table may have been rehashed while growing
+            self._rows[self._slot(code)] = row
+        self._remember(state, row)
+        return row
+
+    def rows(self, states):
+        """
+        Rows of an (n, 4) int array of states, adding zero rows for unseen ones.
+        """
+        states = np.asarray(states)
+        inside = np.all((states >= 0) & (states < self.bounds), axis=1)
+        rows = np.empty(len(states), np.int64)
+        if inside.any():
+            known = states[inside]
+            codes = np.ravel_multi_index(known.T, self.bounds).astype(np.int64)
+            found = self._rows[self._slots(codes)].astype(np.int64)
+            # unseen states are added one by one, adding may grow the table
+            for i in np.flatnonzero(found < 0).tolist():
+                found[i] = self.row(tuple(known[i].tolist()))
+            rows[inside] = found
+        for i in np.flatnonzero(~inside).tolist():
+            rows[i] = self.row(tuple(states[i].tolist()))
+        return rows
+
+    def find_rows(self, states):
+        """
+        find() for an (n, 4) int array of states: rows, -1 for unknown states.
+        """
+        states = np.asarray(states)
+        inside = np.all((states >= 0) & (states < self.bounds), axis=1)
+        rows = np.full(len(states), -1, np.int64)
+        if inside.any():
+            codes = np.ravel_multi_index(states[inside].T, self.bounds).astype(np.int64)
+            rows[inside] = self._rows[self._slots(codes)]
+        for i in np.flatnonzero(~inside).tolist():
+            rows[i] = self.overflow.get(tuple(states[i].tolist()), -1)
+        return rows
+
+    def _add(self, code):
+        if self.size == len(self.values):
+            self._grow()
+        row = self.size
+        self.values[row] = 0
+        self.codes[row] = code
+        self.size += 1
+        return row
+
+    def _grow(self):
+        capacity = 2 * len(self.values)
+        values = np.zeros((capacity, len(self.actions)))
+        values[:self.size] = self.values[:self.size]
+        codes = np.full(capacity, -1, np.int64)
+        codes[:self.size] = self.codes[:self.size]
+        self.values, self.codes = values, codes
+        self._rehash()
+
+    def _rehash(self):
+        # rebuild the hash from the rows, after they were grown or moved
+        capacity = len(self.values)
+        self._rows = np.full(self._hash_size(capacity), -1, np.int32)
+        for row in np.flatnonzero(self.codes[:self.size] >= 0).tolist():
+            self._rows[self._slot(self.codes.item(row))] = row
+
+    def remove(self, states):
+        """
+        Drop stored states. The remaining rows are moved down to fill the
+        gaps and the hash is rebuilt, so remove in batches, not one by one.
+        :return: Number of states removed.
+        """
+        drop = np.zeros(self.size, bool)
+        for state in states:
+            row = self.find(state)
+            if row >= 0:
+                drop[row] = True
+        if not drop.any():
+            return 0
+        keep = np.flatnonzero(~drop)
+        moved = np.full(self.size, -1, np.int64)  # old row -> new row
+        moved[keep] = np.arange(len(keep))
+        self.values[:len(keep)] = self.values[keep]
+        self.codes[:len(keep)] = self.codes[keep]
+        self.overflow = {state: int(moved[row]) for state, row in self.overflow.items() if not drop[row]}
+        removed = self.size - len(keep)
+        self.size = len(keep)
+        self._cache.clear()  # rows have moved
+        self._rehash()
+        return removed
+
+    def __contains__(self, state):
+        return self.find(state) >= 0
+
+    def __len__(self):
+        return self.size
+
+    def best_action(self, state):
+        """
+        Greedy action of a stored state, None if the state is unknown.
+        """
+        row = self.find(state)
+        if row < 0:
+            return None
+        # plain floats, cheaper than NumPy for one row; index() picks the first of equal values like argmax
+        q = self.values[row].tolist()
+        return self.actions[q.index(max(q))]
+
+    def update(self, state, action, reward, next_state, lr, gamma, done=False):
+        # one-step Q-learning update, same rule as QLearningAgent.learn
+        row = self.row(state)
+        next_row = self.row(next_state)
+        column = self.action_index[action]
+        values = self.values
+        q_target = reward if done else reward + gamma * max(values[next_row].tolist())
+        q_predict = values.item(row, column)
+        values[row, column] = q_predict + lr * (q_target - q_predict)
+
+    def update_batch(self, states, actions, rewards, next_states, dones, lr, gamma):
+        """
+        One-step Q-learning update for a batch of transitions at once. All
+        targets use the values from before the batch; updates that hit the
+        same entry add up.
+        :param actions: Int array of action indices.
+        """
+        rows = self.rows(states)
+        next_rows = self.rows(next_states)
+        targets = rewards + gamma * self.values[next_rows].max(axis=1) * ~dones
+        errors = targets - self.values[rows, actions]
+        np.add.at(self.values, (rows, actions), lr * errors)
+
+    def nbytes(self):
+        return self.values.nbytes + self.codes.nbytes + self._rows.nbytes
+
+    def states(self):
+        # (state, row) pairs of every stored state
+        rows = np.flatnonzero(self.codes[:self.size] >= 0)
+        for state, row in zip(map(tuple, self.decode(self.codes[rows]).tolist()), rows.tolist()):
+            yield state, row
+        for state, row in self.overflow.items():
+            yield state, row
+
+    def to_dict(self):
+        """
+        The table in the dict-of-dicts format of QLearningAgent.q_table.
+        """
+        return {state: dict(zip(self.actions, self.values[row].tolist())) for state, row in self.states()}
+
+    @classmethod
+    def from_dict(cls, q_table, actions):
+        table = cls(actions, capacity=max(1024, len(q_table)))
+        for state, q in q_table.items():
+            row = table.row(state)
+            for action, value in q.items():
+                table.values[row, table.action_index[action]] = value
+        return table
+
+    def save(self, path):
+        # written in the pickle format, so either backend can load it
+        with open(path, "wb") as f:
+            pickle.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path, actions):
+        with open(path, "rb") as f:
+            return cls.from_dict(pickle.load(f), actions)
@@ -0,0 +1,147 @@
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+MAGIC = b"SREP"
+VERSION = 1
+# magic, version, seed, tick_ms, ticks, spawns, score
+HEADER = struct.Struct("<4sBQHIIi")
+SPAWN = np.dtype([("tick", "<u4"), ("x", "<i2")])
+
+
+class Recording(object):
+    """
+    One episode of play: the seed the game RNGs were seeded with, the
+    action index chosen on every tick, the tick and x position of every
+    enemy spawn, and the final score. On disk it is a fixed header
+    followed by the zlib-compressed actions and spawns, about a byte per
+    tick before compression.
+    """
+    def __init__(self, seed, tick_ms, actions=None, spawns=None, score=0):
+        self.seed = seed
+        self.tick_ms = tick_ms
+        self.actions = actions if actions is not None else []  # action index per tick
+        self.spawns = spawns if spawns is not None else []  # (tick, x) per enemy
+        self.score = score
+
+    def __len__(self):
+        return len(self.actions)
+
+    def save(self, path):
+        body = np.asarray(self.actions, np.uint8).tobytes() + np.array(self.spawns, SPAWN).tobytes()
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.seed, self.tick_ms, len(self.actions),
+                                len(self.spawns), self.score))
+            f.write(zlib.compress(body))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, seed, tick_ms, ticks, spawns, score = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} replay file.")
+        body = zlib.decompress(data[HEADER.size:])
+        actions = np.frombuffer(body, np.uint8, ticks).tolist()
+        spawn_array = np.frombuffer(body, SPAWN, spawns, offset=ticks)
+        return cls(seed, tick_ms, actions, [(int(t), int(x)) for t, x in spawn_array], score)
+
+
+class Recorder(object):
+    """
+    Records the episodes of Manager.main, one file per episode in
+    `directory`, written when the episode ends.
+    :param directory: Where replay files go, None to only keep the last episode in memory.
+    """
+    def __init__(self, directory="replays"):
+        self.directory = directory
+        self.recording = None
+        self.last = None  # the episode that ended last
+        self.episodes = 0
+
+    def begin(self, seed, tick_ms):
+        self.recording = Recording(seed, tick_ms)
+
+    def spawn(self, x):
+        if self.recording is not None:
+            self.recording.spawns.append((len(self.recording.actions), x))
+
+    def act(self, action):
+        # one call per tick, with the action index chosen on it
+        if self.recording is not None:
+            self.recording.actions.append(action)
+
+    def end(self, score):
+        """
+        Finish the current episode and write it.
+        :return: Path of the replay file, None if nothing was written.
+        """
+        if self.recording is None:
+            return None
+        self.recording.score = score
+        self.last, self.recording = self.recording, None
+        self.episodes += 1
+        if self.directory is None:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{self.episodes:04d}.rep")
+        self.last.save(path)
+        return path
+
+
+class ReplayAgent(object):
+    """
+    Stands in for QLearningAgent during playback: hands out the recorded
+    actions in order and learns nothing. Past the end of the recording it
+    answers None, which leaves the player where it is.
+    :param recording: Recording to play.
+    :param actions: Action names, indexed like the recorded indices.
+    """
+    def __init__(self, recording, actions):
+        self.actions = actions
+        self.action_index = {a: i for i, a in enumerate(actions)}
+        self.recorded = recording.actions
+        self.tick = 0
+
+    def get_state(self, player, enemy_bullets, enemies):
+        # recorded actions do not depend on the state
+        return None
+
+    def choose_action(self, state):
+        self.tick += 1
+        if self.tick > len(self.recorded) or self.recorded[self.tick - 1] >= len(self.actions):
+            return None
+        return self.actions[self.recorded[self.tick - 1]]
+
+    def remember(self, state, action, reward, next_state, done=False):
+        pass
+
+    def update_epsilon(self):
+        pass
+
+    def load_q_table(self):
+        pass
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Play back recorded episodes and check they still match.")
+    parser.add_argument("paths", nargs="+", help="replay files")
+    parser.add_argument("--render", action="store_true", help="show the playback in a window")
+    parser.add_argument("--fps", type=int, default=0, help="frames per second when rendering, 0 for uncapped")
+    parser.add_argument("--scenario", default=None, help="scenario file the episodes were recorded with")
+    args = parser.parse_args()
+
+    from play import Manager
+    manager = Manager(headless=not args.render, scenario=args.scenario)
+    failed = 0
+    for path in args.paths:
+        result = manager.play_back(path, render=args.render, fps=args.fps)
+        failed += not result["matches"]
+        print(path, result)
+    sys.exit(1 if failed else 0)
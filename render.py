@@ -0,0 +1,67 @@
+import pygame
+
+
+class DirtyScreen(object):
+    """
+    Wraps the display surface and records the area of every blit, so
+    update() pushes only the regions that changed this frame and the last
+    one instead of the whole window. Sprites and groups draw on it like on
+    the surface itself; everything else is passed through.
+
+    A scrolling background changes every pixel, so right after drawing it
+    the caller calls mark_all() and the frame is pushed whole. With a still
+    background, clear() paints it back over the previous frame's blits
+    instead, like pygame.sprite.LayeredDirty.
+    :param surface: The display surface.
+    """
+    def __init__(self, surface):
+        self.surface = surface
+        self.rects = []  # areas drawn this frame
+        self.previous = None  # areas drawn last frame, None before the first one
+        self.full = False
+
+    def __getattr__(self, name):
+        return getattr(self.surface, name)
+
+    def blit(self, source, dest, area=None, special_flags=0):
+        rect = self.surface.blit(source, dest, area, special_flags)
+        self.rects.append(rect)
+        return rect
+
+    def blits(self, blit_sequence, doreturn=1):
+        rects = self.surface.blits(blit_sequence, 1)
+        self.rects.extend(rects)
+        return rects if doreturn else None
+
+    def mark_all(self):
+        # push the whole window this frame, what was drawn so far is covered by it
+        self.full = True
+        self.rects.clear()
+
+    def clear(self, background):
+        """
+        Paint `background` over the areas drawn last frame. Before the
+        first frame the caller draws the whole background instead.
+        """
+        if self.previous is None:
+            return
+        for rect in self.previous:
+            self.surface.blit(background, rect, rect)
+
+    def update(self):
+        """
+        Push the changed regions to the display and start a new frame.
+        :return: Number of rects pushed, 0 for the whole window.
+        """
+        if self.full or self.previous is None:
+            pygame.display.update()
+            pushed = 0
+        else:
+            # old areas must be pushed too, they now show background
+            dirty = self.previous + self.rects
+            pygame.display.update(dirty)
+            pushed = len(dirty)
+        self.previous = self.rects
+        self.rects = []
+        self.full = False
+        return pushed
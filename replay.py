@@ -0,0 +1,72 @@
+import numpy as np
+
+
+class ReplayBuffer(object):
+    """
+    Ring buffer of transitions in preallocated NumPy arrays. States are
+    stored as rows of ints and actions as column indices, so a sampled
+    batch goes straight to QLearningAgent.learn_batch. Once full, new
+    transitions overwrite the oldest ones.
+    :param capacity: Maximum number of transitions kept.
+    :param state_size: Number of ints in a state.
+    """
+    def __init__(self, capacity=100000, state_size=4):
+        self.capacity = capacity
+        self.states = np.zeros((capacity, state_size), np.int32)
+        self.actions = np.zeros(capacity, np.int64)
+        self.rewards = np.zeros(capacity)
+        self.next_states = np.zeros((capacity, state_size), np.int32)
+        self.dones = np.zeros(capacity, bool)
+        self.position = 0  # slot the next transition goes to
+        self.size = 0
+        self.pushed = 0  # transitions pushed in total
+
+    def push(self, state, action, reward, next_state, done=False):
+        """
+        :param action: Action index.
+        """
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.pushed += 1
+
+    def push_batch(self, states, actions, rewards, next_states, dones):
+        """
+        Push n transitions given as arrays, in order.
+        """
+        n = len(states)
+        start = max(0, n - self.capacity)  # only the newest fit
+        indexes = (self.position + np.arange(start, n)) % self.capacity
+        self.states[indexes] = states[start:]
+        self.actions[indexes] = actions[start:]
+        self.rewards[indexes] = rewards[start:]
+        self.next_states[indexes] = next_states[start:]
+        self.dones[indexes] = dones[start:]
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        self.pushed += n
+
+    def sample(self, batch_size):
+        """
+        Uniform sample with replacement.
+        :return: (states, actions, rewards, next_states, dones) arrays.
+        """
+        indexes = np.random.randint(0, self.size, batch_size)
+        return (self.states[indexes], self.actions[indexes], self.rewards[indexes],
+                self.next_states[indexes], self.dones[indexes])
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.position = 0
+        self.size = 0
+
+    def nbytes(self):
+        return (self.states.nbytes + self.actions.nbytes + self.rewards.nbytes +
+                self.next_states.nbytes + self.dones.nbytes)
@@ -0,0 +1,132 @@
+import json
+import math
+
+
+class EnemyType(object):
+    """
+    How one kind of enemy looks, moves and fires.
+    :param image: Image file.
+    :param speed: Pixels moved down per tick.
+    :param drift: Pixels moved sideways per tick, bouncing off the edges.
+    :param shoot_cooldown: Milliseconds between shots.
+    :param bullet_speed: Pixels an enemy bullet moves down per tick.
+    :param muzzle: (x, y) offset of the bullets from the enemy's top left, None for bottom centre.
+    """
+    def __init__(self, name, image="./images/enemy1.png", speed=2, drift=3, shoot_cooldown=500, bullet_speed=2.5,
+                 muzzle=None):
+        self.name = name
+        self.image = image
+        self.speed = speed
+        self.drift = drift
+        self.shoot_cooldown = shoot_cooldown
+        self.bullet_speed = bullet_speed
+        self.muzzle = tuple(muzzle) if muzzle is not None else None
+
+
+# the enemy of the original game
+DEFAULT_ENEMY = EnemyType("small", muzzle=(56 / 2 - 6 / 2, 43))
+
+
+class Scenario(object):
+    """
+    A spawn schedule: enemy types, player settings and waves, usually
+    read from a JSON file (see scenarios/). Each wave spawns `burst`
+    enemies of one type every `every_ms` milliseconds between `start_ms`
+    and `end_ms`; `every_ms` and `burst` may be [first, last] pairs,
+    interpolated linearly over the wave to ramp difficulty up. An x of
+    "random" is drawn at spawn time from the game's RNG, like the
+    original timer did, so seeded runs and replays stay repeatable.
+
+    compile() turns it into a Timeline once, and the game loop only looks
+    up the current tick in it.
+    :param duration_ms: Length of the schedule; afterwards it repeats from
+        `loop_from_ms`, so wave intervals should divide the repeated part.
+    """
+    def __init__(self, name, types, waves, player=None, duration_ms=60000, loop_from_ms=0):
+        self.name = name
+        self.types = types  # name -> EnemyType
+        self.waves = waves
+        self.player = dict(player or {})  # Player attributes, e.g. speed and shoot_cooldown
+        self.duration_ms = duration_ms
+        self.loop_from_ms = loop_from_ms
+
+    @classmethod
+    def default(cls):
+        # the original game: one small enemy every second from the first second on, at a random x
+        return cls("default", {"small": DEFAULT_ENEMY},
+                   [{"type": "small", "start_ms": 1000, "every_ms": 1000}], duration_ms=2000, loop_from_ms=1000)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        types = {name: EnemyType(name, **spec) for name, spec in data["types"].items()}
+        for wave in data["waves"]:
+            if wave["type"] not in types:
+                raise ValueError(f"{path}: wave uses unknown enemy type {wave['type']!r}.")
+        return cls(data.get("name", path), types, data["waves"], data.get("player"),
+                   data.get("duration_ms", 60000), data.get("loop_from_ms", 0))
+
+    @staticmethod
+    def _ramp(value, fraction):
+        if isinstance(value, (list, tuple)):
+            return value[0] + (value[1] - value[0]) * fraction
+        return value
+
+    def compile(self, tick_ms):
+        """
+        :return: Timeline with the spawns of every tick of `duration_ms`.
+        """
+        ticks = max(1, math.ceil(self.duration_ms / tick_ms))
+        events = {}  # tick -> [(type, x)]
+        for wave in self.waves:
+            enemy_type = self.types[wave["type"]]
+            start = wave.get("start_ms", 0)
+            end = min(wave.get("end_ms", self.duration_ms), self.duration_ms)
+            xs = wave.get("x", "random")
+            spawned = 0
+            due = start
+            # the first spawn of a wave is due at start_ms, like a timer set to it
+            while due < end:
+                fraction = (due - start) / (end - start) if end > start else 0.0
+                for _ in range(int(round(self._ramp(wave.get("burst", 1), fraction)))):
+                    if isinstance(xs, list):
+                        x = xs[spawned % len(xs)]
+                    else:
+                        x = None if xs == "random" else xs
+                    events.setdefault(math.ceil(due / tick_ms), []).append((enemy_type, x))
+                    spawned += 1
+                every = self._ramp(wave.get("every_ms", 1000), fraction)
+                if every <= 0:
+                    break
+                due += every
+
+        timeline = [()] * ticks
+        for tick, spawns in events.items():
+            if tick < ticks:
+                timeline[tick] = tuple(spawns)
+        return Timeline(timeline, min(ticks - 1, self.loop_from_ms // tick_ms))
+
+
+class Timeline(object):
+    """
+    Spawns per tick, compiled from a Scenario. at() is a list lookup; past
+    the end the ticks from `loop_from` on repeat.
+    """
+    def __init__(self, events, loop_from=0):
+        self.events = events
+        self.loop_from = loop_from
+
+    def __len__(self):
+        return len(self.events)
+
+    def at(self, tick):
+        """
+        :return: (EnemyType, x or None) of every enemy spawned on this tick.
+        """
+        if tick >= len(self.events):
+            tick = self.loop_from + (tick - self.loop_from) % (len(self.events) - self.loop_from)
+        return self.events[tick]
+
+    def spawns(self):
+        return sum(len(spawns) for spawns in self.events)
@@ -0,0 +1,244 @@
+import math
+
+
+class SpatialGrid(object):
+    """
+    Uniform grid over the playfield for sprites that have a rect. Each
+    sprite is bucketed by its top-left corner; sprites outside the
+    playfield go to the border cells. Rebuild it once per tick and remove
+    sprites as they die, then nearest-entity and collision queries only
+    look at the few cells that can matter. While it holds only a handful
+    of sprites it skips the buckets and scans them all, which is cheaper.
+
+    Ties between equally near sprites go to the one added first, so a grid
+    rebuilt from a sprite group answers exactly like min() over the group.
+
+    Collision queries count their rect tests (broad phase) and mask tests
+    (narrow phase) since the last rebuild, which is once per tick.
+    :param width: Playfield width.
+    :param height: Playfield height.
+    :param cell: Cell size in pixels.
+    :param linear_below: Below this many sprites queries just scan them all.
+    """
+    def __init__(self, width=480, height=700, cell=32, linear_below=16):
+        self.cell = cell
+        self.cols = (width + cell - 1) // cell
+        self.rows = (height + cell - 1) // cell
+        self.linear_below = linear_below
+        self.cells = [[] for _ in range(self.cols * self.rows)]
+        self.bands = [[] for _ in range(self.rows)]  # sprites of each row of cells
+        self.occupied = set()  # indexes of non-empty cells
+        self.where = {}  # sprite -> insertion order
+        self.cell_of = {}  # sprite -> cell index, while bucketed
+        self.bucketed = False
+        self.count = 0
+        self.max_w = 0
+        self.max_h = 0
+        self.broad = 0  # rect tests since the last rebuild
+        self.narrow = 0  # mask tests since the last rebuild
+        self.broad_total = 0
+        self.narrow_total = 0
+
+    def _col(self, x):
+        return min(max(x // self.cell, 0), self.cols - 1)
+
+    def _row(self, y):
+        return min(max(y // self.cell, 0), self.rows - 1)
+
+    def rebuild(self, sprites):
+        for index in self.occupied:
+            self.cells[index].clear()
+            self.bands[index // self.cols].clear()
+        self.occupied.clear()
+        self.cell_of.clear()
+        self.bucketed = False
+        self.where.clear()
+        self.count = 0
+        self.max_w = 0
+        self.max_h = 0
+        self.broad = 0
+        self.narrow = 0
+        for sprite in sprites:
+            self.add(sprite)
+
+    def _bucket(self, sprite):
+        rect = sprite.rect
+        index = self._row(rect.top) * self.cols + self._col(rect.left)
+        self.cells[index].append(sprite)
+        self.bands[index // self.cols].append(sprite)
+        self.occupied.add(index)
+        self.cell_of[sprite] = index
+
+    def add(self, sprite):
+        self.where[sprite] = self.count
+        self.count += 1
+        self.max_w = max(self.max_w, sprite.rect.width)
+        self.max_h = max(self.max_h, sprite.rect.height)
+        if self.bucketed:
+            self._bucket(sprite)
+        elif len(self.where) >= self.linear_below:
+            # enough sprites for the buckets to pay off
+            self.bucketed = True
+            for other in self.where:
+                self._bucket(other)
+
+    def remove(self, sprite):
+        if self.where.pop(sprite, None) is None:
+            return
+        index = self.cell_of.pop(sprite, None)
+        if index is not None:
+            self.cells[index].remove(sprite)
+            self.bands[index // self.cols].remove(sprite)
+
+    def __len__(self):
+        return len(self.where)
+
+    def __bool__(self):
+        return bool(self.where)
+
+    def __iter__(self):
+        # insertion order, like the group the grid was built from
+        return iter(self.where)
+
+    def _span(self, index, last, slack):
+        # lowest and highest coordinate a sprite stored in this row/column can have
+        low = index * self.cell if index > 0 else -math.inf
+        high = (index + 1) * self.cell - 1 if index < last else math.inf
+        return low, high + slack
+
+    @staticmethod
+    def _gap(value, low, high):
+        if value < low:
+            return low - value
+        if value > high:
+            return value - high
+        return 0
+
+    def nearest_y(self, y, edge="top"):
+        """
+        Sprite whose rect top (or bottom) is vertically closest to y.
+        :param edge: "top" or "bottom".
+        """
+        if not self.bucketed:
+            # insertion order and a strict comparison keep the first of equals, like min()
+            return min(self.where, key=lambda s: abs(getattr(s.rect, edge) - y), default=None)
+
+        slack = self.max_h if edge == "bottom" else 0
+        bounds = []
+        for row in range(self.rows):
+            if self.bands[row]:
+                low, high = self._span(row, self.rows - 1, slack)
+                bounds.append((self._gap(y, low, high), row))
+        bounds.sort()
+
+        best, best_key = None, None
+        for bound, row in bounds:
+            if best_key is not None and bound > best_key[0]:
+                break
+            for sprite in self.bands[row]:
+                key = (abs(getattr(sprite.rect, edge) - y), self.where[sprite])
+                if best_key is None or key < best_key:
+                    best, best_key = sprite, key
+        return best
+
+    def k_nearest(self, x, y, k=1):
+        """
+        The k sprites whose top-left corners are nearest to (x, y), nearest first.
+        """
+        if not self.bucketed:
+            return sorted(self.where, key=lambda s: ((s.rect.left - x) ** 2 + (s.rect.top - y) ** 2,
+                                                    self.where[s]))[:k]
+
+        bounds = []
+        for index in self.occupied:
+            row, col = divmod(index, self.cols)
+            dy = self._gap(y, *self._span(row, self.rows - 1, 0))
+            dx = self._gap(x, *self._span(col, self.cols - 1, 0))
+            bounds.append((dx * dx + dy * dy, index))
+        bounds.sort()
+
+        found = []  # (squared distance, order, sprite), sorted
+        for bound, index in bounds:
+            if len(found) >= k and bound > found[k - 1][0]:
+                break
+            for sprite in self.cells[index]:
+                dx = sprite.rect.left - x
+                dy = sprite.rect.top - y
+                found.append((dx * dx + dy * dy, self.where[sprite], sprite))
+            found.sort(key=lambda f: f[:2])
+        return [f[2] for f in found[:k]]
+
+    def nearest(self, x, y):
+        found = self.k_nearest(x, y, 1)
+        return found[0] if found else None
+
+    def query_rect(self, rect):
+        """
+        Broad phase: sprites stored in the cells a rect could overlap, in insertion order.
+        """
+        if not self.bucketed:
+            return list(self.where)
+        left = self._col(rect.left - self.max_w)
+        right = self._col(rect.right)
+        top = self._row(rect.top - self.max_h)
+        bottom = self._row(rect.bottom)
+        candidates = []
+        for row in range(top, bottom + 1):
+            start = row * self.cols
+            for cell in self.cells[start + left:start + right + 1]:
+                candidates.extend(cell)
+        candidates.sort(key=self.where.get)
+        return candidates
+
+    def collide(self, rect, dokill=False, mask=None):
+        """
+        Sprites whose rect overlaps `rect`, like pygame.sprite.spritecollide.
+        With a mask, only the pairs whose rects overlap are then tested
+        pixel by pixel, against each sprite's own `mask` where it has one.
+        :param dokill: Kill the sprites that collide and drop them from the grid.
+        :param mask: pygame.mask.Mask of whatever is at `rect`, None to stop at rects.
+        """
+        candidates = self.query_rect(rect)
+        hits = [sprite for sprite in candidates if rect.colliderect(sprite.rect)]
+        self.broad += len(candidates)
+        self.broad_total += len(candidates)
+        if mask is not None and hits:
+            hits = [sprite for sprite in hits if self._overlap(rect, mask, sprite)]
+        if dokill:
+            for sprite in hits:
+                sprite.kill()
+                self.remove(sprite)
+        return hits
+
+    def _overlap(self, rect, mask, sprite):
+        other = getattr(sprite, "mask", None)
+        if other is None:
+            return True
+        self.narrow += 1
+        self.narrow_total += 1
+        return mask.overlap(other, (sprite.rect.left - rect.left, sprite.rect.top - rect.top)) is not None
+
+
+def closest(entities, y, edge="top"):
+    """
+    Entity whose rect edge is vertically closest to y, from a SpatialGrid
+    or any iterable of sprites.
+    """
+    if isinstance(entities, SpatialGrid):
+        return entities.nearest_y(y, edge)
+    return min(entities, key=lambda e: abs(getattr(e.rect, edge) - y))
+
+
+def groupcollide(group, grid, dokill, dokill_grid):
+    """
+    pygame.sprite.groupcollide with the second group replaced by a SpatialGrid.
+    Sprites with a `mask` are tested pixel by pixel once their rects overlap.
+    """
+    crashed = {}
+    for sprite in group.sprites():
+        hits = grid.collide(sprite.rect, dokill_grid, getattr(sprite, "mask", None))
+        if hits:
+            crashed[sprite] = hits
+            if dokill:
+                sprite.kill()
+    return crashed
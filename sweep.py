@@ -0,0 +1,232 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import time
+
+import numpy as np
+
+from play import Manager, QLearningAgent
+
+ACTIONS = ["UP", "DOWN", "LEFT", "RIGHT", "AVOID"]
+# QLearningAgent arguments a trial can set, everything else is a Manager reward weight
+AGENT_PARAMS = ["learning_rate", "discount_factor", "epsilon", "min_epsilon", "epsilon_decay"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    sweep TEXT NOT NULL,
+    trial INTEGER NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    episodes INTEGER NOT NULL DEFAULT 0,
+    epsilon REAL,
+    mean_reward REAL,
+    mean_score REAL,
+    steps_per_sec REAL,
+    updated REAL,
+    PRIMARY KEY (sweep, trial)
+);
+CREATE TABLE IF NOT EXISTS rungs (
+    sweep TEXT NOT NULL,
+    trial INTEGER NOT NULL,
+    rung INTEGER NOT NULL,
+    episodes INTEGER NOT NULL,
+    mean_reward REAL NOT NULL,
+    mean_score REAL NOT NULL,
+    steps_per_sec REAL NOT NULL,
+    PRIMARY KEY (sweep, trial, rung)
+);
+"""
+
+
+def connect(path):
+    db = sqlite3.connect(path, timeout=60)
+    db.executescript(SCHEMA)
+    return db
+
+
+def parse_space(specs):
+    """
+    Search space from "name=v1,v2,..." (choices) and "name=low:high"
+    (uniform range, random search only) strings.
+    """
+    space = {}
+    for spec in specs:
+        name, values = spec.split("=", 1)
+        if ":" in values:
+            low, high = values.split(":")
+            space[name] = (float(low), float(high))
+        else:
+            space[name] = [float(v) for v in values.split(",")]
+    return space
+
+
+def grid(space):
+    for name, values in space.items():
+        if isinstance(values, tuple):
+            raise ValueError(f"{name} is a range, a grid needs a list of values.")
+    names = list(space)
+    for values in itertools.product(*(space[n] for n in names)):
+        yield dict(zip(names, values))
+
+
+def sample(space, trials, seed):
+    rng = random.Random(seed)
+    for _ in range(trials):
+        yield {name: rng.uniform(*values) if isinstance(values, tuple) else rng.choice(values)
+               for name, values in space.items()}
+
+
+def create_trials(db, sweep, params):
+    """
+    Store the trials of a new sweep. A sweep that already has trials keeps
+    them, which is what makes a rerun resume it.
+    :return: Number of trials in the sweep.
+    """
+    count = db.execute("SELECT COUNT(*) FROM trials WHERE sweep = ?", (sweep,)).fetchone()[0]
+    if count:
+        return count
+    with db:
+        db.executemany("INSERT INTO trials (sweep, trial, params) VALUES (?, ?, ?)",
+                       [(sweep, i, json.dumps(p)) for i, p in enumerate(params)])
+    return len(params)
+
+
+def losing(db, sweep, trial, rung, mean_reward, min_trials):
+    """
+    Median stopping rule: a trial is losing when at least `min_trials`
+    other trials reached this rung and its mean reward is below their median.
+    """
+    others = [r[0] for r in db.execute(
+        "SELECT mean_reward FROM rungs WHERE sweep = ? AND rung = ? AND trial != ?", (sweep, rung, trial))]
+    return len(others) >= min_trials and mean_reward < float(np.median(others))
+
+
+def run_trial(job):
+    """
+    Play one trial, or what is left of it, in rungs of `rung_episodes`.
+    After each rung the Q-table is saved and the rung stored, so a killed
+    sweep resumes from the last rung.
+    """
+    db_path, sweep, trial, params, directory, episodes, rung_episodes, max_steps, seed, grace, min_trials = job
+    db = connect(db_path)
+    done, epsilon = db.execute("SELECT episodes, epsilon FROM trials WHERE sweep = ? AND trial = ?",
+                               (sweep, trial)).fetchone()
+    q_table_file = os.path.join(directory, f"trial-{trial:04d}.pkl")
+    if done == 0 and os.path.exists(q_table_file):
+        os.remove(q_table_file)  # left over from a run that died before its first rung
+
+    random.seed(seed + trial * 1000 + done)
+    np.random.seed(seed + trial * 1000 + done)
+    manager = Manager(headless=True, load_q_table=False)
+    manager.agent = QLearningAgent(ACTIONS, q_table_file=q_table_file,
+                                   **{k: v for k, v in params.items() if k in AGENT_PARAMS})
+    if epsilon is not None:
+        manager.agent.epsilon = epsilon
+    manager.rewards.update({k: v for k, v in params.items() if k not in AGENT_PARAMS})
+
+    with db:
+        db.execute("UPDATE trials SET status = 'running', updated = ? WHERE sweep = ? AND trial = ?",
+                   (time.time(), sweep, trial))
+    status = "done"
+    while done < episodes:
+        rung = done // rung_episodes
+        rewards, scores, steps = [], [], 0
+        start = time.perf_counter()
+        for _ in range(min(rung_episodes, episodes - done)):
+            total_reward, played = manager.run_episode(max_steps)
+            rewards.append(total_reward)
+            scores.append(Manager.score)
+            steps += played
+        seconds = time.perf_counter() - start
+        done += len(rewards)
+        manager.agent.save_q_table()
+
+        mean_reward, mean_score = float(np.mean(rewards)), float(np.mean(scores))
+        with db:
+            db.execute("INSERT OR REPLACE INTO rungs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (sweep, trial, rung, done, mean_reward, mean_score, steps / seconds))
+            db.execute("UPDATE trials SET episodes = ?, epsilon = ?, mean_reward = ?, mean_score = ?, "
+                       "steps_per_sec = ?, updated = ? WHERE sweep = ? AND trial = ?",
+                       (done, manager.agent.epsilon, mean_reward, mean_score, steps / seconds, time.time(),
+                        sweep, trial))
+        if done < episodes and rung >= grace and losing(db, sweep, trial, rung, mean_reward, min_trials):
+            status = "stopped"
+            break
+
+    with db:
+        db.execute("UPDATE trials SET status = ?, updated = ? WHERE sweep = ? AND trial = ?",
+                   (status, time.time(), sweep, trial))
+    db.close()
+    return trial, status, done
+
+
+def run_sweep(db_path, sweep, params, episodes=50, rung_episodes=10, max_steps=1000, workers=None, seed=0,
+              grace=1, min_trials=3, directory=None):
+    """
+    Run every unfinished trial of a sweep on a process pool.
+    :param db_path: SQLite file with the trials and their results.
+    :param sweep: Sweep name; rerunning a sweep resumes it.
+    :param params: Parameter dicts, one per trial, used when the sweep is new.
+    :param episodes: Episodes per trial.
+    :param rung_episodes: Episodes between checkpoints and early stopping checks.
+    :param grace: Rungs a trial always plays before it can be stopped.
+    :param min_trials: Other trials needed at a rung before stopping against their median.
+    :param directory: Where the per-trial Q-tables go, defaults to sweeps/<sweep>.
+    """
+    directory = directory or os.path.join("sweeps", sweep)
+    os.makedirs(directory, exist_ok=True)
+    db = connect(db_path)
+    total = create_trials(db, sweep, params)
+    pending = db.execute("SELECT trial, params FROM trials WHERE sweep = ? AND status NOT IN ('done', 'stopped') "
+                         "ORDER BY trial", (sweep,)).fetchall()
+    db.close()
+    print(f"Sweep {sweep}: {total} trials, {len(pending)} to run.")
+
+    jobs = [(db_path, sweep, trial, json.loads(p), directory, episodes, rung_episodes, max_steps, seed, grace,
+             min_trials) for trial, p in pending]
+    with multiprocessing.Pool(workers or multiprocessing.cpu_count()) as pool:
+        for trial, status, done in pool.imap_unordered(run_trial, jobs):
+            print(f"Trial {trial} {status} after {done} episodes.")
+
+
+def report(db_path, sweep, top=10):
+    db = connect(db_path)
+    rows = db.execute("SELECT trial, status, episodes, mean_reward, mean_score, steps_per_sec, params FROM trials "
+                      "WHERE sweep = ? ORDER BY mean_reward IS NULL, mean_reward DESC LIMIT ?", (sweep, top)).fetchall()
+    db.close()
+    for trial, status, episodes, mean_reward, mean_score, steps_per_sec, params in rows:
+        print(f"{trial:5d} {status:8s} {episodes:5d} episodes  reward {mean_reward or 0:9.1f}  "
+              f"score {mean_score or 0:6.1f}  {steps_per_sec or 0:7.0f} steps/sec  {params}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hyperparameter sweep over QLearningAgent settings and reward weights.")
+    parser.add_argument("space", nargs="*", help="name=v1,v2,... or, with --random, name=low:high; names are "
+                                                 f"{AGENT_PARAMS} or keys of Manager.default_rewards")
+    parser.add_argument("--name", required=True, help="sweep name, rerun with the same name to resume")
+    parser.add_argument("--db", default="sweeps.db")
+    parser.add_argument("--random", type=int, default=None, help="sample this many trials instead of the full grid")
+    parser.add_argument("--episodes", type=int, default=50, help="episodes per trial")
+    parser.add_argument("--rung", type=int, default=10, help="episodes between checkpoints and early stopping checks")
+    parser.add_argument("--max-steps", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--grace", type=int, default=1, help="rungs played before a trial can be stopped")
+    parser.add_argument("--min-trials", type=int, default=3, help="trials needed at a rung to stop against their median")
+    parser.add_argument("--report", action="store_true", help="only print the best trials")
+    args = parser.parse_args()
+
+    if not args.report:
+        space = parse_space(args.space)
+        for name in space:
+            if name not in AGENT_PARAMS and name not in Manager.default_rewards:
+                parser.error(f"unknown parameter {name}")
+        params = list(sample(space, args.random, args.seed) if args.random else grid(space))
+        run_sweep(args.db, args.name, params, args.episodes, args.rung, args.max_steps, args.workers, args.seed,
+                  args.grace, args.min_trials)
+    report(args.db, args.name)
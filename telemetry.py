@@ -0,0 +1,177 @@
+import collections
+import json
+import os
+import queue
+import threading
+import time
+
+
+class MetricsLog(object):
+    """
+    Append-only JSONL metrics file written by a background thread. log()
+    only puts the record on a bounded queue, so the training loop never
+    waits for the disk; when the writer falls that far behind, records
+    are dropped and counted instead. The writer appends whatever is queued
+    in one write and flushes at least every `flush_seconds`.
+    :param path: JSONL file, appended to.
+    :param run: Name of this run, stored in every record so runs can share a file.
+    :param queue_size: Maximum number of records waiting to be written.
+    :param flush_seconds: Longest time a record waits in the file buffer.
+    """
+    def __init__(self, path, run=None, queue_size=10000, flush_seconds=1.0):
+        self.path = path
+        self.run = run or time.strftime("%Y%m%d-%H%M%S")
+        self.flush_seconds = flush_seconds
+        self.records = queue.Queue(queue_size)
+        self.written = 0
+        self.dropped = 0
+        self.error = None  # exception that stopped the writer
+        self.thread = threading.Thread(target=self._run, name="metrics", daemon=True)
+        self.thread.start()
+
+    def log(self, **fields):
+        fields["run"] = self.run
+        fields["time"] = time.time()
+        try:
+            self.records.put_nowait(fields)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        try:
+            with open(self.path, "a") as f:
+                last_flush = time.monotonic()
+                while True:
+                    try:
+                        items = [self.records.get(timeout=self.flush_seconds)]
+                    except queue.Empty:
+                        f.flush()
+                        last_flush = time.monotonic()
+                        continue
+                    while True:
+                        try:
+                            items.append(self.records.get_nowait())
+                        except queue.Empty:
+                            break
+                    stop = items[-1] is None
+                    items = [item for item in items if item is not None]
+                    f.write("".join(json.dumps(item) + "\n" for item in items))
+                    self.written += len(items)
+                    if stop:
+                        return
+                    # records keep coming, so the wait above never times out
+                    if time.monotonic() - last_flush >= self.flush_seconds:
+                        f.flush()
+                        last_flush = time.monotonic()
+        except OSError as e:
+            self.error = e
+            print(f"Metrics log failed: {e}")
+
+    def close(self):
+        """
+        Write what is queued and stop the writer.
+        """
+        self.records.put(None)
+        self.thread.join()
+
+
+def read(path, run=None):
+    """
+    Records of a metrics file, optionally only those of one run. A line
+    cut short by a crash ends the file.
+    """
+    records = []
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if run is None or record.get("run") == run:
+                records.append(record)
+    return records
+
+
+class Rolling(object):
+    """
+    Rolling means of the numeric fields of the last `window` episodes.
+    """
+    fields = ["reward", "score", "steps", "steps_per_sec", "epsilon", "q_table_size", "checkpoint_ms"]
+
+    def __init__(self, window=20):
+        self.values = {field: collections.deque(maxlen=window) for field in self.fields}
+
+    def add(self, record):
+        for field, values in self.values.items():
+            if record.get(field) is not None:
+                values.append(record[field])
+
+    def means(self):
+        return {field: sum(values) / len(values) for field, values in self.values.items() if values}
+
+
+def summary_line(record, means):
+    return (f"{record['run']} episode {record['episode']:6d}  "
+            f"reward {means.get('reward', 0):9.1f}  score {means.get('score', 0):6.1f}  "
+            f"steps {means.get('steps', 0):6.0f}  {means.get('steps_per_sec', 0):7.0f} steps/sec  "
+            f"epsilon {record.get('epsilon') or 0:.3f}  states {record.get('q_table_size') or 0}")
+
+
+def summarize(records, window=20):
+    """
+    Rolling means at the end of each run.
+    :return: {run: (last record, means)}.
+    """
+    runs = {}
+    for record in records:
+        entry = runs.get(record["run"])
+        if entry is None:
+            entry = runs[record["run"]] = [None, Rolling(window)]
+        entry[0] = record
+        entry[1].add(record)
+    return {run: (last, rolling.means()) for run, (last, rolling) in runs.items()}
+
+
+def follow(path, window=20, every=10, run=None, poll_seconds=1.0):
+    """
+    Print rolling means every `every` episodes as records are appended, like tail -f.
+    """
+    rolling = {}
+    with open(path, "rb") as f:
+        while True:
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                # nothing new, or a record still being written
+                f.seek(-len(line), os.SEEK_CUR)
+                time.sleep(poll_seconds)
+                continue
+            record = json.loads(line)
+            if run is not None and record.get("run") != run:
+                continue
+            means = rolling.setdefault(record["run"], Rolling(window))
+            means.add(record)
+            if record["episode"] % every == 0:
+                print(summary_line(record, means.means()))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize or follow a training metrics log.")
+    parser.add_argument("path", nargs="?", default="metrics.jsonl")
+    parser.add_argument("--window", type=int, default=20, help="episodes per rolling mean")
+    parser.add_argument("--run", default=None, help="only this run")
+    parser.add_argument("--follow", action="store_true", help="keep printing as episodes are appended")
+    parser.add_argument("--every", type=int, default=10, help="with --follow, print every this many episodes")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        parser.error(f"{args.path} does not exist")
+    if args.follow:
+        try:
+            follow(args.path, args.window, args.every, args.run)
+        except KeyboardInterrupt:
+            pass
+    else:
+        for run, (last, means) in summarize(read(args.path, args.run), args.window).items():
+            print(summary_line(last, means))
@@ -0,0 +1,34 @@
+import socket
+import threading
+
+from agent_server import ACT, STATE, AgentClient, AgentServer
+from play import QLearningAgent
+
+ACTIONS = ["UP", "DOWN", "LEFT", "RIGHT", "AVOID"]
+
+
+def test_server_survives_a_malformed_client(tmp_path):
+    agent = QLearningAgent(ACTIONS, epsilon=0.0, q_table_file=str(tmp_path / "q_table.pkl"), load=False)
+    agent.learn((1, 2, 3, 4), "RIGHT", 10.0, (1, 2, 3, 5), True)
+    server = AgentServer(agent, str(tmp_path / "agent.sock"))
+    server.start()
+    thread = threading.Thread(target=server.serve, kwargs={"seconds": 10}, daemon=True)
+    thread.start()
+    # fail instead of hanging if the server dies
+    socket.setdefaulttimeout(5)
+    try:
+        # a valid action request followed by garbage, in one packet
+        bad = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        bad.connect(server.path)
+        bad.sendall(ACT + STATE.pack(1, 2, 3, 4) + b"?")
+        assert bad.recv(16) == b""  # dropped without a reply
+        bad.close()
+
+        client = AgentClient(server.path)
+        assert client.choose_action((1, 2, 3, 4)) == "RIGHT"
+        client.close()
+    finally:
+        socket.setdefaulttimeout(None)
+        server.running = False
+        thread.join()
+        server.stop()
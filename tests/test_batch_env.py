@@ -0,0 +1,80 @@
+import numpy as np
+
+from batch_env import BatchEnv, train_batch
+from play import Manager, QLearningAgent
+
+ACTIONS = ["UP", "DOWN", "LEFT", "RIGHT", "AVOID"]
+
+
+def test_max_steps_truncates_without_terminating():
+    env = BatchEnv(4, seed=0, max_steps=150)
+    twin = BatchEnv(4, seed=0)  # same games, never cut
+    actions = np.array([ACTIONS.index(a) for a in ("UP", "LEFT", "RIGHT", "AVOID")])
+    for _ in range(149):
+        _, _, terminated, truncated = env.step(actions)
+        twin.step(actions)
+        assert not terminated.any() and not truncated.any()
+    states, _, terminated, truncated = env.step(actions)
+    twin_states, _, _, _ = twin.step(actions)
+    assert truncated.all() and not terminated.any()
+    assert env.episodes == 4
+    assert twin_states.any()
+    assert (env.final_states == twin_states).all()
+    assert (states == BatchEnv(4, seed=0).states()).all()
+
+
+def test_hits_terminate_and_are_never_truncated():
+    env = BatchEnv(64, seed=1, max_steps=300)
+    ended = 0
+    for _ in range(600):
+        _, _, terminated, truncated = env.step(np.full(64, ACTIONS.index("UP")))
+        assert not (terminated & truncated).any()
+        ended += terminated.sum()
+    assert ended > 0
+
+
+def test_rewards_use_the_given_weights():
+    weights = {key: 0 for key in Manager.default_rewards}
+    weights.update(safe_distance=40, bullet_safe=7, enemy_far=1000)
+    env = BatchEnv(64, seed=1, rewards=weights)
+    seen = set()
+    for _ in range(600):
+        _, rewards, _, _ = env.step(np.full(64, ACTIONS.index("UP")))
+        seen.update(rewards.tolist())
+    # only bullet_safe and enemy_far are not zero
+    assert seen <= {0, 7, 1000, 1007}
+    assert 1007 in seen
+    assert BatchEnv(1).rewards == Manager.default_rewards
+
+
+def test_hits_test_pixels_of_overlapping_rects():
+    env = BatchEnv(2, seed=0)
+    # game 0 over transparent corners, game 1 over the middle of the sprites
+    env.eb_alive[:, 0] = True
+    env.ebx[:, 0] = env.px + [0, 51]
+    env.eby[:, 0] = env.py + [0, 63]
+    env.e_alive[:, 0] = env.b_alive[:, 0] = True
+    env.ex[:, 0], env.ey[:, 0] = 200, 100
+    env.bx[:, 0] = [200, 226]
+    env.by[:, 0] = [100, 116]
+    _, done = env._rewards()
+    assert done.tolist() == [False, True]
+    assert env.e_alive[:, 0].tolist() == [True, False]
+    assert env.score.tolist() == [0, 10]
+
+
+class Recorder(QLearningAgent):
+    def __init__(self):
+        QLearningAgent.__init__(self, ACTIONS, load=False)
+        self.batches = []
+
+    def remember_batch(self, states, actions, rewards, next_states, dones):
+        self.batches.append((next_states.copy(), dones.copy()))
+
+
+def test_train_batch_learns_truncation_as_non_terminal():
+    agent = Recorder()
+    env = train_batch(agent, envs=8, steps=5, max_steps=5, seed=0)
+    next_states, dones = agent.batches[-1]
+    assert not dones.any()
+    assert (next_states == env.final_states).all()
@@ -0,0 +1,59 @@
+import os
+import random
+
+import pytest
+
+from checkpoint import Checkpointer, read_checkpoint
+from play import QLearningAgent
+
+ACTIONS = ["UP", "DOWN", "LEFT", "RIGHT", "AVOID"]
+
+
+def random_state(rng):
+    return tuple(rng.randrange(30) for _ in range(4))
+
+
+def train(agent, checkpointer, rng, episodes=10, steps=200):
+    for _ in range(episodes):
+        for _ in range(steps):
+            agent.learn(random_state(rng), rng.choice(ACTIONS), rng.random(), random_state(rng))
+        checkpointer.episode_done()
+
+
+@pytest.mark.parametrize("backend", ["dict", "array"])
+def test_evicted_states_leave_the_checkpoint(tmp_path, backend):
+    path = str(tmp_path / "q_table.pkl")
+    agent = QLearningAgent(ACTIONS, q_table_file=path, backend=backend, max_states=300, load=False)
+    checkpointer = Checkpointer(agent, every_episodes=1, compact_every=3)
+    train(agent, checkpointer, random.Random(0))
+    checkpointer.close()
+
+    reloaded = read_checkpoint(path)
+    assert len(reloaded) <= 300
+    assert reloaded == agent.q_table_dict()
+    assert agent.tracker.evicted > 0
+    assert os.path.exists(path + ".visits")
+
+
+def test_delta_log_replays_evictions(tmp_path):
+    path = str(tmp_path / "q_table.pkl")
+    agent = QLearningAgent(ACTIONS, q_table_file=path, max_states=300, load=False)
+    # never compacted, the evictions are only in the delta log
+    checkpointer = Checkpointer(agent, every_episodes=1, compact_every=1000)
+    train(agent, checkpointer, random.Random(1))
+    checkpointer.queue.join()
+
+    assert read_checkpoint(path) == agent.q_table
+    checkpointer.close()
+
+
+def test_reload_keeps_visit_counts(tmp_path):
+    path = str(tmp_path / "q_table.pkl")
+    agent = QLearningAgent(ACTIONS, q_table_file=path, track_states=True, load=False)
+    checkpointer = Checkpointer(agent)
+    train(agent, checkpointer, random.Random(2), episodes=2)
+    checkpointer.close()
+
+    reloaded = QLearningAgent(ACTIONS, q_table_file=path, track_states=True)
+    assert reloaded.tracker.tick == agent.tracker.tick
+    assert reloaded.tracker.visits == agent.tracker.visits
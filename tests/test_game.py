@@ -0,0 +1,59 @@
+import random
+
+import numpy as np
+
+from play import Manager, QLearningAgent
+
+ACTIONS = ["UP", "DOWN", "LEFT", "RIGHT", "AVOID"]
+
+
+class RewardLog(QLearningAgent):
+    # learns nothing, keeps the rewards it is handed
+    def __init__(self):
+        QLearningAgent.__init__(self, ACTIONS, load=False)
+        self.rewards = []
+
+    def remember(self, state, action, reward, next_state, done=False):
+        self.rewards.append(reward)
+
+
+def test_step_uses_the_manager_play_reward_weights():
+    random.seed(0)
+    np.random.seed(0)
+    manager = Manager(headless=True, load_q_table=False)
+    manager.play_rewards = {key: 0 for key in Manager.default_play_rewards}
+    manager.play_rewards.update(safe_distance=40, bullet_safe=7, enemy_far=1000)
+    manager.agent = RewardLog()
+    manager.restart()
+    for _ in range(1000):
+        manager.step(auto_restart=True)
+    # only bullet_safe and enemy_far are not zero
+    assert set(manager.agent.rewards) <= {0, 7, 1000, 1007}
+    assert 1007 in manager.agent.rewards
+
+
+def test_overlay_counts_collision_tests_per_frame():
+    random.seed(0)
+    np.random.seed(0)
+    manager = Manager(audio=False, load_q_table=False)
+    manager.agent = RewardLog()
+    ticks = []
+    step = manager.step
+
+    def counted_step(auto_restart=False):
+        step(auto_restart)
+        ticks.append(manager.enemy_grid.broad + manager.bullet_grid.broad)
+
+    manager.step = counted_step
+    manager.main(max_frames=150, fps=0, speed=4, auto_restart=True)
+    # four ticks per frame, all of them counted
+    assert manager.frame_tests["broad"] == sum(ticks[-4:]) > 0
+
+
+def test_episodes_without_steps(tmp_path):
+    manager = Manager(headless=True, load_q_table=False)
+    manager.agent = QLearningAgent(ACTIONS, load=False, q_table_file=str(tmp_path / "q_table.pkl"))
+    assert manager.run_episode(0) == (0, 0)
+    # the startup report has no first step yet
+    manager.train(episodes=1, max_steps=0)
+    assert manager.run_episode(3)[1] == 3
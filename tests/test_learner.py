@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+from learner import AsyncAgent
+from play import FrozenAgent, QLearningAgent
+
+ACTIONS = ["UP", "DOWN", "LEFT", "RIGHT", "AVOID"]
+
+
+class Broken(QLearningAgent):
+    def remember(self, state, action, reward, next_state, done=False):
+        raise KeyError(state)
+
+
+def test_learner_error_reaches_the_game():
+    agent = AsyncAgent(Broken(ACTIONS, load=False))
+    agent.start()
+    agent.remember((1, 2, 3, 4), "UP", 1.0, (1, 2, 3, 5))
+    deadline = time.monotonic() + 5
+    while agent.error is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    with pytest.raises(RuntimeError) as failure:
+        agent.choose_action((1, 2, 3, 4))
+    assert isinstance(failure.value.__cause__, KeyError)
+    with pytest.raises(RuntimeError):
+        agent.stop()
+
+
+@pytest.mark.parametrize("backend", ["dict", "array"])
+def test_learned_transitions_reach_the_policy(backend):
+    agent = AsyncAgent(QLearningAgent(ACTIONS, backend=backend, epsilon=0.0, load=False))
+    agent.start()
+    agent.remember((1, 2, 3, 4), "LEFT", 10.0, (1, 2, 3, 5), True)
+    agent.stop()
+    assert agent.policy[(1, 2, 3, 4)] == "LEFT"
+    assert agent.choose_action((1, 2, 3, 4)) == "LEFT"
+
+
+def test_agents_without_a_q_table_are_rejected():
+    policy = FrozenAgent.compile({}, ACTIONS)
+    with pytest.raises(ValueError):
+        AsyncAgent(policy)
+
+
+class Ends(QLearningAgent):
+    # logs remembered states and episode ends in the order the learner applies them
+    def __init__(self):
+        QLearningAgent.__init__(self, ACTIONS, load=False)
+        self.log = []
+
+    def remember(self, state, action, reward, next_state, done=False):
+        self.log.append(state)
+
+    def end_episode(self):
+        self.log.append("end")
+
+
+def test_end_episode_does_not_wait_for_a_full_queue():
+    agent = AsyncAgent(Ends(), queue_size=2)
+    agent.remember((1, 0, 0, 0), "UP", 0.0, (2, 0, 0, 0))
+    agent.remember((2, 0, 0, 0), "UP", 0.0, (3, 0, 0, 0))
+    # the learner is not running, so the queue stays full
+    ender = threading.Thread(target=agent.end_episode, daemon=True)
+    ender.start()
+    ender.join(1)
+    assert not ender.is_alive()
+    assert agent.episode_ended
+    agent.remember((9, 0, 0, 0), "UP", 0.0, (8, 0, 0, 0))  # no room for the end yet, dropped
+    assert agent.dropped == 1
+    agent.start()
+    agent.stop()
+    assert agent.agent.log == [(1, 0, 0, 0), (2, 0, 0, 0), "end"]
+    assert not agent.episode_ended
+
+
+@pytest.mark.parametrize("mode", ["n-step", "lambda"])
+@pytest.mark.parametrize("backend", ["dict", "array"])
+def test_policy_follows_updates_to_earlier_states(mode, backend):
+    agent = AsyncAgent(QLearningAgent(ACTIONS, backend=backend, epsilon=0.0, mode=mode, load=False))
+    # greedy steps, published, then a crash whose penalty reaches the states before it
+    agent.start()
+    for step in range(3):
+        agent.remember((step, 0, 0, 0), "UP", 0.0, (step + 1, 0, 0, 0))
+    agent.stop()
+    agent.start()
+    agent.remember((3, 0, 0, 0), "UP", -100.0, (4, 0, 0, 0), True)
+    agent.end_episode()
+    agent.stop()
+    for step in range(4):
+        state = (step, 0, 0, 0)
+        assert agent.policy[state] == agent._best(state)
+        # the steps that each update to the crash reaches
+        assert step == 0 or agent.policy[state] != "UP"
@@ -0,0 +1,67 @@
+import os
+import random
+
+import numpy as np
+
+from play import FrozenAgent, QLearningAgent
+from policy import FrozenPolicy, PolicyStore
+
+ACTIONS = ["UP", "DOWN", "LEFT", "RIGHT", "AVOID"]
+
+
+def trained_agent(backend="dict", seed=0):
+    rng = random.Random(seed)
+    agent = QLearningAgent(ACTIONS, epsilon=0.0, backend=backend, load=False)
+    pool = [tuple(rng.randrange(20) for _ in range(4)) for _ in range(300)]
+    for _ in range(5000):
+        agent.learn(rng.choice(pool), rng.choice(ACTIONS), rng.uniform(-1, 1), rng.choice(pool))
+    return agent, pool
+
+
+def test_frozen_policy_agrees_with_the_q_table(tmp_path):
+    agent, pool = trained_agent()
+    policy = FrozenPolicy.compile(agent.q_table, ACTIONS, fallback="AVOID")
+    path = str(tmp_path / "policy.bin")
+    policy.save(path)
+    loaded = FrozenPolicy.load(path)
+    for state in pool:
+        assert policy.choose_action(state) == agent.choose_action(state)
+        assert loaded.choose_action(state) == agent.choose_action(state)
+    assert loaded.states == len(agent.q_table)
+    assert loaded.choose_action((30, 30, 30, 30)) == "AVOID"  # never seen
+    assert loaded.choose_action((-1, 0, 0, 0)) == "AVOID"  # outside the bounds
+
+
+def test_array_and_dict_tables_compile_alike():
+    dict_agent, _ = trained_agent("dict")
+    array_agent, _ = trained_agent("array")
+    expected = FrozenPolicy.compile(dict_agent.q_table, ACTIONS)
+    actual = FrozenPolicy.compile(array_agent.q_table, ACTIONS)
+    assert np.array_equal(expected.table, actual.table)
+    assert expected.states == actual.states
+
+
+def test_store_swaps_in_published_generations(tmp_path):
+    path = str(tmp_path / "policy.store")
+    player = FrozenAgent.watch(path, ACTIONS)  # before anything is published
+    assert player.generation == 0
+    assert player.choose_action((1, 2, 3, 4)) == "AVOID"
+    assert not player.reload()
+
+    store = PolicyStore(path, writable=True)
+    for action in ("UP", "LEFT", "DOWN"):
+        store.publish(FrozenPolicy.compile({(1, 2, 3, 4): {a: float(a == action) for a in ACTIONS}}, ACTIONS))
+    old = store.load(2)
+    assert player.reload()
+    assert player.generation == 3
+    assert player.choose_action((1, 2, 3, 4)) == "DOWN"
+    assert not player.reload()
+
+    store.publish(FrozenPolicy.compile({}, ACTIONS, fallback="RIGHT"))
+    # only the newest generations stay on disk, a policy already mapped keeps working
+    assert not os.path.exists(store.file(2))
+    assert store.load(2) is None
+    assert old.choose_action((1, 2, 3, 4)) == "LEFT"
+    assert player.reload()
+    assert player.choose_action((1, 2, 3, 4)) == "RIGHT"
+    store.close()
@@ -0,0 +1,53 @@
+import random
+
+import numpy as np
+
+from play import QLearningAgent
+from qtable import ArrayQTable
+
+ACTIONS = ["UP", "DOWN", "LEFT", "RIGHT", "AVOID"]
+
+
+def transitions(seed, count=3000, states=200):
+    rng = random.Random(seed)
+    # a few states outside the bounds, which go to the overflow dict
+    pool = [tuple(rng.randrange(size) for size in ArrayQTable.bounds) for _ in range(states)] + [(60, 0, 0, 0)]
+    return [(rng.choice(pool), rng.choice(ACTIONS), rng.random(), rng.choice(pool), rng.random() < 0.05)
+            for _ in range(count)]
+
+
+def test_array_backend_learns_like_the_dict_backend():
+    agents = [QLearningAgent(ACTIONS, backend=backend, load=False) for backend in ("dict", "array")]
+    for transition in transitions(0):
+        for agent in agents:
+            agent.learn(*transition)
+    expected, actual = (agent.q_table_dict() for agent in agents)
+    assert expected.keys() == actual.keys()
+    for state, q in expected.items():
+        assert actual[state] == q
+
+
+def test_best_action_picks_the_first_of_equal_values():
+    table = ArrayQTable(ACTIONS)
+    assert table.best_action((1, 2, 3, 4)) is None
+    row = table.row((1, 2, 3, 4))
+    table.values[row] = [0.0, 2.0, 1.0, 2.0, 0.0]
+    assert table.best_action((1, 2, 3, 4)) == "DOWN"
+
+
+def test_rows_stay_right_after_remove_and_growth():
+    # a tiny cache and capacity, so lookups go through eviction of the cache, growth and rehashing
+    table = ArrayQTable(ACTIONS, capacity=4, cache_size=8)
+    states = [(i, i % 86, 0, i % 7) for i in range(49)] + [(-1, 0, 0, 0)]
+    for i, state in enumerate(states):
+        row = table.row(state)  # before indexing values, adding a row may replace the array
+        table.values[row] = i
+    table.remove(states[::3])
+    for i, state in enumerate(states):
+        if i % 3 == 0:
+            assert state not in table
+        else:
+            assert table.values[table.find(state)].tolist() == [float(i)] * len(ACTIONS)
+    assert len(table) == len(states) - len(states[::3])
+    rows = table.find_rows(np.array(states))
+    assert [row >= 0 for row in rows.tolist()] == [i % 3 != 0 for i in range(len(states))]
@@ -0,0 +1,22 @@
+import glob
+import random
+
+import numpy as np
+import pytest
+
+from play import Manager
+
+
+@pytest.mark.parametrize("scenario", [None, "scenarios/ramp.json"])
+def test_recorded_episodes_play_back_the_same(tmp_path, scenario):
+    random.seed(0)
+    np.random.seed(0)
+    manager = Manager(headless=True, load_q_table=False, record=str(tmp_path), scenario=scenario)
+    manager.restart()
+    while len(glob.glob(str(tmp_path / "*.rep"))) < 2:
+        manager.step(auto_restart=True)
+
+    for path in sorted(glob.glob(str(tmp_path / "*.rep"))):
+        result = manager.play_back(path)
+        assert result["matches"], result
+        assert result["ticks"] == result["recorded_ticks"] > 0
@@ -0,0 +1,21 @@
+import numpy as np
+
+from replay import ReplayBuffer
+
+
+def test_ring_buffer_keeps_the_newest_transitions():
+    buffer = ReplayBuffer(capacity=5)
+    for i in range(3):
+        buffer.push((i, 0, 0, 0), i, float(i), (i + 1, 0, 0, 0), i == 2)
+    n = 4
+    states = np.array([(10 + i, 0, 0, 0) for i in range(n)])
+    buffer.push_batch(states, np.arange(n) + 10, np.arange(n) + 10.0, states + 1, np.zeros(n, bool))
+    assert len(buffer) == 5
+    assert buffer.pushed == 7
+    assert sorted(buffer.actions.tolist()) == [2, 10, 11, 12, 13]
+
+    states, actions, rewards, next_states, dones = buffer.sample(100)
+    assert (states[:, 0] == actions).all()
+    assert (rewards == actions).all()
+    assert (next_states[:, 0] == actions + 1).all()
+    assert (dones == (actions == 2)).all()
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from scenario import DEFAULT_ENEMY, Scenario
+
+
+def test_default_scenario_spawns_every_second_from_the_first():
+    timeline = Scenario.default().compile(10)
+    spawns = [tick for tick in range(1000) if timeline.at(tick)]
+    assert spawns == [100, 200, 300, 400, 500, 600, 700, 800, 900]
+    assert timeline.at(100) == ((DEFAULT_ENEMY, None),)
+
+
+def test_waves_ramp_and_cycle_positions(tmp_path):
+    path = tmp_path / "ramp.json"
+    path.write_text(json.dumps({
+        "duration_ms": 1000,
+        "types": {"small": {"speed": 3}},
+        "waves": [{"type": "small", "start_ms": 0, "end_ms": 1000, "every_ms": 250, "burst": [1, 4],
+                   "x": [10, 20]}],
+    }))
+    timeline = Scenario.load(str(path)).compile(10)
+    bursts = [[x for _, x in timeline.at(tick)] for tick in (0, 25, 50, 75)]
+    # 1, 1.75, 2.5 and 3.25 enemies, rounded
+    assert bursts == [[10], [20, 10], [20, 10], [20, 10, 20]]
+    assert timeline.spawns() == 8
+    assert timeline.at(0)[0][0].speed == 3
+    # past the end it starts over from loop_from_ms, here 0
+    assert timeline.at(125) == timeline.at(25)
+
+
+def test_unknown_enemy_type_is_rejected(tmp_path):
+    path = tmp_path / "bad.json"
+    path.write_text(json.dumps({"types": {}, "waves": [{"type": "boss"}]}))
+    with pytest.raises(ValueError):
+        Scenario.load(str(path))
@@ -0,0 +1,60 @@
+import random
+
+import pygame
+
+import spatial
+
+
+class Box(pygame.sprite.Sprite):
+    def __init__(self, x, y, w=20, h=30):
+        pygame.sprite.Sprite.__init__(self)
+        self.rect = pygame.Rect(x, y, w, h)
+
+
+def boxes(seed, count=60):
+    rng = random.Random(seed)
+    return [Box(rng.randrange(-20, 480), rng.randrange(-20, 700), rng.randrange(5, 60), rng.randrange(5, 60))
+            for _ in range(count)]
+
+
+def test_grid_answers_like_a_scan_of_the_group():
+    sprites = boxes(0)
+    grid = spatial.SpatialGrid()
+    grid.rebuild(sprites)
+    rng = random.Random(1)
+    for _ in range(200):
+        x, y = rng.randrange(480), rng.randrange(700)
+        for edge in ("top", "bottom"):
+            assert grid.nearest_y(y, edge) is min(sprites, key=lambda s: abs(getattr(s.rect, edge) - y))
+        by_distance = sorted(sprites, key=lambda s: (s.rect.left - x) ** 2 + (s.rect.top - y) ** 2)
+        assert grid.k_nearest(x, y, 3) == by_distance[:3]
+        rect = pygame.Rect(x, y, 40, 40)
+        assert grid.collide(rect) == [s for s in sprites if rect.colliderect(s.rect)]
+
+
+def test_collide_kills_and_forgets_hits():
+    sprites = boxes(2)
+    group = pygame.sprite.Group(sprites)
+    grid = spatial.SpatialGrid()
+    grid.rebuild(sprites)
+    rect = pygame.Rect(100, 100, 200, 200)
+    hits = grid.collide(rect, dokill=True)
+    assert hits
+    assert not any(hit.alive() for hit in hits)
+    assert len(grid) == len(sprites) - len(hits) == len(group)
+    assert grid.collide(rect) == []
+
+
+def test_masks_reject_rects_that_only_touch_transparent_pixels():
+    # a one pixel dot in the corner of each square
+    surface = pygame.Surface((10, 10), pygame.SRCALPHA)
+    surface.set_at((0, 0), (255, 255, 255, 255))
+    mask = pygame.mask.from_surface(surface)
+    sprite = Box(5, 5, 10, 10)
+    sprite.mask = mask
+    grid = spatial.SpatialGrid()
+    grid.rebuild([sprite])
+    assert grid.collide(pygame.Rect(0, 0, 10, 10)) == [sprite]
+    assert grid.collide(pygame.Rect(0, 0, 10, 10), mask=mask) == []
+    assert grid.collide(pygame.Rect(5, 5, 10, 10), mask=mask) == [sprite]
+    assert grid.narrow == 2
@@ -0,0 +1,31 @@
+import time
+
+from telemetry import MetricsLog, Rolling, read, summarize
+
+
+def test_records_reach_the_file_under_steady_load(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    log = MetricsLog(path, run="steady", flush_seconds=0.05)
+    try:
+        # a record every 10 ms never leaves the writer idle for flush_seconds
+        for episode in range(1, 41):
+            log.log(episode=episode, reward=1.0)
+            time.sleep(0.01)
+        assert len(read(path)) > 0
+    finally:
+        log.close()
+    assert [record["episode"] for record in read(path)] == list(range(1, 41))
+
+
+def test_rolling_means_per_run(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    for run in ("a", "b"):
+        log = MetricsLog(path, run=run)
+        for episode, reward in enumerate([1.0, 2.0, 3.0, 4.0], 1):
+            log.log(episode=episode, reward=reward * (1 if run == "a" else 10), epsilon=None)
+        log.close()
+    runs = summarize(read(path), window=2)
+    assert runs["a"][1]["reward"] == 3.5
+    assert runs["b"][1]["reward"] == 35.0
+    assert read(path, "b")[0]["reward"] == 10.0
+    assert Rolling(2).means() == {}
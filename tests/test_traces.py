@@ -0,0 +1,65 @@
+import pytest
+
+from play import QLearningAgent
+from traces import EligibilityTraces, NStepBuffer
+
+ACTIONS = ["UP", "DOWN", "LEFT", "RIGHT", "AVOID"]
+START = (0, 0, 0, 0)
+
+
+def greedy(mode, **kwargs):
+    # every action ties at zero, so "UP" is always the greedy one and no trace is cut
+    return QLearningAgent(ACTIONS, epsilon=0.0, mode=mode, load=False, **kwargs)
+
+
+def test_live_traces_stay_under_the_cutoff_bound():
+    traces = EligibilityTraces(0.9, 0.8, 0.01)
+    for step in range(100):
+        traces.decay()
+        traces.visit((step, 0, 0, 0), "UP")
+        assert len(traces) <= 15
+    assert len(traces) == 15
+
+
+def test_n_step_return():
+    buffer = NStepBuffer(3, 0.5)
+    for reward in (1.0, 2.0, 4.0):
+        buffer.push(START, "UP", reward, START)
+    assert buffer.pop(8.0) == (START, "UP", 1.0 + 0.5 * 2.0 + 0.25 * 4.0 + 0.125 * 8.0)
+
+
+def play(agent, states, reward=1.0):
+    for state, next_state in zip(states, states[1:]):
+        agent.learn(state, "UP", reward, next_state)
+
+
+def test_lambda_traces_do_not_cross_a_truncated_episode():
+    agent = greedy("lambda")
+    # cut short on the state every new episode starts in
+    play(agent, [START, (1, 0, 0, 0), (2, 0, 0, 0), START])
+    agent.end_episode()
+    assert len(agent.traces) == 0
+    agent.learn(START, "UP", 0.0, (3, 0, 0, 0))
+    assert len(agent.traces) == 1
+
+
+@pytest.mark.parametrize("mode", ["n-step", "lambda"])
+def test_end_episode_leaves_nothing_behind(mode):
+    agent = greedy(mode, n_steps=3)
+    play(agent, [START, (1, 0, 0, 0), (2, 0, 0, 0), START])
+    agent.end_episode()
+    before = agent.q_table_dict()
+    agent.learn(START, "UP", 0.0, (3, 0, 0, 0), True)
+    changed = {state for state, q in agent.q_table_dict().items() if before.get(state) != q}
+    # only the new episode's state learned, with a zero reward nothing moves
+    assert changed <= {(3, 0, 0, 0)}
+
+
+def test_n_step_truncation_bootstraps_every_step():
+    agent = greedy("n-step", n_steps=5, learning_rate=1.0, discount_factor=0.5)
+    play(agent, [START, (1, 0, 0, 0), (2, 0, 0, 0)])
+    assert agent.q_table_dict().get(START, {}).get("UP", 0) == 0  # still owed
+    agent.end_episode()
+    q = agent.q_table_dict()
+    assert q[START]["UP"] == 1.0 + 0.5 * 1.0
+    assert q[(1, 0, 0, 0)]["UP"] == 1.0
@@ -0,0 +1,41 @@
+from play import QLearningAgent
+from visits import VisitTracker, compact
+
+
+def test_eviction_order():
+    tracker = VisitTracker(min_age=1)
+    for state in ["old", "rare", "often", "often", "often", "zero", "young"]:
+        tracker.visit(state)
+    states = ["rare", "often", "zero", "old", "young"]
+    peaks = [1.0, 1.0, 0.0, 1.0, 1.0]
+    # near-zero first, then least visited, of those the least recently visited, the last visit last
+    assert tracker.victims(states, peaks, 5) == ["zero", "old", "rare", "often", "young"]
+    assert tracker.victims(states, peaks, 2) == ["zero", "old"]
+
+
+def test_compact_drops_near_zero_states_and_caps_the_rest():
+    tracker = VisitTracker(min_age=0)
+    q_table = {}
+    for i in range(10):
+        q_table[(i,)] = {"UP": 0.0 if i < 3 else float(i)}
+        for _ in range(i):
+            tracker.visit((i,))
+    dropped = compact(q_table, tracker, max_states=4, prune_zero=True)
+    assert sorted(q_table) == [(6,), (7,), (8,), (9,)]
+    assert len(dropped) == 6
+    assert tracker.evicted == 6
+
+
+def test_hit_rate_counts_only_states_learned_from():
+    agent = QLearningAgent(["UP", "DOWN"], epsilon=0.0, track_states=True, load=False)
+    # like Player.update: learn the last step, then pick an action in the state it led to
+    state = (0,)
+    for lap in range(2):
+        for i in range(1, 101):
+            agent.remember(state, "UP", 1.0, (i,))
+            state = (i,)
+            agent.choose_action(state)
+        if lap == 0:
+            # every state was new when its action was picked
+            assert agent.stats()["hit_rate"] == 0.0
+    assert agent.stats()["hit_rate"] == 0.5
@@ -0,0 +1,75 @@
+import collections
+
+
+class NStepBuffer(object):
+    """
+    The last n (state, action, reward) steps of an episode, for n-step
+    Q-learning: once n steps are in, the oldest one is updated towards
+    r0 + g r1 + ... + g^(n-1) r(n-1) + g^n max Q(next state).
+    :param n: Number of rewards in a return.
+    :param gamma: Discount factor.
+    """
+    def __init__(self, n, gamma):
+        self.n = n
+        self.gamma = gamma
+        self.steps = collections.deque()
+        self.next_state = None  # next state of the newest step
+
+    def __len__(self):
+        return len(self.steps)
+
+    def push(self, state, action, reward, next_state):
+        self.steps.append((state, action, reward))
+        self.next_state = next_state
+
+    def pop(self, bootstrap):
+        """
+        Remove the oldest step.
+        :param bootstrap: max Q of the state after the newest step, 0 after a terminal one.
+        :return: (state, action, n-step return target) of the removed step.
+        """
+        target = bootstrap
+        for _, _, reward in reversed(self.steps):
+            target = reward + self.gamma * target
+        state, action, _ = self.steps.popleft()
+        return state, action, target
+
+    def clear(self):
+        self.steps.clear()
+        self.next_state = None
+
+
+class EligibilityTraces(object):
+    """
+    Replacing eligibility traces for Watkins Q(lambda), kept sparse:
+    {(state, action): trace}. Every step decays all traces by
+    gamma * lambda and drops the ones below `cutoff`. A trace is 1 when
+    set, so it is dropped after int(log(cutoff) / log(gamma * lambda)) + 1
+    steps and at most that many are alive, 15 with the agent's defaults:
+    each update touches a bounded number of entries.
+    :param gamma: Discount factor.
+    :param lam: Trace decay, lambda.
+    :param cutoff: Smallest trace kept.
+    """
+    def __init__(self, gamma, lam, cutoff=0.01):
+        self.decay_rate = gamma * lam
+        self.cutoff = cutoff
+        self.traces = {}
+        self.next_state = None  # next state of the last update
+
+    def __len__(self):
+        return len(self.traces)
+
+    def visit(self, state, action):
+        self.traces[(state, action)] = 1.0
+
+    def decay(self):
+        rate, cutoff = self.decay_rate, self.cutoff
+        self.traces = {key: trace * rate for key, trace in self.traces.items() if trace * rate >= cutoff}
+
+    def items(self):
+        return self.traces.items()
+
+    def clear(self):
+        self.traces = {}
+        self.next_state = None
@@ -0,0 +1,167 @@
+import os
+import pickle
+
+import numpy as np
+
+
+class VisitTracker(object):
+    """
+    Visit count and last-visit tick of every state a QLearningAgent learns
+    from, plus the hit rate of action lookups, which together let a Q-table
+    stay under a fixed number of states. A tick is one learned transition.
+
+    When the table grows past `max_states`, the agent evicts down to
+    `max_states * (1 - evict_fraction)` states in one pass, so the O(n)
+    selection runs once per `evict_fraction * max_states` new states.
+    States go in this order: near-zero ones (every |Q| at most
+    `tolerance`) before the others, least visited first, then least
+    recently visited. States visited in the last `min_age` ticks go last,
+    so new states get a chance to collect visits.
+    :param max_states: Maximum number of states in the Q-table, None for no limit.
+    :param evict_fraction: Fraction of `max_states` freed by one eviction pass.
+    :param tolerance: Largest |Q| of a near-zero state.
+    :param min_age: Ticks a state is protected after a visit.
+    """
+    def __init__(self, max_states=None, evict_fraction=0.1, tolerance=0.01, min_age=1000):
+        self.max_states = max_states
+        self.evict_fraction = evict_fraction
+        self.tolerance = tolerance
+        self.min_age = min_age
+        self.visits = {}  # state -> [visit count, last visit tick]
+        self.tick = 0
+        self.lookups = 0  # choose_action calls
+        self.hits = 0  # choose_action calls on a state learned from
+        self.evictions = 0  # eviction passes
+        self.evicted = 0  # states evicted
+
+    def visit(self, state):
+        self.tick += 1
+        entry = self.visits.get(state)
+        if entry is None:
+            self.visits[state] = [1, self.tick]
+        else:
+            entry[0] += 1
+            entry[1] = self.tick
+
+    def lookup(self, state):
+        """
+        Count one action lookup, a hit if the state was learned from. A
+        state the table only holds as the next state of a transition is a
+        miss, since its Q-values are still all zero.
+        """
+        self.lookups += 1
+        self.hits += state in self.visits
+
+    def over(self, size):
+        return self.max_states is not None and size > self.max_states
+
+    def target(self):
+        # table size after an eviction pass
+        return int(self.max_states * (1 - self.evict_fraction))
+
+    def victims(self, states, peaks, count):
+        """
+        The `count` states to evict first.
+        :param states: Stored states.
+        :param peaks: Largest |Q| of each state, same order.
+        """
+        if count <= 0:
+            return []
+        # states loaded without visit data count as never visited
+        entries = np.array([self.visits.get(state, (0, 0)) for state in states], np.int64).reshape(-1, 2)
+        counts, last = entries[:, 0], entries[:, 1]
+        young = last > self.tick - self.min_age
+        order = np.lexsort((last, counts, np.asarray(peaks) > self.tolerance, young))
+        return [states[i] for i in order[:count].tolist()]
+
+    def forget(self, states):
+        for state in states:
+            self.visits.pop(state, None)
+        self.evictions += 1
+        self.evicted += len(states)
+
+    def stats(self, size):
+        """
+        :param size: Current number of states in the Q-table.
+        """
+        return {
+            "states": size,
+            "max_states": self.max_states,
+            "tracked": len(self.visits),
+            "lookups": self.lookups,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "evictions": self.evictions,
+            "evicted": self.evicted,
+        }
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            pickle.dump({"tick": self.tick, "visits": self.visits}, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self, path):
+        """
+        Load the visits saved next to a Q-table, if there are any.
+        :return: True if a file was loaded.
+        """
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return False
+        self.tick = data["tick"]
+        self.visits = data["visits"]
+        return True
+
+
+def compact(q_table, tracker, max_states=None, prune_zero=False):
+    """
+    Shrink a Q-table in the dict-of-dicts format in place, using the same
+    order as eviction during training.
+    :param max_states: Keep at most this many states, None for no limit.
+    :param prune_zero: Also drop every near-zero state.
+    :return: The dropped states.
+    """
+    states = list(q_table)
+    peaks = np.array([max(map(abs, q.values()), default=0) for q in q_table.values()])
+    dropped = []
+    if prune_zero:
+        dropped = [state for state, peak in zip(states, peaks.tolist()) if peak <= tracker.tolerance]
+        for state in dropped:
+            del q_table[state]
+        kept = peaks > tracker.tolerance
+        states, peaks = [state for state, keep in zip(states, kept.tolist()) if keep], peaks[kept]
+    if max_states is not None:
+        victims = tracker.victims(states, peaks, len(states) - max_states)
+        for state in victims:
+            del q_table[state]
+        dropped += victims
+    tracker.forget(dropped)
+    return dropped
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from checkpoint import read_checkpoint, write_q_table
+
+    parser = argparse.ArgumentParser(description="Compact a Q-table offline, dropping rarely visited and "
+                                                 "near-zero states.")
+    parser.add_argument("q_table", nargs="?", default="q_table.pkl")
+    parser.add_argument("--output", default=None, help="where to write the result (default: in place)")
+    parser.add_argument("--max-states", type=int, default=None, help="keep at most this many states")
+    parser.add_argument("--prune-zero", action="store_true", help="drop every near-zero state")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="largest |Q| of a near-zero state")
+    parser.add_argument("--min-age", type=int, default=1000, help="ticks a recently visited state is protected")
+    args = parser.parse_args()
+
+    output = args.output or args.q_table
+    q_table = read_checkpoint(args.q_table)
+    tracker = VisitTracker(tolerance=args.tolerance, min_age=args.min_age)
+    if not tracker.load(args.q_table + ".visits"):
+        print("No visit file found, every state counts as never visited.")
+    size = len(q_table)
+    compact(q_table, tracker, args.max_states, args.prune_zero)
+    write_q_table(output, q_table)
+    tracker.save(output + ".visits")
+    print(f"Kept {len(q_table)} of {size} states in {output} "
+          f"({os.path.getsize(output) / 1024:.0f} KB).")